@@ -25,12 +25,102 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 
 import os
 import os.path
+import threading
 
 import utils
 import traceback
 import clogger
 import module_loader
 
+# one lite sync is kept per configuration (as its lite_sync attribute)
+# and shared by every save, so the managers it uses are built once
+# rather than on every save
+LITE_SYNC_LOCK = threading.Lock()
+
+# thread -> what the saves made in that thread since defer() left to do
+DEFERRED = {}
+DEFERRED_LOCK = threading.Lock()
+
+def get_lite_sync(config, logger=None):
+    """
+    The shared BootLiteSync of config, logging to logger (or to the
+    default log if None) for the rest of this thread's work.
+    """
+    LITE_SYNC_LOCK.acquire()
+    try:
+        lite_sync = getattr(config, "lite_sync", None)
+        if lite_sync is None:
+            lite_sync = BootLiteSync(config)
+            config.lite_sync = lite_sync
+    finally:
+        LITE_SYNC_LOCK.release()
+    lite_sync.logger.use(logger)
+    return lite_sync
+
+def defer():
+    """
+    Until the matching flush(), the saves made in this thread only note
+    what has to be regenerated, so that saving many objects (ex: in an
+    import) regenerates each of them, and the PXE menu, only once.
+    Calls may nest, the work is done when the outermost one ends.
+    """
+    DEFERRED_LOCK.acquire()
+    try:
+        thread = threading.currentThread()
+        if not DEFERRED.has_key(thread) or DEFERRED[thread]["depth"] == 0:
+            # (a save made while flushing defers anew)
+            DEFERRED[thread] = { "depth" : 0, "distro" : {}, "profile" : {},
+                "image" : {}, "system" : {}, "netboot" : {}, "menu" : False }
+        DEFERRED[thread]["depth"] = DEFERRED[thread]["depth"] + 1
+    finally:
+        DEFERRED_LOCK.release()
+
+def deferred():
+    """
+    What was left to do by the saves of this thread, None if they are
+    not being deferred.
+    """
+    pending = DEFERRED.get(threading.currentThread(), None)
+    if pending is None or pending["depth"] == 0:
+        # not deferred anymore, being flushed
+        return None
+    return pending
+
+class ThreadLogger:
+    """
+    Passes messages on to the logger last given to get_lite_sync by the
+    current thread, so that the shared lite sync, and the managers it
+    built, log to the logger of whoever is saving.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.local   = threading.local()
+
+    def use(self, logger):
+        self.local.logger = logger
+
+    def __getattr__(self, name):
+        logger = getattr(self.local, "logger", None)
+        if logger is None:
+            logger = self.default
+        return getattr(logger, name)
+
+def synced():
+    """
+    Called after a full sync, which regenerated everything the deferred
+    saves of this thread had left to do.
+    """
+    DEFERRED_LOCK.acquire()
+    try:
+        pending = deferred()
+        if pending is not None:
+            for what in [ "distro", "profile", "image", "system", "netboot" ]:
+                pending[what] = {}
+            pending["menu"] = False
+    finally:
+        DEFERRED_LOCK.release()
+
 class BootLiteSync:
     """
     Handles conversion of internal state to the tftpboot tree layout
@@ -50,14 +140,106 @@ class BootLiteSync:
         self.repos       = config.repos()
         if logger is None:
             logger = clogger.Logger()
-        self.logger      = logger
-        self.tftpd       = module_loader.get_module_from_file(
-                                "tftpd","module","in_tftpd"
-                                ).get_manager(config,logger)
-        self.sync        = config.api.get_sync(verbose,logger=self.logger)
-        self.sync.make_tftpboot()
-
-    def add_single_distro(self, name):
+        self.logger      = ThreadLogger(logger)
+
+    def __getattr__(self, name):
+        # the managers are only built when first needed, many saves (ex:
+        # of repos, or deferred ones) never get to use them
+        if name == "tftpd":
+            self.tftpd = module_loader.get_module_from_file(
+                            "tftpd","module","in_tftpd"
+                            ).get_manager(self.config,self.logger)
+            return self.tftpd
+        if name == "sync":
+            self.sync = self.config.api.get_sync(self.verbose,logger=self.logger)
+            self.sync.make_tftpboot()
+            return self.sync
+        raise AttributeError(name)
+
+    def flush(self):
+        """
+        Ends a defer() of this thread.  Once the outermost one ends, the
+        objects saved meanwhile are regenerated, the PXE menu last.
+        """
+        DEFERRED_LOCK.acquire()
+        try:
+            pending = deferred()
+            if pending is None:
+                return
+            pending["depth"] = pending["depth"] - 1
+            if pending["depth"] > 0:
+                return
+            # what this flush already did (see __first)
+            pending["flushed"] = {}
+        finally:
+            DEFERRED_LOCK.release()
+
+        try:
+            for name in pending["distro"].keys():
+                self.add_single_distro(name, rebuild_menu=False)
+            for name in pending["profile"].keys():
+                self.add_single_profile(name, rebuild_menu=False)
+            for name in pending["image"].keys():
+                self.add_single_image(name, rebuild_menu=False)
+            self.add_systems(pending["system"].keys())
+            for name in pending["netboot"].keys():
+                self.update_system_netboot_status(name)
+            if pending["menu"]:
+                self.sync.pxegen.make_pxe_menu()
+        finally:
+            DEFERRED_LOCK.acquire()
+            try:
+                DEFERRED.pop(threading.currentThread(), None)
+            finally:
+                DEFERRED_LOCK.release()
+
+    def __defer(self, what, name, rebuild_menu=False):
+        """
+        Notes the object for later if saves are deferred, returns False
+        if it has to be done now.
+        """
+        pending = deferred()
+        if pending is None:
+            return False
+        pending[what][name.lower()] = True
+        if rebuild_menu:
+            pending["menu"] = True
+        return True
+
+    def __forget(self, what, names):
+        """
+        Objects being removed need no regeneration anymore.
+        """
+        pending = deferred()
+        if pending is not None:
+            for name in names:
+                if pending[what].has_key(name.lower()):
+                    del pending[what][name.lower()]
+
+    def __first(self, what, name):
+        """
+        False if a flush in progress already did this object (ex: a
+        profile also done as the kid of a distro).
+        """
+        pending = DEFERRED.get(threading.currentThread(), None)
+        if pending is None or not pending.has_key("flushed"):
+            return True
+        flushed = pending["flushed"]
+        if flushed.has_key((what, name.lower())):
+            return False
+        flushed[(what, name.lower())] = True
+        return True
+
+    def __rebuild_menu(self):
+        pending = deferred()
+        if pending is not None:
+            pending["menu"] = True
+        else:
+            self.sync.pxegen.make_pxe_menu()
+
+    def add_single_distro(self, name, rebuild_menu=True):
+        if self.__defer("distro", name, rebuild_menu=True):
+            return
         # get the distro record
         distro = self.distros.find(name=name)
         if distro is None:
@@ -73,18 +255,23 @@ class BootLiteSync:
         kids = distro.get_children()
         for k in kids:
             self.add_single_profile(k.name, rebuild_menu=False)    
-        self.sync.pxegen.make_pxe_menu()
+        if rebuild_menu:
+            self.sync.pxegen.make_pxe_menu()
 
 
-    def add_single_image(self, name):
+    def add_single_image(self, name, rebuild_menu=True):
+        if self.__defer("image", name, rebuild_menu=True):
+            return
         image = self.images.find(name=name)
         self.sync.pxegen.copy_single_image_files(image)
         kids = image.get_children()
         for k in kids:
             self.add_single_system(k.name)
-        self.sync.pxegen.make_pxe_menu()
+        if rebuild_menu:
+            self.sync.pxegen.make_pxe_menu()
 
     def remove_single_distro(self, name):
+        self.__forget("distro", [ name ])
         bootloc = utils.tftpboot_location()
         # delete contents of images/$name directory in webdir
         utils.rmtree(os.path.join(self.settings.webdir, "images", name))
@@ -94,10 +281,15 @@ class BootLiteSync:
         utils.rmfile(os.path.join(self.settings.webdir, "links", name)) 
 
     def remove_single_image(self, name):
+        self.__forget("image", [ name ])
         bootloc = utils.tftpboot_location()
         utils.rmfile(os.path.join(bootloc, "images2", name))
 
     def add_single_profile(self, name, rebuild_menu=True):
+        if self.__defer("profile", name, rebuild_menu):
+            return True
+        if not self.__first("profile", name):
+            return True
         # get the profile object:
         profile = self.profiles.find(name=name)
         if profile is None:
@@ -119,31 +311,52 @@ class BootLiteSync:
             self.sync.pxegen.make_pxe_menu()
         return True
          
+    def add_profiles(self, names):
+        """
+        Same as add_single_profile for a list of profiles, rebuilding the
+        PXE menu once for all of them.
+        """
+        if len(names) == 0:
+            return
+        for name in names:
+            self.add_single_profile(name, rebuild_menu=False)
+        self.__rebuild_menu()
+
     def remove_single_profile(self, name, rebuild_menu=True):
+        self.__forget("profile", [ name ])
         # delete profiles/$name file in webdir
         utils.rmfile(os.path.join(self.settings.webdir, "profiles", name))
         # delete contents on kickstarts/$name directory in webdir
         utils.rmtree(os.path.join(self.settings.webdir, "kickstarts", name))
         if rebuild_menu:
-            self.sync.pxegen.make_pxe_menu()
+            self.__rebuild_menu()
    
     def update_system_netboot_status(self,name):
+        if self.__defer("netboot", name):
+            return
         self.tftpd.update_netboot(name)
  
     def add_single_system(self, name):
+        if self.__defer("system", name):
+            return
+        if not self.__first("system", name):
+            return
         # get the system object:
         system = self.systems.find(name=name)
         if system is None:
             return
         # rebuild system_list file in webdir
-        if self.settings.manage_dhcp:
-            self.sync.dhcp.regen_ethers() 
-        if self.settings.manage_dns:
-            self.sync.dns.regen_hosts()  
+        self.update_hosts([ name ])
         # write the PXE files for the system
         self.tftpd.add_single_system(system)
 
     def remove_single_system(self, name):
+        self.__forget("system", [ name ])
+        self.__forget("netboot", [ name ])
+        self.__remove_system_files(name)
+        self.update_hosts([ name ], removed=True)
+
+    def __remove_system_files(self, name):
         bootloc = utils.tftpboot_location()
         system_record = self.systems.find(name=name)
         # delete contents of kickstarts_sys/$name in webdir
@@ -165,3 +378,43 @@ class BootLiteSync:
             else:
                 utils.rmfile(os.path.join(bootloc, filename))
 
+    def add_systems(self, names):
+        """
+        Same as add_single_system for a list of systems, regenerating
+        the DHCP and DNS host lists once for all of them.
+        """
+        names = [ name for name in names if not self.__defer("system", name) and self.__first("system", name) ]
+        systems = [ self.systems.find(name=name) for name in names ]
+        systems = [ s for s in systems if s is not None ]
+        if len(systems) == 0:
+            return
+        self.update_hosts([ s.name for s in systems ])
+        for system in systems:
+            self.tftpd.add_single_system(system)
+
+    def remove_systems(self, names):
+        """
+        Same as remove_single_system for a list of systems.
+        """
+        self.__forget("system", names)
+        self.__forget("netboot", names)
+        for name in names:
+            self.__remove_system_files(name)
+        self.update_hosts(names, removed=True)
+
+    def update_hosts(self, names, removed=False):
+        """
+        Brings /etc/ethers and the DNS hosts file up to date for the named
+        systems.  Modules that can't update them in place regenerate them
+        in full, which a removal does not ask for.
+        """
+        if self.settings.manage_dhcp:
+            if hasattr(self.sync.dhcp, "update_ethers"):
+                self.sync.dhcp.update_ethers(names, removed)
+            elif not removed:
+                self.sync.dhcp.regen_ethers()
+        if self.settings.manage_dns:
+            if hasattr(self.sync.dns, "update_hosts"):
+                self.sync.dns.update_hosts(names, removed)
+            elif not removed:
+                self.sync.dns.regen_hosts()
@@ -37,6 +37,7 @@ import func_utils
 from cexceptions import *
 import templar
 import clogger
+import workerpool
 
 class PowerTool:
     """
@@ -148,3 +149,87 @@ class PowerTool:
             utils.die(self.logger, "Invalid power management type for this system (%s, %s)" % (self.system.power_type, self.system.name))
         return result
 
+
+class PowerExecutor:
+    """
+    Runs the power commands of many systems at once, in threads, since
+    most of the time goes into waiting on the fence agents.  At most
+    workers commands run together, and at most per_address of them for
+    the same power_address, so a chassis controller or power switch
+    shared by many systems is not flooded.
+    """
+
+    def __init__(self,config,api,workers=None,per_address=None,force_user=None,force_pass=None,logger=None):
+        self.config      = config
+        self.api         = api
+        self.settings    = config.settings()
+        if workers is None:
+            workers = self.settings.power_workers
+        if per_address is None:
+            per_address = self.settings.power_workers_per_address
+        self.workers     = max(1, int(workers))
+        self.per_address = max(1, int(per_address))
+        self.force_user  = force_user
+        self.force_pass  = force_pass
+        if logger is None:
+            logger = clogger.Logger()
+        self.logger      = logger
+
+    def run(self, systems, desired_state):
+        """
+        Runs desired_state ("on", "off", "reboot" or "status") on every
+        system.  Returns a list with, for each system in order, a hash
+        with its "name", whether it went "ok", the "result" of the power
+        command (True/False for status), the "error" if any and the
+        "seconds" it took.
+        """
+        pool = workerpool.ThreadPool(self.workers, self.per_address, self.logger)
+        return pool.map(lambda system: self.__power(system, desired_state), systems, key=self.__address)
+
+    def report(self, results):
+        """
+        Logs one line per system and the totals, returns the number of
+        systems that failed.
+        """
+        failed = 0
+        for r in results:
+            if r["ok"]:
+                self.logger.info("%s: %s (%.1fs)" % (r["name"], r["result"], r["seconds"]))
+            else:
+                failed = failed + 1
+                self.logger.error("%s: FAILED, %s (%.1fs)" % (r["name"], r["error"], r["seconds"]))
+        seconds = [ r["seconds"] for r in results ]
+        if len(seconds) > 0:
+            self.logger.info("%s systems, %s failed, longest %.1fs, average %.1fs" % (len(results), failed, max(seconds), sum(seconds) / len(seconds)))
+        return failed
+
+    def __address(self, system):
+        # systems without an address do not share anything
+        if system.power_address in [ None, "" ]:
+            return "<%s>" % system.name
+        return system.power_address
+
+    def __power(self, system, desired_state):
+        start = time.time()
+        result = { "name" : system.name, "ok" : True, "result" : "", "error" : "" }
+        try:
+            tool = PowerTool(self.config,system,self.api,self.force_user,self.force_pass,logger=self.logger)
+            if desired_state == "reboot":
+                tool.power("off")
+                time.sleep(5)
+                rc = tool.power("on")
+            else:
+                rc = tool.power(desired_state)
+            if desired_state == "status":
+                result["result"] = rc
+            else:
+                result["result"] = desired_state
+        except CX, e:
+            result["ok"] = False
+            result["error"] = e.value
+        except Exception, e:
+            utils.log_exc(self.logger)
+            result["ok"] = False
+            result["error"] = str(e)
+        result["seconds"] = time.time() - start
+        return result
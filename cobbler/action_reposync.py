@@ -38,6 +38,11 @@ import traceback
 import errno
 from utils import _
 import clogger
+import workerpool
+
+# kept next to the upstream metadata of each mirror, the fingerprint of
+# what was last mirrored successfully
+UPSTREAM_STAMP = "upstream_checksum"
 
 class RepoSync:
     """
@@ -46,7 +51,7 @@ class RepoSync:
 
     # ==================================================================================
 
-    def __init__(self,config,tries=1,nofail=False,logger=None):
+    def __init__(self,config,tries=1,nofail=False,logger=None,force=False):
         """
         Constructor
         """
@@ -61,6 +66,7 @@ class RepoSync:
         self.rflags    = self.settings.reposync_flags
         self.tries     = tries
         self.nofail    = nofail
+        self.force     = force
         self.logger    = logger
 
         if logger is None:
@@ -74,6 +80,8 @@ class RepoSync:
     def run(self, name=None, verbose=True):
         """
         Syncs the current repo configuration file with the filesystem.
+        Up to reposync_workers repos are synced at once, and at most
+        reposync_workers_per_host of them from the same mirror host.
         """
             
         self.logger.info("run, reposync, run!")
@@ -85,16 +93,8 @@ class RepoSync:
 
         self.verbose = verbose
 
-        report_failure = False
+        repos = []
         for repo in self.repos:
-
-            env = repo.environment
-
-            for k in env.keys():
-                self.logger.info("environment: %s=%s" % (k,env[k]))
-                if env[k] is not None:
-                    os.putenv(k,env[k])
-
             if name is not None and repo.name != name:
                 # invoked to sync only a specific repo, this is not the one
                 continue
@@ -102,40 +102,114 @@ class RepoSync:
                 # invoked to run against all repos, but this one is off
                 self.logger.info("%s is set to not be updated" % repo.name)
                 continue
+            repos.append(repo)
 
-            repo_mirror = os.path.join(self.settings.webdir, "repo_mirror")
-            repo_path = os.path.join(repo_mirror, repo.name)
-            mirror = repo.mirror
-
-            if not os.path.isdir(repo_path) and not repo.mirror.lower().startswith("rhn://"):
-                os.makedirs(repo_path)
-            
-            # which may actually NOT reposync if the repo is set to not mirror locally
-            # but that's a technicality
-
-            for x in range(self.tries+1,1,-1):
-                success = False
-                try:
-                    self.sync(repo) 
-                    success = True
-                except:
-                    utils.log_exc(self.logger)
-                    self.logger.warning("reposync failed, tries left: %s" % (x-2))
-
-            if not success:
-                report_failure = True
-                if not self.nofail:
-                    utils.die(self.logger,"reposync failed, retry limit reached, aborting")
-                else:
-                    self.logger.error("reposync failed, retry limit reached, skipping")
-
-            self.update_permissions(repo_path)
+        # set when a repo failed and nofail is off: the repos not started
+        # yet are skipped
+        self.abort = False
+        pool = workerpool.ThreadPool(self.settings.reposync_workers, self.settings.reposync_workers_per_host, self.logger)
+        results = pool.map(self.sync_one, repos, key=self.mirror_host)
+        report_failure = self.report(results)
 
+        if self.abort:
+            utils.die(self.logger,"reposync failed, retry limit reached, aborting")
         if report_failure:
             utils.die(self.logger,"overall reposync failed, at least one repo failed to synchronize")
 
         return True
 
+    def sync_one(self, repo):
+        """
+        Syncs one repo, trying up to self.tries times.  Returns its name,
+        "ok", "failed" or "skipped", the number of tries and the time taken.
+        """
+        if self.abort:
+            return (repo.name, "skipped", 0, 0)
+        start = time.time()
+
+        env = repo.environment
+        for k in env.keys():
+            self.logger.info("environment: %s=%s" % (k,env[k]))
+
+        repo_mirror = os.path.join(self.settings.webdir, "repo_mirror")
+        repo_path = os.path.join(repo_mirror, repo.name)
+        mirror = repo.mirror
+
+        if not os.path.isdir(repo_path) and not repo.mirror.lower().startswith("rhn://"):
+            os.makedirs(repo_path)
+        
+        # which may actually NOT reposync if the repo is set to not mirror locally
+        # but that's a technicality
+
+        success = False
+        tries = 0
+        for x in range(self.tries+1,1,-1):
+            tries = tries + 1
+            try:
+                self.sync(repo) 
+                success = True
+                break
+            except:
+                utils.log_exc(self.logger)
+                self.logger.warning("reposync of %s failed, tries left: %s" % (repo.name, x-2))
+
+        if not success:
+            if not self.nofail:
+                self.abort = True
+                self.logger.error("reposync of %s failed, retry limit reached, aborting" % repo.name)
+                return (repo.name, "failed", tries, time.time() - start)
+            else:
+                self.logger.error("reposync of %s failed, retry limit reached, skipping" % repo.name)
+
+        self.update_permissions(repo_path)
+        if success:
+            return (repo.name, "ok", tries, time.time() - start)
+        return (repo.name, "failed", tries, time.time() - start)
+
+    def report(self, results):
+        """
+        Logs the outcome of every repo, returns True if any failed.
+        """
+        failed = False
+        for (name, status, tries, seconds) in results:
+            self.logger.info("reposync %s: %s (%s tries, %.1fs)" % (name, status, tries, seconds))
+            if status != "ok":
+                failed = True
+        self.logger.info("reposync: %s repos, %s ok, %s failed, %s skipped" % (len(results),
+            len([ x for x in results if x[1] == "ok" ]),
+            len([ x for x in results if x[1] == "failed" ]),
+            len([ x for x in results if x[1] == "skipped" ])))
+        return failed
+
+    def environment(self, repo):
+        """
+        The environment the commands mirroring a repo run with: the one of
+        cobbler plus the repo's own environment variables (ex: proxies),
+        which used to be set in the cobbler process and leak into the
+        syncs of the following repos.
+        """
+        env = os.environ.copy()
+        for (k, v) in repo.environment.iteritems():
+            if v is not None:
+                env[k] = str(v)
+        return env
+
+    def mirror_host(self, repo):
+        """
+        The host a repo is mirrored from, repos of the same host are
+        limited to reposync_workers_per_host at once.
+        """
+        mirror = repo.mirror
+        if repo.breed == "rhn" or mirror.lower().startswith("rhn://"):
+            return "rhn"
+        idx = mirror.find("://")
+        if idx != -1:
+            return mirror[idx+3:].split("/",1)[0].split("@")[-1]
+        if mirror.startswith("/"):
+            return "localhost"
+        # rsync over ssh, [user@]host:path
+        return mirror.split(":",1)[0].split("@")[-1]
+
     # ==================================================================================
 
     def sync(self, repo):
@@ -166,6 +240,9 @@ class RepoSync:
 
             # add any repo metadata we can use
             mdoptions = []
+            if os.path.isfile("%s/repodata/repomd.xml" % (dirname)):
+                # only index the packages that changed since the last run
+                mdoptions.append("--update")
             if os.path.isfile("%s/.origin/repomd.xml" % (dirname)):
                 if not HAS_YUM:
                    utils.die(self.logger,"yum is required to use this feature")
@@ -178,7 +255,7 @@ class RepoSync:
                     # need createrepo >= 0.9.7 to add deltas
                     if utils.check_dist() == "redhat" or utils.check_dist() == "suse":
                         cmd = "/usr/bin/rpmquery --queryformat=%{VERSION} createrepo"
-                        createrepo_ver = utils.subprocess_get(self.logger, cmd)
+                        createrepo_ver = utils.subprocess_get(self.logger, cmd, env=self.environment(repo))
                         if createrepo_ver >= "0.9.7":
                             mdoptions.append("--deltas")
                         else:
@@ -189,7 +266,7 @@ class RepoSync:
             try:
                 # BOOKMARK
                 cmd = "createrepo %s %s %s" % (" ".join(mdoptions), flags, dirname)
-                utils.subprocess_call(self.logger, cmd)
+                utils.subprocess_call(self.logger, cmd, env=self.environment(repo))
             except:
                 utils.log_exc(self.logger)
                 self.logger.error("createrepo failed.")
@@ -222,7 +299,7 @@ class RepoSync:
 
         # FIXME: wrapper for subprocess that logs to logger
         cmd = "rsync -rltDv %s --delete --exclude-from=/etc/cobbler/rsync.exclude %s %s" % (spacer, repo.mirror, dest_path)
-        rc = utils.subprocess_call(self.logger, cmd)
+        rc = utils.subprocess_call(self.logger, cmd, env=self.environment(repo))
 
         if rc !=0:
             utils.die(self.logger,"cobbler reposync failed")
@@ -290,7 +367,7 @@ class RepoSync:
         # commands here.  Any failure at any point stops the operation.
 
         if repo.mirror_locally:
-            rc = utils.subprocess_call(self.logger, cmd)
+            rc = utils.subprocess_call(self.logger, cmd, env=self.environment(repo))
             # Don't die if reposync fails, it is logged
             # if rc !=0:
             #     utils.die(self.logger,"cobbler reposync failed")
@@ -346,6 +423,22 @@ class RepoSync:
         if repo.mirror_locally:
             temp_file = self.create_local_file(temp_path, repo, output=False)
 
+        if not os.path.exists("/usr/bin/wget"):
+            utils.die(self.logger,"no /usr/bin/wget found, please install wget")
+
+        # grab repomd.xml first, if it did not change since the last sync
+        # there is nothing new to mirror or index
+        cmd2 = "/usr/bin/wget -q %s/repodata/repomd.xml -O %s/repomd.xml" % (repo_mirror, temp_path)
+        fetched = utils.subprocess_call(self.logger, cmd2, env=self.environment(repo))
+        signature = None
+        if fetched == 0:
+            signature = self.upstream_signature(repo, "%s/repomd.xml" % (temp_path))
+        if repo.mirror_locally and self.upstream_unchanged(dest_path, signature) \
+                and os.path.isfile(os.path.join(dest_path, "repodata", "repomd.xml")):
+            self.logger.info("%s is unchanged upstream, skipping" % repo.name)
+            self.create_local_file(dest_path, repo)
+            return
+
         if not has_rpm_list and repo.mirror_locally:
             # if we have not requested only certain RPMs, use reposync
             cmd = "/usr/bin/reposync %s --config=%s --repoid=%s --download_path=%s" % (self.rflags, temp_file, repo.name, self.settings.webdir+"/repo_mirror")
@@ -378,19 +471,15 @@ class RepoSync:
         # commands here.  Any failure at any point stops the operation.
 
         if repo.mirror_locally:
-            rc = utils.subprocess_call(self.logger, cmd)
+            self.forget_upstream(dest_path)
+            rc = utils.subprocess_call(self.logger, cmd, env=self.environment(repo))
             if rc !=0:
                 utils.die(self.logger,"cobbler reposync failed")
 
         repodata_path = os.path.join(dest_path, "repodata")
 
-        if not os.path.exists("/usr/bin/wget"):
-            utils.die(self.logger,"no /usr/bin/wget found, please install wget")
-
-        # grab repomd.xml and use it to download any metadata we can use
-        cmd2 = "/usr/bin/wget -q %s/repodata/repomd.xml -O %s/repomd.xml" % (repo_mirror, temp_path)
-        rc = utils.subprocess_call(self.logger,cmd2)
-        if rc == 0:
+        # use repomd.xml to download any extra metadata we can use
+        if fetched == 0:
             # create our repodata directory now, as any extra metadata we're
             # about to download probably lives there
             if not os.path.isdir(repodata_path):
@@ -401,8 +490,7 @@ class RepoSync:
                 if mdtype not in ["primary", "primary_db", "filelists", "filelists_db", "other", "other_db"]:
                     mdfile = rmd.getData(mdtype).location[1]
                     cmd3 = "/usr/bin/wget -q %s/%s -O %s/%s" % (repo_mirror, mdfile, dest_path, mdfile)
-                    utils.subprocess_call(self.logger,cmd3)
-                    if rc !=0:
+                    if utils.subprocess_call(self.logger, cmd3, env=self.environment(repo)) != 0:
                         utils.die(self.logger,"wget failed")
 
         # now run createrepo to rebuild the index
@@ -414,6 +502,9 @@ class RepoSync:
 
         self.create_local_file(dest_path, repo)
 
+        if repo.mirror_locally:
+            self.record_upstream(dest_path, signature)
+
     # ====================================================================================
  
 
@@ -470,6 +561,21 @@ class RepoSync:
                     rflags += " %s %s" % ( x , repo.yumopts[x] ) 
                 else:
                     rflags += " %s" % x 
+            # the Release file lists the checksums of all the indexes, if
+            # it did not change since the last sync neither did the suite
+            signature = None
+            if os.path.exists("/usr/bin/wget"):
+                temp_path = os.path.join(dest_path, ".origin")
+                if not os.path.isdir(temp_path):
+                    os.makedirs(temp_path)
+                cmd2 = "/usr/bin/wget -q %s/Release -O %s/Release" % (repo.mirror.replace("@@suite@@",repo.os_version), temp_path)
+                if utils.subprocess_call(self.logger, cmd2, env=self.environment(repo)) == 0:
+                    signature = self.upstream_signature(repo, "%s/Release" % (temp_path))
+            if self.upstream_unchanged(dest_path, signature):
+                self.logger.info("%s is unchanged upstream, skipping" % repo.name)
+                return
+            self.forget_upstream(dest_path)
+
             cmd = "%s %s %s %s" % (mirror_program, rflags, mirror_data, dest_path)
             if repo.arch == "src":
                 cmd = "%s --source" % cmd
@@ -481,11 +587,69 @@ class RepoSync:
                    arch = "amd64" # FIX potential arch errors
                 cmd = "%s --nosource -a %s" % (cmd, arch)
                     
-            rc = utils.subprocess_call(self.logger, cmd)
+            rc = utils.subprocess_call(self.logger, cmd, env=self.environment(repo))
             if rc !=0:
                 utils.die(self.logger,"cobbler reposync failed")
+            self.record_upstream(dest_path, signature)
+
+    # ====================================================================================
+
+    def upstream_signature(self, repo, path):
+        """
+        Fingerprint of the upstream metadata fetched to path (repomd.xml,
+        or Release for apt repos) and of the repo settings that change
+        what gets mirrored, None if it could not be read.
+        """
+        try:
+            fd = open(path)
+            data = fd.read()
+            fd.close()
+        except IOError:
+            return None
+        blended = utils.blender(self.api, False, repo)
+        return utils.md5("\n".join([ data, repo.mirror, str(repo.arch),
+            repr(repo.rpm_list), repr(repo.yumopts),
+            str(blended.get("createrepo_flags","")), self.rflags ])).hexdigest()
+
+    def upstream_unchanged(self, dest_path, signature):
+        """
+        True if the last successful sync of the repo mirrored in dest_path
+        was from the same upstream metadata, unless --force was given.
+        """
+        if self.force or signature is None:
+            return False
+        try:
+            fd = open(os.path.join(dest_path, ".origin", UPSTREAM_STAMP))
+            recorded = fd.read().strip()
+            fd.close()
+        except IOError:
+            return False
+        return recorded == signature
+
+    def record_upstream(self, dest_path, signature):
+        """
+        Remembers what upstream looked like once a sync completed.
+        """
+        if signature is None:
+            return
+        fname = os.path.join(dest_path, ".origin", UPSTREAM_STAMP)
+        fd = open(fname + ".tmp", "w")
+        fd.write("%s\n" % signature)
+        fd.close()
+        os.rename(fname + ".tmp", fname)
+
+    def forget_upstream(self, dest_path):
+        """
+        Called before mirroring, so a sync that fails half way is
+        retried in full next time.
+        """
+        try:
+            os.unlink(os.path.join(dest_path, ".origin", UPSTREAM_STAMP))
+        except OSError:
+            pass
+
+    # ==================================================================================
 
-       
     def create_local_file(self, dest_path, repo, output=True):
         """
 
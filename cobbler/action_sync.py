@@ -35,6 +35,7 @@ import utils
 from cexceptions import *
 import templar 
 import pxegen
+import sync_manifest
 import item_distro
 import item_profile
 import item_repo
@@ -86,10 +87,15 @@ class BootSync:
 
 
 
-    def run(self):
+    def run(self, incremental=None):
         """
         Syncs the current configuration file with the config tree.
         Using the Check().run_ functions previously is recommended
+
+        If incremental is set (it defaults to the incremental_sync
+        setting) the trees are not cleaned first, generated files are
+        only rewritten when their contents change and only the files a
+        previous sync generated, but this one did not, are removed.
         """
         if not os.path.exists(self.bootloc):
             utils.die(self.logger,"cannot find directory: %s" % self.bootloc)
@@ -105,13 +111,56 @@ class BootSync:
         self.settings = self.config.settings()
         self.repos    = self.config.repos()
 
-        # execute the core of the sync operation
-        self.logger.info("cleaning trees")
-        self.clean_trees()
+        if incremental is None:
+            incremental = self.settings.incremental_sync
+
+        # every sync records what it generated, so that a later
+        # incremental sync knows what is up to date and what is stale
+        manifest = sync_manifest.SyncManifest(self.manifest_roots(), logger=self.logger)
+        if incremental and manifest.exists():
+            self.logger.info("incremental sync, not cleaning trees")
+            self.make_tftpboot()
+        else:
+            # execute the core of the sync operation
+            self.logger.info("cleaning trees")
+            self.clean_trees()
+            manifest.forget()
+
+        self.set_manifest(manifest)
+        try:
+            self.run_generators()
+        finally:
+            self.set_manifest(None)
+
+        self.logger.info("removing stale files")
+        manifest.remove_orphans()
+        manifest.save()
+        self.logger.info("sync: %s" % manifest.report())
+
+        # run post-triggers
+        self.logger.info("running post-sync triggers")
+        utils.run_triggers(self.api, None, "/var/lib/cobbler/triggers/sync/post/*", logger=self.logger)
+        utils.run_triggers(self.api, None, "/var/lib/cobbler/triggers/change/*", logger=self.logger)
+
+        cache = utils.get_blender_cache()
+        if cache is not None:
+            self.logger.info("blender cache: %(hits)s hits, %(misses)s misses, %(size)s entries" % cache.stats())
+
+        return True
+
+    def run_generators(self):
+        """
+        Write out the tftpboot, webdir, DHCP, DNS, TFTPD and rsync files.
+        """
+
+        self.timings = []
+        start = time.time()
 
         # Have the tftpd module handle copying bootloaders,
         # distros, images, and all_system_files
         self.tftpd.sync(self.verbose)
+        start = self.phase_done("tftpboot", start)
+
         # Copy distros to the webdir
         # Adding in the exception handling to not blow up if files have
         # been moved (or the path references an NFS directory that's no longer
@@ -123,18 +172,22 @@ class BootSync:
                                                      self.settings.webdir,True)
             except CX, e:
                 self.logger.error(e.value)
+        start = self.phase_done("webdir", start)
 
         # make the default pxe menu anyway...
         self.pxegen.make_pxe_menu()
+        start = self.phase_done("menus", start)
 
         if self.settings.manage_dhcp:
             self.logger.info("rendering DHCP files")
             self.dhcp.write_dhcp_file()
             self.dhcp.regen_ethers()
+            start = self.phase_done("dhcp", start)
         if self.settings.manage_dns:
             self.logger.info("rendering DNS files")
             self.dns.regen_hosts()
             self.dns.write_dns_files()
+            start = self.phase_done("dns", start)
 
         if self.settings.manage_tftpd:
            # xinetd.d/tftpd, basically
@@ -142,20 +195,43 @@ class BootSync:
            self.tftpd.write_tftpd_files()
            # copy in boot_files
            self.tftpd.write_boot_files()
+           start = self.phase_done("tftpd", start)
 
         self.logger.info("cleaning link caches")
         self.clean_link_cache()
+        start = self.phase_done("link cache", start)
 
         if self.settings.manage_rsync:
            self.logger.info("rendering Rsync files")
            self.rsync_gen()
+           start = self.phase_done("rsync", start)
 
-        # run post-triggers
-        self.logger.info("running post-sync triggers")
-        utils.run_triggers(self.api, None, "/var/lib/cobbler/triggers/sync/post/*", logger=self.logger)
-        utils.run_triggers(self.api, None, "/var/lib/cobbler/triggers/change/*", logger=self.logger)
+        report = ", ".join([ "%s %.2fs" % (name, seconds) for (name, seconds) in self.timings ])
+        self.logger.info("sync phase timings (%s workers): %s" % (self.settings.sync_workers, report))
 
-        return True
+    def phase_done(self, name, start):
+        """
+        Record how long a phase of the sync took, returns the start
+        time of the next one.
+        """
+        now = time.time()
+        self.timings.append((name, now - start))
+        return now
+
+    def manifest_roots(self):
+        """
+        The directories whose generated contents are tracked by the sync
+        manifest, these are the ones clean_trees() empties.
+        """
+        return [ self.pxelinux_dir, self.grub_dir, self.images_dir, self.s390_dir,
+                 self.yaboot_bin_dir, self.yaboot_cfg_dir, self.rendered_dir,
+                 os.path.join(self.settings.webdir, "images") ]
+
+    def set_manifest(self, manifest):
+        self.pxegen.set_manifest(manifest)
+        tftpd_pxegen = getattr(self.tftpd, "pxegen", None)
+        if tftpd_pxegen is not None:
+            tftpd_pxegen.set_manifest(manifest)
 
     def make_tftpboot(self):
         """
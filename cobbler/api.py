@@ -39,6 +39,7 @@ import action_power
 import action_log
 import action_hardlink
 import action_dlcontent
+import action_litesync
 from cexceptions import *
 try:
     import subprocess as sub_process
@@ -46,6 +47,8 @@ except:
     import sub_process
 import module_loader
 import kickgen
+import template_api
+import changelog
 import yumgen
 import pxegen
 from utils import _
@@ -233,6 +236,23 @@ class BootAPI:
 
     # ==========================================================
 
+    def get_cache_stats(self):
+        """
+        Returns a dict of the in-memory caches (merged object data,
+        compiled templates, rendered kickstarts) and their size and
+        hit/miss counters.
+        """
+        stats = {
+            "templates"  : template_api.COMPILE_CACHE.stats(),
+            "kickstarts" : self.kickgen.cache_stats(),
+        }
+        blender_cache = utils.get_blender_cache(self)
+        if blender_cache is not None:
+            stats["blender"] = blender_cache.stats()
+        return stats
+
+    # ==========================================================
+
     def clear(self):
         """
         Forget about current list of profiles, distros, and systems
@@ -386,6 +406,13 @@ class BootAPI:
     def remove_file(self, ref, recursive=False, delete=True, with_triggers=True, logger=None):
         return self.remove_item("file", ref, recursive=recursive, delete=delete, with_triggers=with_triggers, logger=logger)
 
+    def remove_systems(self, names, delete=True, with_triggers=True, logger=None):
+        """
+        Remove a list of systems in one go, see Systems.remove_batch.
+        """
+        self.log("remove_systems", names)
+        return self._config.systems().remove_batch(names, with_delete=delete, with_triggers=with_triggers, logger=logger)
+
     # ==========================================================================
 
     def rename_item(self, what, ref, newname, logger=None):
@@ -482,6 +509,13 @@ class BootAPI:
     def add_file(self, ref, check_for_duplicate_names=False,save=True, logger=None):
         return self.add_item("file", ref, check_for_duplicate_names=check_for_duplicate_names, save=save,logger=logger)
 
+    def add_items(self, what, refs, check_for_duplicate_names=False, check_for_duplicate_netinfo=False, logger=None):
+        """
+        Save a list of objects in one go, see Collection.add_batch.
+        """
+        self.log("add_items(%s)"%what, [ x.name for x in refs if x is not None ])
+        return self.get_items(what).add_batch(refs,check_for_duplicate_names=check_for_duplicate_names,check_for_duplicate_netinfo=check_for_duplicate_netinfo,logger=logger)
+
     # ==========================================================================
 
     # FIXME: find_items should take all the arguments the other find
@@ -541,6 +575,17 @@ class BootAPI:
                   results2.append(x.to_datastruct())
         return results2
 
+    def get_changes_since(self,revision):
+        """
+        Returns the objects saved or deleted since a revision, see
+        changelog.py.  A hash with the current "revision", whether the
+        list is "complete", and the "changes", a list of hashes with the
+        revision, type, name and op ("save" or "delete") of the last
+        change of each object.  If not complete, some deletions are
+        missing and callers should reload everything.
+        """
+        return changelog.CHANGE_LOG.changes_since(int(revision))
+
     def get_distros_since(self,mtime,collapse=False):
         """
         Returns distros modified since a certain time (in seconds since Epoch)
@@ -690,16 +735,37 @@ class BootAPI:
 
     # ==========================================================================
 
-    def sync(self,verbose=False, logger=None):
+    def sync(self,verbose=False, logger=None, incremental=None):
         """
         Take the values currently written to the configuration files in
         /etc, and /var, and build out the information tree found in
         /tftpboot.  Any operations done in the API that have not been
         saved with serialize() will NOT be synchronized with this command.
+        incremental overrides the incremental_sync setting.
         """
         self.log("sync")
         sync = self.get_sync(verbose=verbose, logger=logger)
-        return sync.run()
+        rc = sync.run(incremental=incremental)
+        # saves deferred so far need no lite sync anymore
+        action_litesync.synced()
+        return rc
+
+    # ==========================================================================
+
+    def defer_lite_sync(self):
+        """
+        Until end_lite_sync, the objects saved by this thread are not
+        written out to the tftpboot and web trees one by one, but all
+        at once when end_lite_sync is called (calls may nest).  Use
+        around many saves, ex: an import.
+        """
+        action_litesync.defer()
+
+    def end_lite_sync(self, logger=None):
+        """
+        Writes out what was saved since the matching defer_lite_sync.
+        """
+        action_litesync.get_lite_sync(self._config, logger).flush()
 
     # ==========================================================================
 
@@ -724,13 +790,15 @@ class BootAPI:
 
     # ==========================================================================
 
-    def reposync(self, name=None, tries=1, nofail=False, logger=None):
+    def reposync(self, name=None, tries=1, nofail=False, logger=None, force=False):
         """
         Take the contents of /var/lib/cobbler/repos and update them --
-        or create the initial copy if no contents exist yet.
+        or create the initial copy if no contents exist yet.  Repos whose
+        upstream metadata did not change since their last sync are
+        skipped, unless force is set.
         """
         self.log("reposync",[name])
-        reposync = action_reposync.RepoSync(self._config, tries=tries, nofail=nofail, logger=logger)
+        reposync = action_reposync.RepoSync(self._config, tries=tries, nofail=nofail, logger=logger, force=force)
         return reposync.run(name)
 
     # ==========================================================================
@@ -757,7 +825,11 @@ class BootAPI:
                 (found,pkgdir) = manager.check_for_signature(mirror_url,breed)
                 if found: 
                     self.log("running import manager: %s" % manager.what())
-                    return manager.run(pkgdir,mirror_url,mirror_name,network_root,kickstart_file,rsync_flags,arch,breed,os_version)
+                    self.defer_lite_sync()
+                    try:
+                        return manager.run(pkgdir,mirror_url,mirror_name,network_root,kickstart_file,rsync_flags,arch,breed,os_version)
+                    finally:
+                        self.end_lite_sync(logger)
             #except:
             #    self.log("an error occured while running the import manager")
             #    continue
@@ -877,7 +949,9 @@ class BootAPI:
         Pull down data/configs from a remote cobbler server that is a master to this server.
         """
         replicator = action_replicate.Replicate(self._config, logger=logger)
-        return replicator.run(
+        self.defer_lite_sync()
+        try:
+            return replicator.run(
               cobbler_master       = cobbler_master,
               distro_patterns      = distro_patterns,
               profile_patterns     = profile_patterns,
@@ -890,7 +964,9 @@ class BootAPI:
               prune                = prune,
               omit_data            = omit_data,
               sync_all             = sync_all
-        )
+            )
+        finally:
+            self.end_lite_sync(logger)
 
     # ==========================================================================
 
@@ -938,6 +1014,18 @@ class BootAPI:
         """
         return action_power.PowerTool(self._config, system, self, user, password, logger = logger).power("status")
 
+    def power_systems(self, systems, power, user=None, password=None, logger=None):
+        """
+        Runs power ("on", "off", "reboot" or "status") on a list of systems
+        concurrently, see settings power_workers and power_workers_per_address.
+        Returns the result of each system, see PowerExecutor.run.  The
+        results and timings are also written to the logger.
+        """
+        executor = action_power.PowerExecutor(self._config, self, force_user=user, force_pass=password, logger=logger)
+        results = executor.run(systems, power)
+        executor.report(results)
+        return results
+
 
     # ==========================================================================
 
@@ -0,0 +1,222 @@
+"""
+Append-only log of the changes made to cobbler objects, so that clients
+(replicas, tftpd, web UIs) can ask for what changed since the revision
+they last saw instead of comparing every object.
+
+Each save or delete of an object gets the next revision number, which
+is also stored in the object ("revision" field), and a line
+[ revision, type, name, op ] in /var/lib/cobbler/changes.log, op being
+"save" or "delete".  When the log grows, it is compacted down to the
+last change of each object.  Deletions are dropped then, clients that
+last looked before the newest dropped deletion are told their list of
+changes is not complete and should reload everything.
+
+Copyright 2006-2009, Red Hat, Inc
+Michael DeHaan <mdehaan@redhat.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+02110-1301  USA
+"""
+
+import os
+import bisect
+import fcntl
+import threading
+import simplejson
+
+LOG_FILE  = "/var/lib/cobbler/changes.log"
+LOCK_FILE = "/var/lib/cobbler/changes.lock"
+
+# compact once the log holds this many entries (and twice as many as
+# were left by the last compaction)
+COMPACT_SIZE = 10000
+
+class ChangeLog:
+
+    def __init__(self, log_file=LOG_FILE, lock_file=LOCK_FILE, compact_size=COMPACT_SIZE):
+        self.log_file     = log_file
+        self.lock_file    = lock_file
+        self.compact_size = compact_size
+        self.lock         = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget what was read from the log file.
+        """
+        self.stamp     = None  # inode of the file as last read
+        self.offset    = 0
+        self.floor     = 0
+        self.revision  = 0
+        self.entries   = []
+        self.revs      = []    # revision of each entry, for bisect
+        self.compacted = 0
+
+    def refresh(self):
+        """
+        Read the entries other processes appended since the last call,
+        or the whole file if it has been replaced (compacted).
+        """
+        self.lock.acquire()
+        try:
+            try:
+                st = os.stat(self.log_file)
+            except OSError:
+                self.reset()
+                return
+            if self.stamp != st.st_ino or st.st_size < self.offset:
+                self.reset()
+            if st.st_size == self.offset:
+                return
+            fd = open(self.log_file)
+            fd.seek(self.offset)
+            data = fd.read()
+            fd.close()
+            # a line is only complete once its newline is written
+            end = data.rfind("\n") + 1
+            for line in data[:end].split("\n"):
+                if line.strip() == "":
+                    continue
+                try:
+                    record = simplejson.loads(line)
+                except ValueError:
+                    continue
+                if type(record) == dict:
+                    # header written by compact()
+                    self.floor     = record.get("floor", 0)
+                    self.revision  = max(self.revision, record.get("revision", 0))
+                    self.compacted = record.get("entries", 0)
+                else:
+                    self.entries.append(record)
+                    self.revs.append(record[0])
+                    self.revision = max(self.revision, record[0])
+            self.offset = self.offset + end
+            self.stamp  = st.st_ino
+        finally:
+            self.lock.release()
+
+    def current_revision(self):
+        """
+        The revision of the last change logged, by any process.
+        """
+        self.lock.acquire()
+        try:
+            self.refresh()
+            return self.revision
+        finally:
+            self.lock.release()
+
+    def record(self, collection_type, name, op, func):
+        """
+        Give the next revision to a change and log it.  func(revision)
+        does the actual save or delete, and is run while other processes
+        are kept from logging changes, so revisions are logged in order.
+        Returns what func returns.
+        """
+        self.lock.acquire()
+        lock_fd = open(self.lock_file, "a")
+        try:
+            fcntl.flock(lock_fd.fileno(), fcntl.LOCK_EX)
+            self.refresh()
+            revision = self.revision + 1
+            rc = func(revision)
+            fd = open(self.log_file, "a")
+            fd.write(simplejson.dumps([ revision, collection_type, name, op ]) + "\n")
+            fd.close()
+            self.refresh()
+            if len(self.entries) > max(self.compact_size, 2 * self.compacted):
+                self.compact()
+            return rc
+        finally:
+            lock_fd.close()
+            self.lock.release()
+
+    def record_batch(self, collection_type, names, op, func):
+        """
+        Same as record() for a list of changes of one kind, taken under
+        a single lock and appended in one write.  func(revisions) gets
+        the list of revisions, one per name.
+        """
+        if len(names) == 0:
+            return func([])
+        self.lock.acquire()
+        lock_fd = open(self.lock_file, "a")
+        try:
+            fcntl.flock(lock_fd.fileno(), fcntl.LOCK_EX)
+            self.refresh()
+            revisions = range(self.revision + 1, self.revision + 1 + len(names))
+            rc = func(revisions)
+            lines = [ simplejson.dumps([ revisions[k], collection_type, names[k], op ]) + "\n" for k in range(0, len(names)) ]
+            fd = open(self.log_file, "a")
+            fd.write("".join(lines))
+            fd.close()
+            self.refresh()
+            if len(self.entries) > max(self.compact_size, 2 * self.compacted):
+                self.compact()
+            return rc
+        finally:
+            lock_fd.close()
+            self.lock.release()
+
+    def compact(self):
+        """
+        Rewrite the log with only the last change of each object that
+        still exists.  Must be called from record().
+        """
+        latest = {}
+        for entry in self.entries:
+            latest[(entry[1], entry[2].lower())] = entry
+        floor = self.floor
+        kept = []
+        for entry in latest.values():
+            if entry[3] == "delete":
+                floor = max(floor, entry[0])
+            else:
+                kept.append(entry)
+        kept.sort()
+
+        tmp = "%s.tmp" % self.log_file
+        fd = open(tmp, "w")
+        fd.write(simplejson.dumps({ "floor" : floor, "revision" : self.revision, "entries" : len(kept) }) + "\n")
+        for entry in kept:
+            fd.write(simplejson.dumps(entry) + "\n")
+        fd.close()
+        os.rename(tmp, self.log_file)
+        self.reset()
+        self.refresh()
+
+    def changes_since(self, revision):
+        """
+        Returns the current revision, whether the changes are complete
+        (False if deletions made after revision were compacted away), and
+        the last change of each object changed after revision, in order.
+        """
+        self.lock.acquire()
+        try:
+            self.refresh()
+            latest = {}
+            for entry in self.entries[bisect.bisect_right(self.revs, revision):]:
+                latest[(entry[1], entry[2].lower())] = entry
+            changes = latest.values()
+            changes.sort()
+            return {
+                "revision" : self.revision,
+                "complete" : revision >= self.floor,
+                "changes"  : [ { "revision" : e[0], "type" : e[1], "name" : e[2], "op" : e[3] } for e in changes ],
+            }
+        finally:
+            self.lock.release()
+
+CHANGE_LOG = ChangeLog()
@@ -404,6 +404,7 @@ class BootCLI:
             self.parser.add_option("--only",           dest="only",             help="update only this repository name")
             self.parser.add_option("--tries",          dest="tries",            help="try each repo this many times", default=1)
             self.parser.add_option("--no-fail",        dest="nofail",           help="don't stop reposyncing if a failure occurs", action="store_true")
+            self.parser.add_option("--force",          dest="force",            help="sync even if upstream has not changed", action="store_true")
             (options, args) = self.parser.parse_args()
             task_id = self.start_task("reposync",options)
         elif action_name == "aclsetup":
@@ -423,8 +424,9 @@ class BootCLI:
                 print "No configuration problems found.  All systems go."
                 
         elif action_name == "sync":
-            (options, args) = self.parser.parse_args()
             self.parser.add_option("--verbose", dest="verbose", action="store_true", help="run sync with more output")
+            self.parser.add_option("--incremental", dest="incremental", action="store_true", help="only rewrite changed files, do not clean the trees first")
+            (options, args) = self.parser.parse_args()
             task_id = self.start_task("sync",options)
         elif action_name == "report":
             (options, args) = self.parser.parse_args()
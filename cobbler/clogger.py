@@ -73,8 +73,9 @@ class Logger:
          msg = "%s - %s | %s" % (time.asctime(), level, msg)
 
       if self.logfile is not None:
-         self.logfile.write(msg)
-         self.logfile.write("\n")
+         # a single write, so lines logged from several threads
+         # (ex: batch power management) do not get mixed
+         self.logfile.write(msg + "\n")
          self.logfile.flush()
       else:
          print(msg)
@@ -24,6 +24,7 @@ import sys
 import socket
 import time
 import os
+import signal
 import SimpleXMLRPCServer
 import glob
 from utils import _
@@ -35,6 +36,7 @@ import api as cobbler_api
 import yaml # Howell Clark version
 import utils
 import remote
+import changelog
 
 
 def main():
@@ -114,11 +116,100 @@ def log(logger,msg):
 
 def do_xmlrpc_rw(bootapi,settings,port):
 
+    if int(settings.xmlrpc_workers) > 0:
+        return do_xmlrpc_prefork(bootapi, settings, port, int(settings.xmlrpc_workers))
+
     xinterface = remote.ProxiedXMLRPCInterface(bootapi,remote.CobblerXMLRPCInterface)
-    server = remote.CobblerXMLRPCServer(('127.0.0.1', port))
+    server = make_xmlrpc_server(settings, port)
     server.logRequests = 0  # don't print stuff
     xinterface.logger.debug("XMLRPC running on %s" % port)
     server.register_instance(xinterface)
+    serve_xmlrpc(server)
+
+def do_xmlrpc_prefork(bootapi,settings,port,workers):
+    """
+    Serve the XMLRPC port from workers read-only processes, and pass
+    everything else to a writer process on xmlrpc_writer_port (see
+    remote.READ_METHODS).  This process only restarts the others when
+    they die, and stops them when it is told to stop.
+    """
+
+    writer_port = settings.xmlrpc_writer_port
+    loaded_mtime = bootapi.last_modified_time()
+    loaded_revision = changelog.CHANGE_LOG.current_revision()
+
+    # bind both ports here, so that any problem shows up at startup
+    server = make_xmlrpc_server(settings, port)
+    server.logRequests = 0
+    writer = make_xmlrpc_server(settings, writer_port)
+    writer.logRequests = 0
+
+    children = {}
+
+    def spawn(role):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                if role == "writer":
+                    server.server_close()
+                    if bootapi.last_modified_time() != loaded_mtime:
+                        # restarted after changes were made
+                        bootapi.clear()
+                        bootapi.deserialize()
+                    writer.register_instance(remote.ProxiedXMLRPCInterface(bootapi,remote.CobblerXMLRPCInterface))
+                    serve_xmlrpc(writer)
+                else:
+                    writer.server_close()
+                    server.register_instance(remote.ReadOnlyXMLRPCInterface(bootapi,remote.CobblerXMLRPCInterface,
+                        "http://127.0.0.1:%s" % writer_port, loaded_mtime, loaded_revision))
+                    serve_xmlrpc(server)
+            finally:
+                os._exit(1)
+        children[pid] = role
+
+    def stop(signum, frame):
+        for pid in children.keys():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    spawn("writer")
+    for i in range(0, workers):
+        spawn("reader")
+    bootapi.logger.debug("XMLRPC running on %s with %s workers, writer on %s" % (port, workers, writer_port))
+
+    while True:
+        try:
+            (pid, status) = os.wait()
+        except OSError:
+            # interrupted, or no children left
+            time.sleep(0.5)
+            continue
+        role = children.pop(pid, None)
+        if role is None:
+            continue
+        bootapi.logger.warning("XMLRPC %s process %s exited (%s), restarting it" % (role, pid, status))
+        time.sleep(1)
+        spawn(role)
+
+def make_xmlrpc_server(settings,port):
+    """
+    A server with a pool of xmlrpc_threads threads, or one thread per
+    connection if that is 0.
+    """
+    threads = int(settings.xmlrpc_threads)
+    if threads > 0:
+        return remote.PooledXMLRPCServer(('127.0.0.1', port), threads, int(settings.xmlrpc_queue_size))
+    return remote.CobblerXMLRPCServer(('127.0.0.1', port))
+
+def serve_xmlrpc(server):
 
     while True:
         try:
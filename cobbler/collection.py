@@ -27,6 +27,12 @@ import glob
 import time
 import random
 import os
+import bisect
+import threading
+
+import lrucache
+import weakref
+import workerpool
 
 import action_litesync
 import item_system
@@ -39,16 +45,231 @@ import item_package
 import item_file
 from utils import _
 
+# every live collection, see after_fork()
+COLLECTIONS = weakref.WeakKeyDictionary()
+
+def after_fork():
+    """
+    Called in sync worker processes: the lock of a collection may have
+    been held by another thread of the parent when it forked.
+    """
+    for collection in COLLECTIONS.keys():
+        collection.lock = threading.RLock()
+
+workerpool.after_fork(after_fork)
+
+# index fields that systems keep once per interface
+INTERFACE_INDEX_FIELDS = [ "mac_address", "ip_address", "dns_name" ]
+
+def index_values_from_datastruct(seed_data, field):
+    """
+    Same as Item.get_index_values, but for serialized data, so objects
+    that have not been built yet can be indexed.
+    """
+    if seed_data.has_key("interfaces") and field in INTERFACE_INDEX_FIELDS:
+        values = [intf.get(field, "") for intf in seed_data["interfaces"].values()]
+    else:
+        values = [seed_data.get(field, "")]
+    return [v for v in values if isinstance(v, basestring) and v != ""]
+
+class LazyListing:
+    """
+    Stands in for Collection.listing when a collection is loaded lazily.
+    Every name (and its mtime) is known from the start, but objects are
+    only built from the serializer when first asked for, and are kept in
+    an LRU.  Objects with changes that have not been saved (their dirty
+    flag, see Item.__setattr__) are not evicted, so edits made in place
+    are never lost.
+    """
+
+    def __init__(self, collection, cache_size):
+        self.collection = collection
+        self.headers    = {}
+        self.cache      = lrucache.LRUCache(cache_size, evict_check=self.__is_clean)
+
+    def add_header(self, name, mtime):
+        self.headers[name.lower()] = { "name" : name, "mtime" : mtime }
+
+    def __is_clean(self, key, obj):
+        return not obj.dirty
+
+    def mark_clean(self, key):
+        """
+        Record the object as matching what is in storage, so it can be
+        evicted as long as it is not changed again.
+        """
+        obj = self.cache.peek(key)
+        if obj is not None:
+            obj.dirty = False
+
+    def peek(self, key, default=None):
+        """
+        Return the object only if it is already loaded.
+        """
+        return self.cache.peek(key, default)
+
+    def get(self, key, default=None):
+        obj = self.cache.get(key)
+        if obj is not None:
+            return obj
+        header = self.headers.get(key, None)
+        if header is None:
+            return default
+        config = self.collection.config
+        seed_data = config.deserialize_item_raw(self.collection.collection_type(), header["name"])
+        if seed_data is None:
+            return default
+        obj = self.collection.factory_produce(config, seed_data)
+        self.cache.set(key, obj)
+        self.mark_clean(key)
+        return obj
+
+    def __getitem__(self, key):
+        obj = self.get(key)
+        if obj is None:
+            raise KeyError(key)
+        return obj
+
+    def __setitem__(self, key, obj):
+        self.headers[key] = { "name" : obj.name, "mtime" : obj.mtime }
+        self.cache.set(key, obj)
+
+    def __delitem__(self, key):
+        del self.headers[key]
+        self.cache.pop(key)
+
+    def has_key(self, key):
+        return self.headers.has_key(key)
+
+    __contains__ = has_key
+
+    def keys(self):
+        return self.headers.keys()
+
+    def __len__(self):
+        return len(self.headers)
+
+    def iteritems(self):
+        for key in self.headers.keys():
+            obj = self.get(key)
+            if obj is not None:
+                yield (key, obj)
+
+    def itervalues(self):
+        for (key, obj) in self.iteritems():
+            yield obj
+
+    def values(self):
+        return [obj for obj in self.itervalues()]
+
+# sorted views kept per collection, the least recently used ones are
+# dropped (and rebuilt if asked for again)
+MAX_SORTED_VIEWS = 8
+
+# the fields of the objects of each collection type, a sorted view can
+# only be kept for one of these
+ITEM_FIELDS = {
+    "distro"    : item_distro.FIELDS,
+    "profile"   : item_profile.FIELDS,
+    "system"    : item_system.FIELDS,
+    "repo"      : item_repo.FIELDS,
+    "image"     : item_image.FIELDS,
+    "mgmtclass" : item_mgmtclass.FIELDS,
+    "package"   : item_package.FIELDS,
+    "file"      : item_file.FIELDS,
+}
+
+class SortedView:
+    """
+    The names of a collection's objects in the order of one field, then
+    name, as find_items_paged sorts them.  Built once and then kept up to
+    date by the collection as objects are added, edited and removed, so
+    reading a page of a sorted listing does not sort the whole collection.
+    """
+
+    def __init__(self, field):
+        self.field   = field
+        self.entries = []  # sorted (value, name) tuples
+        self.keys    = {}  # lowercased name -> its entry
+
+    def build(self, objs):
+        self.entries = []
+        self.keys    = {}
+        for obj in objs:
+            entry = self.__entry(obj)
+            self.entries.append(entry)
+            self.keys[obj.name.lower()] = entry
+        self.entries.sort()
+
+    def __entry(self, obj):
+        if self.field == "name":
+            return (obj.name, obj.name)
+        return (obj.sort_key([self.field])[0], obj.name)
+
+    def update(self, obj):
+        key = obj.name.lower()
+        self.discard(key)
+        entry = self.__entry(obj)
+        bisect.insort(self.entries, entry)
+        self.keys[key] = entry
+
+    def discard(self, name):
+        entry = self.keys.pop(name.lower(), None)
+        if entry is None:
+            return
+        i = bisect.bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self, start=0, end=None, reverse=False):
+        """
+        Names from position start to end, in descending order if reverse.
+        """
+        n = len(self.entries)
+        if end is None or end > n:
+            end = n
+        if reverse:
+            entries = self.entries[n-end:n-start]
+            entries.reverse()
+        else:
+            entries = self.entries[start:end]
+        return [ name for (value, name) in entries ]
+
+    def sorted_names(self, names, reverse=False):
+        """
+        The given names in the order of the view, sorting just these.
+        """
+        entries = []
+        for name in names:
+            entry = self.keys.get(name.lower(), None)
+            if entry is not None:
+                entries.append(entry)
+        entries.sort()
+        if reverse:
+            entries.reverse()
+        return [ name for (value, name) in entries ]
+
 class Collection:
 
+    # fields kept in hash indexes so find() can answer exact lookups
+    # without walking (and datastructing) every object in the collection.
+    # subclasses list the fields worth indexing.
+    INDEXED_FIELDS = []
+
     def __init__(self,config):
         """
         Constructor.
         """
         self.config = config
+        # guards the indexes and sorted views, which are read by XMLRPC
+        # threads while objects are added and removed
+        self.lock = threading.RLock()
         self.clear()
         self.api = self.config.api
-        self.lite_sync = None
+        COLLECTIONS[self] = True
 
     def factory_produce(self,config,seed_data):
         """
@@ -61,13 +282,219 @@ class Collection:
         """
         Forget about objects in the collection.
         """
-        self.listing = {}
+        self.lock.acquire()
+        try:
+            self.listing = {}
+            self.lazy = False
+            self.indexes = {}
+            self.indexed = {}
+            self.views = lrucache.LRUCache(MAX_SORTED_VIEWS)
+            for field in self.INDEXED_FIELDS:
+                self.indexes[field] = {}
+        finally:
+            self.lock.release()
+
+    def lazy_load(self, cache_size):
+        """
+        Replace the contents of the collection with just the names and
+        index entries of the stored objects, read as headers so that the
+        full records are not loaded.  The objects themselves are built on
+        first access, at most cache_size are kept in memory.
+        """
+        self.clear()
+        self.listing = LazyListing(self, cache_size)
+        self.lazy = True
+        datastruct = self.config.deserialize_headers(self.collection_type(), self.INDEXED_FIELDS)
+        if datastruct is None:
+            return True
+        for seed_data in datastruct:
+            name = seed_data["name"]
+            self.listing.add_header(name, seed_data.get("mtime", 0))
+            self.__index(name, lambda field: index_values_from_datastruct(seed_data, field))
+        return True
+
+    def holds(self, ref):
+        """
+        Is ref the very object held by the collection under its name?
+        Never loads anything in lazy mode.
+        """
+        if ref.name is None or ref.name == "":
+            return False
+        if self.lazy:
+            return self.listing.peek(ref.name.lower()) is ref
+        return self.listing.get(ref.name.lower(), None) is ref
 
     def get(self, name):
         """
         Return object with name in the collection
         """
         return self.listing.get(name.lower(), None)
+
+    def index_item(self, ref):
+        """
+        (Re)compute the index entries for an object held in the collection.
+        Entries recorded for the same name are dropped first, so this is
+        safe to call again after the object is edited in place.
+        """
+        self.lock.acquire()
+        try:
+            self.__index(ref.name, ref.get_index_values)
+            for view in self.views.values():
+                view.update(ref)
+        finally:
+            self.lock.release()
+
+    def __index(self, name, get_values):
+        name = name.lower()
+        self.unindex_item(name)
+        if len(self.INDEXED_FIELDS) == 0:
+            return
+        entries = []
+        for field in self.INDEXED_FIELDS:
+            for value in get_values(field):
+                key = value.lower()
+                self.indexes[field].setdefault(key, {})[name] = True
+                entries.append((field, key))
+        self.indexed[name] = entries
+
+    def unindex_item(self, name):
+        """
+        Drop the index entries recorded for the object with this name.
+        """
+        name = name.lower()
+        self.lock.acquire()
+        try:
+            for view in self.views.values():
+                view.discard(name)
+            for (field, key) in self.indexed.pop(name, []):
+                bucket = self.indexes[field].get(key, None)
+                if bucket is None:
+                    continue
+                bucket.pop(name, None)
+                if len(bucket) == 0:
+                    del self.indexes[field][key]
+        finally:
+            self.lock.release()
+
+    def sorted_view(self, field):
+        """
+        Return the SortedView of the collection for field, built on first
+        use (which, for a lazily loaded collection, loads every object).
+        Fields the collection's objects do not have (ex: a typo, or a
+        per-interface field) sort by name, and share the name view.
+        """
+        known = [ elem[0] for elem in ITEM_FIELDS[self.collection_type()] if not elem[0].startswith("*") ]
+        if field not in known:
+            field = "name"
+        self.lock.acquire()
+        try:
+            view = self.views.get(field, None)
+            if view is None:
+                view = SortedView(field)
+                view.build(self.listing.itervalues())
+                self.views.set(field, view)
+            return view
+        finally:
+            self.lock.release()
+
+    def sorted_names(self, field, start=0, end=None, reverse=False, names=None):
+        """
+        Return (count, names): the number of objects in the collection,
+        or in names if given, and the part of them from position start to
+        end in the order of field (see SortedView.names).
+        """
+        self.lock.acquire()
+        try:
+            view = self.sorted_view(field)
+            if names is None:
+                return (len(view), view.names(start, end, reverse=reverse))
+            names = view.sorted_names(names, reverse=reverse)
+            return (len(names), names[start:end])
+        finally:
+            self.lock.release()
+
+    def reload_item(self, name):
+        """
+        Replace the object with this name by the one in storage, or drop
+        it if it is not stored anymore, after another process saved or
+        removed it.  Returns the new object, or None.
+        """
+        key = name.lower()
+        self.lock.acquire()
+        try:
+            if self.lazy:
+                old = self.listing.peek(key)
+            else:
+                old = self.listing.get(key, None)
+            if old is not None:
+                parent = old.get_parent()
+                if parent is not None:
+                    parent.children.pop(old.name, None)
+
+            seed_data = self.config.deserialize_item_raw(self.collection_type(), name)
+            if seed_data is None:
+                if self.listing.has_key(key):
+                    del self.listing[key]
+                self.unindex_item(key)
+                return None
+
+            obj = self.factory_produce(self.config, seed_data)
+            if old is not None:
+                # the kids find their parent by name, so they now get obj
+                obj.children = old.children
+            self.listing[key] = obj
+            self.index_item(obj)
+            if self.lazy:
+                self.listing.mark_clean(key)
+            else:
+                parent = obj.get_parent()
+                if parent is not None:
+                    parent.children[obj.name] = obj
+            return obj
+        finally:
+            self.lock.release()
+
+    def find_by_index(self, field, value):
+        """
+        Return the objects whose indexed field exactly (case insensitively)
+        matches value.  field must be one of INDEXED_FIELDS.
+        """
+        results = []
+        for name in self.indexes[field].get(value.lower(), {}).keys():
+            obj = self.listing.get(name, None)
+            if obj is not None:
+                results.append(obj)
+        return results
+
+    def __index_candidates(self, kargs):
+        """
+        Use the indexes to narrow down the objects that can possibly match
+        kargs.  Only exact (non-glob, non-negated) values can be looked up.
+        Returns None if no criteria could be answered from an index.
+        """
+        candidates = None
+        for (key, value) in kargs.iteritems():
+            if not isinstance(value, basestring) or value.startswith("~"):
+                continue
+            if value.find("*") != -1 or value.find("?") != -1 or value.find("[") != -1:
+                continue
+            if key == "name":
+                names = {}
+                if self.listing.has_key(value.lower()):
+                    names[value.lower()] = True
+            elif self.indexes.has_key(key):
+                names = self.indexes[key].get(value.lower(), {})
+            else:
+                continue
+            if candidates is None:
+                candidates = names.copy()
+            else:
+                for name in candidates.keys():
+                    if not names.has_key(name):
+                        del candidates[name]
+        if candidates is None:
+            return None
+        return [self.listing[n] for n in candidates.keys() if self.listing.has_key(n)]
         
     def find(self, name=None, return_list=False, no_errors=False, **kargs):
         """
@@ -93,7 +520,13 @@ class Collection:
         if len(kargs) == 1 and kargs.has_key("name") and not return_list:
             return self.listing.get(kargs["name"].lower(), None)
 
-        for (name, obj) in self.listing.iteritems():
+        # performance: exact matches on indexed fields only need to check
+        # the objects found in the index, not the whole collection
+        candidates = self.__index_candidates(kargs)
+        if candidates is None:
+            candidates = self.listing.itervalues()
+
+        for obj in candidates:
             if obj.find_match(kargs, no_errors=no_errors):
                 matches.append(obj)
 
@@ -272,9 +705,6 @@ class Collection:
                 ref.ctime = now
             ref.mtime = now
 
-        if self.lite_sync is None:
-            self.lite_sync = action_litesync.BootLiteSync(self.config, logger=logger)
-
         # migration path for old API parameter that I've renamed.
         if with_copy and not save:
             save = with_copy
@@ -295,6 +725,7 @@ class Collection:
         if not save:
             # don't need to run triggers, so add it already ...
             self.listing[ref.name.lower()] = ref
+            self.index_item(ref)
 
         # perform filesystem operations
         if save:
@@ -302,20 +733,25 @@ class Collection:
             if with_triggers:
                 utils.run_triggers(self.api, ref,"/var/lib/cobbler/triggers/add/%s/pre/*" % self.collection_type(), [], logger)
             self.listing[ref.name.lower()] = ref
+            self.index_item(ref)
 
             # save just this item if possible, if not, save
             # the whole collection
             self.config.serialize_item(self, ref)
+            if self.lazy:
+                self.listing.mark_clean(ref.name.lower())
+            utils.blender_cache_invalidate(ref)
 
             if with_sync:
+                lite_sync = action_litesync.get_lite_sync(self.config, logger)
                 if isinstance(ref, item_system.System):
-                    self.lite_sync.add_single_system(ref.name)
+                    lite_sync.add_single_system(ref.name)
                 elif isinstance(ref, item_profile.Profile):
-                    self.lite_sync.add_single_profile(ref.name) 
+                    lite_sync.add_single_profile(ref.name) 
                 elif isinstance(ref, item_distro.Distro):
-                    self.lite_sync.add_single_distro(ref.name)
+                    lite_sync.add_single_distro(ref.name)
                 elif isinstance(ref, item_image.Image):
-                    self.lite_sync.add_single_image(ref.name)
+                    lite_sync.add_single_image(ref.name)
                 elif isinstance(ref, item_repo.Repo):
                     pass
                 elif isinstance(ref, item_mgmtclass.Mgmtclass):
@@ -328,7 +764,7 @@ class Collection:
                     print _("Internal error. Object type not recognized: %s") % type(ref)
             if not with_sync and quick_pxe_update:
                 if isinstance(ref, item_system.System):
-                    self.lite_sync.update_system_netboot_status(ref.name)
+                    action_litesync.get_lite_sync(self.config, logger).update_system_netboot_status(ref.name)
 
             # save the tree, so if neccessary, scripts can examine it.
             if with_triggers:
@@ -337,12 +773,84 @@ class Collection:
     
     
         # update children cache in parent object
+        # (lazily loaded objects are found through the indexes instead,
+        # so that the cache does not pin them all in memory)
         parent = ref.get_parent()
-        if parent != None:
+        if parent != None and not self.lazy:
             parent.children[ref.name] = ref
 
         return True
 
+    def add_batch(self,refs,with_triggers=True,with_sync=True,check_for_duplicate_names=False,check_for_duplicate_netinfo=False,logger=None):
+        """
+        Save several objects, as add(ref,save=True) would one by one, but
+        serializing them in one go and running the lite sync and the
+        change triggers once for all of them.  An object that fails its
+        checks (or its pre trigger) is skipped, the others are still
+        saved.  Returns a list with, for each object, None if it was
+        saved or the error message.
+        """
+        errors = []
+        added = []
+        now = time.time()
+        for ref in refs:
+            try:
+                if ref is None or ref.name is None or ref.name == "":
+                    raise CX(_("object has no name"))
+                if ref.COLLECTION_TYPE != self.collection_type():
+                    raise CX(_("API error: storing wrong data type in collection"))
+                ref.check_if_valid()
+                self.__duplication_checks(ref,check_for_duplicate_names,check_for_duplicate_netinfo)
+                if with_triggers:
+                    utils.run_triggers(self.api, ref,"/var/lib/cobbler/triggers/add/%s/pre/*" % self.collection_type(), [], logger)
+            except CX, error:
+                errors.append(str(error))
+                continue
+            if ref.uid == '':
+                ref.uid = self.config.generate_uid()
+            if ref.ctime == 0:
+                ref.ctime = now
+            ref.mtime = now
+            # indexed right away, so the duplicate checks (names, and with
+            # check_for_duplicate_netinfo MACs, IPs and DNS names) of the
+            # following objects see the earlier ones
+            self.listing[ref.name.lower()] = ref
+            self.index_item(ref)
+            errors.append(None)
+            added.append(ref)
+
+        if len(added) == 0:
+            return errors
+
+        self.config.serialize_items(self, added)
+        for ref in added:
+            if self.lazy:
+                self.listing.mark_clean(ref.name.lower())
+            utils.blender_cache_invalidate(ref)
+            parent = ref.get_parent()
+            if parent != None and not self.lazy:
+                parent.children[ref.name] = ref
+
+        if with_sync:
+            lite_sync = action_litesync.get_lite_sync(self.config, logger)
+            if self.collection_type() == "system":
+                lite_sync.add_systems([ ref.name for ref in added ])
+            elif self.collection_type() == "profile":
+                lite_sync.add_profiles([ ref.name for ref in added ])
+            elif self.collection_type() == "distro":
+                for ref in added:
+                    lite_sync.add_single_distro(ref.name)
+            elif self.collection_type() == "image":
+                for ref in added:
+                    lite_sync.add_single_image(ref.name)
+
+        if with_triggers:
+            for ref in added:
+                utils.run_triggers(self.api, ref,"/var/lib/cobbler/triggers/add/%s/post/*" % self.collection_type(), [], logger)
+            utils.run_triggers(self.api, None, "/var/lib/cobbler/triggers/change/*", [], logger)
+
+        return errors
+
     def __duplication_checks(self,ref,check_for_duplicate_names,check_for_duplicate_netinfo):
         """
         Prevents adding objects with the same name.
@@ -379,7 +887,10 @@ class Collection:
         if not check_for_duplicate_netinfo:
             return
        
+        # the system indexes are keyed on exactly these fields, so each
+        # check is a hash lookup rather than a scan of all systems.
         if isinstance(ref, item_system.System):
+           systems = self.api.systems()
            for (name, intf) in ref.interfaces.iteritems():
                match_ip    = []
                match_mac   = []
@@ -388,13 +899,13 @@ class Collection:
                input_ip    = intf["ip_address"]
                input_dns   = intf["dns_name"]
                if not self.api.settings().allow_duplicate_macs and input_mac is not None and input_mac != "":
-                   match_mac = self.api.find_system(mac_address=input_mac,return_list=True)   
+                   match_mac = systems.find_by_index("mac_address", input_mac)
                if not self.api.settings().allow_duplicate_ips and input_ip is not None and input_ip != "":
-                   match_ip  = self.api.find_system(ip_address=input_ip,return_list=True) 
+                   match_ip  = systems.find_by_index("ip_address", input_ip)
                # it's ok to conflict with your own net info.
 
                if not self.api.settings().allow_duplicate_hostnames and input_dns is not None and input_dns != "":
-                   match_hosts = self.api.find_system(dns_name=input_dns,return_list=True)
+                   match_hosts = systems.find_by_index("dns_name", input_dns)
 
                for x in match_mac:
                    if x.name != ref.name:
@@ -426,14 +937,14 @@ class Collection:
         """
 	Iterator for the collection.  Allows list comprehensions, etc
 	"""
-        for a in self.listing.values():
+        for a in self.listing.itervalues():
 	    yield a
 
     def __len__(self):
         """
 	Returns size of the collection
 	"""
-        return len(self.listing.values())
+        return len(self.listing)
 
     def collection_type(self):
         """
@@ -49,9 +49,8 @@ class Distros(collection.Collection):
 
         # first see if any Groups use this distro
         if not recursive:
-            for v in self.config.profiles():
-                if v.distro.lower() == name:
-                    raise CX(_("removal would orphan profile: %s") % v.name)
+            for v in self.config.profiles().find_by_index("distro", name):
+                raise CX(_("removal would orphan profile: %s") % v.name)
 
         obj = self.find(name=name)
 
@@ -66,9 +65,11 @@ class Distros(collection.Collection):
                 if with_triggers: 
                     utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/distro/pre/*", [], logger)
                 if with_sync:
-                    lite_sync = action_litesync.BootLiteSync(self.config, logger=logger)
+                    lite_sync = action_litesync.get_lite_sync(self.config, logger)
                     lite_sync.remove_single_distro(name)
             del self.listing[name]
+            self.unindex_item(name)
+            utils.blender_cache_invalidate(obj)
 
             self.config.serialize_delete(self, obj)
 
@@ -51,6 +51,8 @@ class Files(collection.Collection):
                     utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/file/*", [], logger)
 
             del self.listing[name]
+            self.unindex_item(name)
+            utils.blender_cache_invalidate(obj)
             self.config.serialize_delete(self, obj)
 
             if with_delete:
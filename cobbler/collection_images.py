@@ -45,9 +45,8 @@ class Images(collection.Collection):
 
         # first see if any Groups use this distro
         if not recursive:
-            for v in self.config.systems():
-                if v.image is not None and v.image.lower() == name:
-                    raise CX(_("removal would orphan system: %s") % v.name)
+            for v in self.config.systems().find_by_index("image", name):
+                raise CX(_("removal would orphan system: %s") % v.name)
 
         obj = self.find(name=name)
 
@@ -62,10 +61,12 @@ class Images(collection.Collection):
                 if with_triggers:
                     utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/image/pre/*", [], logger)
                 if with_sync:
-                    lite_sync = action_litesync.BootLiteSync(self.config, logger=logger)
+                    lite_sync = action_litesync.get_lite_sync(self.config, logger)
                     lite_sync.remove_single_image(name)
 
             del self.listing[name]
+            self.unindex_item(name)
+            utils.blender_cache_invalidate(obj)
             self.config.serialize_delete(self, obj)
 
             if with_delete:
@@ -34,6 +34,8 @@ from utils import _
 
 class Profiles(collection.Collection):
 
+    INDEXED_FIELDS = [ "distro", "parent" ]
+
     def collection_type(self):
         return "profile"
 
@@ -51,9 +53,8 @@ class Profiles(collection.Collection):
         name = name.lower()
 
         if not recursive:
-            for v in self.config.systems():
-                if v.profile is not None and v.profile.lower() == name:
-                    raise CX(_("removal would orphan system: %s") % v.name)
+            for v in self.config.systems().find_by_index("profile", name):
+                raise CX(_("removal would orphan system: %s") % v.name)
 
         obj = self.find(name=name)
         if obj is not None:
@@ -69,13 +70,15 @@ class Profiles(collection.Collection):
                 if with_triggers: 
                     utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/profile/pre/*", [], logger)
             del self.listing[name]
+            self.unindex_item(name)
+            utils.blender_cache_invalidate(obj)
             self.config.serialize_delete(self, obj)
             if with_delete:
                 if with_triggers: 
                     utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/profile/post/*", [], logger)
                     utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/change/*", [], logger)
                 if with_sync:
-                    lite_sync = action_litesync.BootLiteSync(self.config, logger=logger)
+                    lite_sync = action_litesync.get_lite_sync(self.config, logger)
                     lite_sync.remove_single_profile(name)
             return True
 
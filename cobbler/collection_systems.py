@@ -32,6 +32,8 @@ from utils import _
 
 class Systems(collection.Collection):
 
+    INDEXED_FIELDS = [ "mac_address", "ip_address", "dns_name", "hostname", "profile", "image" ]
+
     def collection_type(self):
         return "system"
 
@@ -54,9 +56,11 @@ class Systems(collection.Collection):
                 if with_triggers: 
                     utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/system/pre/*", [], logger)
                 if with_sync:
-                    lite_sync = action_litesync.BootLiteSync(self.config, logger=logger)
+                    lite_sync = action_litesync.get_lite_sync(self.config, logger)
                     lite_sync.remove_single_system(name)
             del self.listing[name]
+            self.unindex_item(name)
+            utils.blender_cache_invalidate(obj)
             self.config.serialize_delete(self, obj)
             if with_delete:
                 if with_triggers: 
@@ -67,3 +71,46 @@ class Systems(collection.Collection):
        
         raise CX(_("cannot delete an object that does not exist: %s") % name)
      
+
+    def remove_batch(self,names,with_delete=True,with_sync=True,with_triggers=True,logger=None):
+        """
+        Remove several systems, as remove() would one by one, but deleting
+        them from storage in one go and running the change triggers once.
+        Returns a list with, for each name, None if the system was removed
+        or the error message.
+        """
+        errors = []
+        removed = []
+        seen = {}
+        for name in names:
+            obj = self.find(name=name.lower())
+            if obj is None or seen.has_key(obj.name.lower()):
+                errors.append(_("cannot delete an object that does not exist: %s") % name)
+                continue
+            if with_delete and with_triggers:
+                try:
+                    utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/system/pre/*", [], logger)
+                except CX, error:
+                    errors.append(str(error))
+                    continue
+            errors.append(None)
+            removed.append(obj)
+            seen[obj.name.lower()] = True
+
+        if len(removed) == 0:
+            return errors
+
+        if with_delete and with_sync:
+            lite_sync = action_litesync.get_lite_sync(self.config, logger)
+            lite_sync.remove_systems([ obj.name for obj in removed ])
+        for obj in removed:
+            del self.listing[obj.name.lower()]
+            self.unindex_item(obj.name)
+            utils.blender_cache_invalidate(obj)
+        self.config.serialize_deletes(self, removed)
+        if with_delete and with_triggers:
+            for obj in removed:
+                utils.run_triggers(self.config.api, obj, "/var/lib/cobbler/triggers/delete/system/post/*", [], logger)
+            utils.run_triggers(self.config.api, None, "/var/lib/cobbler/triggers/change/*", [], logger)
+
+        return errors
@@ -47,6 +47,7 @@ import collection_files as files
 
 import settings
 import serializer
+import utils
 import traceback
 
 from utils import _
@@ -245,10 +246,23 @@ class Config:
        """
        return serializer.serialize_delete(collection,item) 
 
+   def serialize_items(self,collection,items):
+       """
+       Save several items of a collection in one go.
+       """
+       return serializer.serialize_items(collection,items)
+
+   def serialize_deletes(self,collection,items):
+       """
+       Erase several items of a collection from storage in one go.
+       """
+       return serializer.serialize_deletes(collection,items)
+
    def deserialize(self):
        """
        Load the object hierachy from disk, using the filenames referenced in each object.
        """
+       utils.blender_cache_clear()
        for item in [
            self._settings,
            self._distros,
@@ -261,7 +275,9 @@ class Config:
            self._files,
            ]:
            try:
-               if not serializer.deserialize(item): raise ""
+               if item is self._systems and self._settings.lazy_load_systems:
+                   if not item.lazy_load(self._settings.lazy_load_cache_size): raise ""
+               elif not serializer.deserialize(item): raise ""
            except:
                raise CX("serializer: error loading collection %s. Check /etc/cobbler/modules.conf" % item.collection_type())
        return True
@@ -272,6 +288,12 @@ class Config:
        """
        return serializer.deserialize_raw(collection_type)
 
+   def deserialize_headers(self,collection_type,fields):
+       """
+       Get the names, mtimes and given fields of the stored objects.
+       """
+       return serializer.deserialize_headers(collection_type,fields)
+
    def deserialize_item_raw(self,collection_type,obj_name):
        """
        Get a raw single object.
@@ -0,0 +1,188 @@
+"""
+A size bounded cache whose entries expire a fixed time after they were
+last set, kept in a heap ordered by expiry time so that dropping the
+expired entries only looks at those, not at every entry.  Used for the
+login tokens, unsaved object handles and events of the XMLRPC server.
+
+Copyright 2006-2009, Red Hat, Inc
+Michael DeHaan <mdehaan@redhat.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+02110-1301  USA
+"""
+
+import time
+import heapq
+import threading
+
+class ExpiryCache:
+
+    def __init__(self, timeout, capacity=0):
+        """
+        Constructor.  Entries expire timeout seconds after they were last
+        set.  A capacity of 0 or less means unbounded, otherwise adding
+        past capacity drops the entries closest to expiring.
+        """
+        self.timeout     = timeout
+        self.capacity    = capacity
+        self.lock        = threading.RLock()
+        self.expirations = 0
+        self.evictions   = 0
+        self.clear()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.data = {}   # key -> [ deadline, value ]
+            self.heap = []   # ( deadline, key ), stale ones are skipped
+        finally:
+            self.lock.release()
+
+    def set(self, key, value, now=None):
+        """
+        Store value, the entry expires timeout seconds from now.
+        """
+        if now is None:
+            now = time.time()
+        deadline = now + self.timeout
+        self.lock.acquire()
+        try:
+            self.data[key] = [ deadline, value ]
+            heapq.heappush(self.heap, (deadline, key))
+            if self.capacity > 0:
+                while len(self.data) > self.capacity:
+                    if self.__pop():
+                        self.evictions = self.evictions + 1
+            # entries set again leave stale heap items behind
+            if len(self.heap) > 2 * len(self.data) + 64:
+                self.heap = [ (entry[0], k) for (k, entry) in self.data.iteritems() ]
+                heapq.heapify(self.heap)
+        finally:
+            self.lock.release()
+
+    __setitem__ = set
+
+    def get(self, key, default=None):
+        entry = self.data.get(key, None)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def __getitem__(self, key):
+        return self.data[key][1]
+
+    def pop(self, key, default=None):
+        self.lock.acquire()
+        try:
+            entry = self.data.pop(key, None)
+            if entry is None:
+                return default
+            return entry[1]
+        finally:
+            self.lock.release()
+
+    def __delitem__(self, key):
+        self.lock.acquire()
+        try:
+            del self.data[key]
+        finally:
+            self.lock.release()
+
+    def has_key(self, key):
+        return self.data.has_key(key)
+
+    __contains__ = has_key
+
+    def keys(self):
+        return self.data.keys()
+
+    def items(self):
+        """
+        A copy of the (key, value) pairs, safe to use while the reaper runs.
+        """
+        self.lock.acquire()
+        try:
+            return [ (k, entry[1]) for (k, entry) in self.data.iteritems() ]
+        finally:
+            self.lock.release()
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __len__(self):
+        return len(self.data)
+
+    def expire(self, now=None):
+        """
+        Drop the entries whose time is up.  Returns how many were dropped.
+        """
+        if now is None:
+            now = time.time()
+        count = 0
+        self.lock.acquire()
+        try:
+            while len(self.heap) > 0 and self.heap[0][0] <= now:
+                if self.__pop():
+                    count = count + 1
+            self.expirations = self.expirations + count
+        finally:
+            self.lock.release()
+        return count
+
+    def stats(self):
+        """
+        Counters suitable for reporting (ex: over XMLRPC).
+        """
+        return {
+            "size"        : len(self.data),
+            "capacity"    : self.capacity,
+            "timeout"     : self.timeout,
+            "expirations" : self.expirations,
+            "evictions"   : self.evictions,
+        }
+
+    def __pop(self):
+        """
+        Drop the entry closest to expiring.  Returns False if the heap
+        item was stale (the entry was set again or deleted since).
+        """
+        (deadline, key) = heapq.heappop(self.heap)
+        entry = self.data.get(key, None)
+        if entry is None or entry[0] != deadline:
+            return False
+        del self.data[key]
+        return True
+
+class Reaper(threading.Thread):
+    """
+    Background thread expiring a list of caches every interval seconds,
+    so idle servers let go of expired entries too.
+    """
+
+    def __init__(self, caches, interval=60):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.caches   = caches
+        self.interval = interval
+
+    def run(self):
+        try:
+            while True:
+                time.sleep(self.interval)
+                for cache in self.caches:
+                    cache.expire()
+        except:
+            # modules vanish under daemon threads at interpreter exit
+            return
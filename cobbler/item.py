@@ -56,11 +56,22 @@ class Item:
         self.log_func = self.config.api.log        
         self.ctime = 0 # to be filled in by collection class
         self.mtime = 0 # to be filled in by collection class
+        self.revision = 0 # to be filled in by the serializer, see changelog.py
         self.uid = ""  # to be filled in by collection class
 
         self.last_cached_mtime = 0
         self.cached_datastruct = ""
 
+    def __setattr__(self,name,value):
+        """
+        Setting any field marks the object as changed since it was last
+        saved.  Lazily loaded collections only evict objects that are not
+        dirty, see LazyListing in collection.py.
+        """
+        self.__dict__[name] = value
+        if name not in [ "dirty", "children" ]:
+            self.__dict__["dirty"] = True
+
     def clear(self,is_subobject=False):
         """
         Reset this object.
@@ -92,12 +103,20 @@ class Item:
         """
         Get direct children of this object.
         """
-        keys = self.children.keys()
+        children = self.children
+        # lazily loaded systems are not kept in the children cache of their
+        # profile or image, look them up in the system index instead.
+        systems = self.config.systems()
+        if systems.lazy and self.COLLECTION_TYPE in [ "profile", "image" ]:
+            children = children.copy()
+            for kid in systems.find_by_index(self.COLLECTION_TYPE, self.name):
+                children[kid.name] = kid
+        keys = children.keys()
         if sorted:
             keys.sort()
         results = []
         for k in keys:
-            results.append(self.children[k])
+            results.append(children[k])
         return results
 
     def get_descendants(self):
@@ -311,6 +330,28 @@ class Item:
             return True
 
 
+    def get_index_values(self,field):
+        """
+        Values this object is filed under in the collection index for
+        field (see Collection.INDEXED_FIELDS).  Empty values are not indexed.
+        """
+        value = getattr(self, field, None)
+        if not isinstance(value, basestring) or value == "":
+            return []
+        return [ value ]
+
+    def update_indexes(self):
+        """
+        Setters of indexed fields call this so that the collection lookup
+        indexes follow edits made in place on an object already added.
+        Objects not (yet) held by their collection are left alone.
+        """
+        if self.name is None or self.name == "":
+            return
+        collection = self.config.get_items(self.COLLECTION_TYPE)
+        if collection.holds(self):
+            collection.index_item(self)
+
     def sort_key(self,sort_fields=[]):
         data = self.to_datastruct()
         return [data.get(x,"") for x in sort_fields]
@@ -98,6 +98,7 @@ FIELDS = [
    [ "name","",0,"Name",True,"Ex: Fedora-11-i386",0,"str"],
    ["ctime",0,0,"",False,"",0,"float"],
    ["mtime",0,0,"",False,"",0,"float"],
+   ["revision",0,0,"",False,"",0,"int"],
    [ "uid","",0,"",False,"",0,"str"],
    [ "owners","SETTINGS:default_ownership",0,"Owners",True,"Owners list for authz_ownership (space delimited)",0,"list"],
    [ "kernel",None,0,"Kernel",True,"Absolute path to kernel on filesystem",0,"str"],
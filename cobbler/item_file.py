@@ -31,6 +31,7 @@ FIELDS = [
     ["comment","",0,"Comment",True,"Free form text description",0,"str"],
     ["ctime",0,0,"",False,"",0,"float"],
     ["mtime",0,0,"",False,"",0,"float"],
+    ["revision",0,0,"",False,"",0,"int"],
     ["owners","SETTINGS:default_ownership",0,"Owners",False,"Owners list for authz_ownership (space delimited)",[],"list"],
     ["name","",0,"Name",True,"Name of file resource",0,"str"],
     ["is_dir",False,0,"Is Directory",True,"Treat file resource as a directory",0,"bool"],
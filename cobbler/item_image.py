@@ -37,6 +37,7 @@ FIELDS = [
   ['comment','',0,"Comment",True,"Free form text description",0,"str"],
   ['ctime',0,0,"",False,"",0,"float"],
   ['mtime',0,0,"",False,"",0,"float"],
+  ['revision',0,0,"",False,"",0,"int"],
   ['file','',0,"File",True,"Path to local file or nfs://user@host:path",0,"str"],
   ['depth',0,0,"",False,"",0,"int"],
   ['image_type',"iso",0,"Image Type",True,"", ["iso","direct","virt-image"],"str"], #FIXME:complete?
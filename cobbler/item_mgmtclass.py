@@ -33,6 +33,7 @@ FIELDS = [
     ["comment","",0,"Comment",True,"Free form text description",0,"str"],
     ["ctime",0,0,"",False,"",0,"int"],
     ["mtime",0,0,"",False,"",0,"int"],
+    ["revision",0,0,"",False,"",0,"int"],
     ["packages",[],0,"Packages",True,"Package resources",0,"list"],
     ["files",[],0,"Files",True,"File resources",0,"list"],
 ]
@@ -30,6 +30,7 @@ FIELDS = [
     ["comment","",0,"Comment",True,"Free form text description",0,"str"],
     ["ctime",0,0,"",False,"",0,"float"],
     ["mtime",0,0,"",False,"",0,"float"],
+    ["revision",0,0,"",False,"",0,"int"],
     ["owners","SETTINGS:default_ownership",0,"Owners",True,"Owners list for authz_ownership (space delimited)",[],"list"],
     ["name","",0,"Name",True,"Name of file resource",0,"str"],
     ["action","create",0,"Action",True,"Install or remove package resource",0,"str"],
@@ -54,6 +54,7 @@ FIELDS = [
   ["server","<<inherit>>",'<<inherit>>',"Server Override",True,"See manpage or leave blank",0,"str"],
   ["ctime",0,0,"",False,"",0,"int"],
   ["mtime",0,0,"",False,"",0,"int"],
+  ["revision",0,0,"",False,"",0,"int"],
   ["name_servers","SETTINGS:default_name_servers",[],"Name Servers",True,"space delimited",0,"list"],
   ["name_servers_search","SETTINGS:default_name_servers_search",[],"Name Servers Search Path",True,"space delimited",0,"list"],
   ["mgmt_classes",[],'<<inherit>>',"Management Classes",True,"For external configuration management",0,"list"],
@@ -98,6 +99,7 @@ class Profile(item.Item):
             old_parent.children.pop(self.name, 'pass')
         if parent_name is None or parent_name == '':
            self.parent = ''
+           self.update_indexes()
            return True
         if parent_name == self.name:
            # check must be done in two places as set_parent could be called before/after
@@ -111,6 +113,7 @@ class Profile(item.Item):
         parent = self.get_parent()
         if isinstance(parent, item.Item):
             parent.children[self.name] = self
+        self.update_indexes()
         return True
 
     def set_distro(self,distro_name):
@@ -126,6 +129,7 @@ class Profile(item.Item):
             self.distro = distro_name
             self.depth  = d.depth +1 # reset depth if previously a subprofile and now top-level
             d.children[self.name] = self
+            self.update_indexes()
             return True
         raise CX(_("distribution not found"))
 
@@ -38,6 +38,7 @@ FIELDS = [
   ["keep_updated",True,0,"Keep Updated",True,"Update this repo on next 'cobbler reposync'?",0,"bool"],
   ["mirror",None,0,"Mirror",True,"Address of yum or rsync repo to mirror",0,"str"],
   ["mtime",0,0,"",False,"",0,"float"],
+  ["revision",0,0,"",False,"",0,"int"],
   ["name","",0,"Name",True,"Ex: f10-i386-updates",0,"str"],
   ["owners","SETTINGS:default_ownership",0,"Owners",True,"Owners list for authz_ownership (space delimited)",[],"list"],
   ["parent",None,0,"",False,"",0,"str"],
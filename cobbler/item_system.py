@@ -50,6 +50,7 @@ FIELDS = [
   ["virt_auto_boot","<<inherit>>",0,"Virt Auto Boot",True,"Auto boot this VM?",0,"bool"],
   ["ctime",0,0,"",False,"",0,"float"],
   ["mtime",0,0,"",False,"",0,"float"],
+  ["revision",0,0,"",False,"",0,"int"],
   ["power_type","SETTINGS:power_management_default_type",0,"Power Management Type",True,"",utils.get_power_types(),"str"],
   ["power_address","",0,"Power Management Address",True,"Ex: power-device.example.org",0,"str"],
   ["power_user","",0,"Power Username ",True,"",0,"str"],
@@ -124,11 +125,18 @@ class System(item.Item):
             else:
                 raise CX(_("At least one interface needs to be defined."))
 
+        self.update_indexes()
         return True
         
 
     def __get_interface(self,name):
+        """
+        Return the interface for a setter to change in place, creating it
+        if needed.  Changes to the dict bypass __setattr__, so the object
+        is marked dirty here.
+        """
 
+        self.dirty = True
         if not self.interfaces.has_key(name):
             self.interfaces[name] = {
                 "mac_address"          : "",
@@ -157,6 +165,28 @@ class System(item.Item):
 
         return self.interfaces[name]
 
+    def __find_interface(self,name):
+        """
+        Like __get_interface, for getters: an existing interface is only
+        read, so the object stays clean.
+        """
+        if self.interfaces.has_key(name):
+            return self.interfaces[name]
+        return self.__get_interface(name)
+
+
+    def get_index_values(self,field):
+        """
+        Interface fields are indexed once per interface.
+        """
+        if field in [ "mac_address", "ip_address", "dns_name" ]:
+            results = []
+            for intf in self.interfaces.values():
+                value = intf.get(field, "")
+                if isinstance(value, basestring) and value != "":
+                    results.append(value)
+            return results
+        return item.Item.get_index_values(self,field)
 
     def from_datastruct(self,seed_data):
         # FIXME: most definitely doesn't grok interfaces yet.
@@ -224,7 +254,7 @@ class System(item.Item):
         Use the explicit location first.
         """
 
-        intf = self.__get_interface(interface)
+        intf = self.__find_interface(interface)
 
         if intf["mac_address"] != "":
             return intf["mac_address"].strip()
@@ -237,7 +267,7 @@ class System(item.Item):
         Use the explicit location first.
         """
 
-        intf = self.__get_interface(interface)
+        intf = self.__find_interface(interface)
 
         if intf["ip_address"] != "": 
             return intf["ip_address"].strip()
@@ -273,13 +303,14 @@ class System(item.Item):
         # FIXME: move duplicate supression code to the object validation
         # functions to take a harder line on supression?
         if dns_name != "" and not str(self.config._settings.allow_duplicate_hostnames).lower() in [ "1", "y", "yes"]:
-           matched = self.config.api.find_items("system", {"dns_name" : dns_name})
+           matched = self.config.systems().find_by_index("dns_name", dns_name)
            for x in matched:
                if x.name != self.name:
                    raise CX("dns-name duplicated: %s" % dns_name)
 
 
         intf["dns_name"] = dns_name
+        self.update_indexes()
         return True
  
     def set_static_routes(self,routes,interface):
@@ -292,6 +323,7 @@ class System(item.Item):
         if hostname is None:
            hostname = ""
         self.hostname = hostname
+        self.update_indexes()
         return True
 
     def set_static(self,truthiness,interface):
@@ -314,7 +346,7 @@ class System(item.Item):
         # FIXME: move duplicate supression code to the object validation
         # functions to take a harder line on supression?
         if address != "" and not str(self.config._settings.allow_duplicate_ips).lower() in [ "1", "y", "yes"]:
-           matched = self.config.api.find_items("system", {"ip_address" : address})
+           matched = self.config.systems().find_by_index("ip_address", address)
            for x in matched:
                if x.name != self.name:
                    raise CX("IP address duplicated: %s" % address)
@@ -322,6 +354,7 @@ class System(item.Item):
 
         if address == "" or utils.is_ip(address):
            intf["ip_address"] = address.strip()
+           self.update_indexes()
            return True
         raise CX(_("invalid format for IP address (%s)") % address)
 
@@ -332,7 +365,7 @@ class System(item.Item):
         # FIXME: move duplicate supression code to the object validation
         # functions to take a harder line on supression?
         if address != "" and not str(self.config._settings.allow_duplicate_macs).lower() in [ "1", "y", "yes"]:
-           matched = self.config.api.find_items("system", {"mac_address" : address})
+           matched = self.config.systems().find_by_index("mac_address", address)
            for x in matched:
                if x.name != self.name:
                    raise CX("MAC address duplicated: %s" % address)
@@ -340,6 +373,7 @@ class System(item.Item):
         intf = self.__get_interface(interface)
         if address == "" or utils.is_mac(address):
            intf["mac_address"] = address.strip()
+           self.update_indexes()
            return True
         raise CX(_("invalid format for MAC address (%s)" % address))
 
@@ -477,6 +511,7 @@ class System(item.Item):
             self.profile = ""
             if isinstance(old_parent, item.Item):
                 old_parent.children.pop(self.name, 'pass')
+            self.update_indexes()
             return True
 
         self.image = "" # mutual exclusion rule
@@ -488,8 +523,9 @@ class System(item.Item):
             if isinstance(old_parent, item.Item):
                 old_parent.children.pop(self.name, 'pass')
             new_parent = self.get_parent()
-            if isinstance(new_parent, item.Item):
+            if isinstance(new_parent, item.Item) and not self.config.systems().lazy:
                 new_parent.children[self.name] = self
+            self.update_indexes()
             return True
         raise CX(_("invalid profile name: %s") % profile_name)
 
@@ -503,6 +539,7 @@ class System(item.Item):
             self.image = ""
             if isinstance(old_parent, item.Item):
                 old_parent.children.pop(self.name, 'pass')
+            self.update_indexes()
             return True
 
         self.profile = "" # mutual exclusion rule
@@ -515,8 +552,9 @@ class System(item.Item):
             if isinstance(old_parent, item.Item):
                 old_parent.children.pop(self.name, 'pass')
             new_parent = self.get_parent()
-            if isinstance(new_parent, item.Item):
+            if isinstance(new_parent, item.Item) and not self.config.systems().lazy:
                 new_parent.children[self.name] = self
+            self.update_indexes()
             return True
         raise CX(_("invalid image name (%s)") % image_name)
 
@@ -33,6 +33,8 @@ import errno
 import utils
 from cexceptions import *
 import templar 
+import template_api
+import lrucache
 
 import item_distro
 import item_profile
@@ -60,6 +62,10 @@ class KickGen:
         self.settings    = config.settings()
         self.repos       = config.repos()
         self.templar     = templar.Templar(config)
+        # rendered kickstarts, see generate_kickstart
+        self.cache       = lrucache.LRUCache(self.settings.kickstart_cache_size)
+        self.hits        = 0
+        self.misses      = 0
 
     def createAutoYaSTScript( self, document, script, name ):
         newScript = document.createElement("script")
@@ -249,12 +255,18 @@ class KickGen:
         if system is None:
             obj = profile
 
+        key = (obj.COLLECTION_TYPE, obj.name.lower())
+        data = self.__cache_lookup(key, obj)
+        if data is not None:
+            return data
+
         meta = utils.blender(self.api, False, obj)
         kickstart_path = utils.find_kickstart(meta["kickstart"])
 
         if not kickstart_path:
             return "# kickstart is missing or invalid: %s" % meta["kickstart"]
 
+        repos = meta["repos"]
         ksmeta = meta["ks_meta"]
         del meta["ks_meta"]
         meta.update(ksmeta) # make available at top level
@@ -272,12 +284,17 @@ class KickGen:
             if system is not None:
                 distro = system.get_conceptual_parent().get_conceptual_parent()
 
-            data = self.templar.render(raw_data, meta, None, obj)
+            template_api.record_snippets()
+            try:
+                data = self.templar.render(raw_data, meta, None, obj)
+            finally:
+                snippets = template_api.recorded_snippets()
 
             if distro.breed == "suse":
                 # AutoYaST profile
                 data = self.generate_autoyast(profile,system,data)
 
+            self.__cache_store(key, obj, repos, [ kickstart_path ] + snippets, data)
             return data
         except FileNotFoundException:
             self.api.logger.warning("kickstart not found: %s" % meta["kickstart"])
@@ -296,6 +313,84 @@ class KickGen:
 
         return self.generate_kickstart(profile=g)
 
+    def cache_stats(self):
+        """
+        Counters of the rendered kickstart cache, for reporting.
+        """
+        stats = self.cache.stats()
+        stats["hits"]   = self.hits
+        stats["misses"] = self.misses
+        return stats
+
+    def __cache_lookup(self, key, obj):
+        """
+        Returns the cached kickstart for obj, or None if there is none or
+        if anything it was rendered from has changed since: the objects
+        it inherits from, its repos, the kickstart template or any of
+        the snippets looked up while rendering it.
+        """
+        if self.settings.kickstart_cache_size <= 0:
+            return None
+        entry = self.cache.peek(key)
+        if entry is None or entry["tree"] != self.__tree_stamp(obj) \
+                or entry["repos"] != self.__repos_stamp(entry["repos"]) \
+                or entry["files"] != self.__files_stamp(entry["files"]):
+            self.misses = self.misses + 1
+            return None
+        self.cache.get(key)
+        self.hits = self.hits + 1
+        self.templar.last_errors = entry["errors"]
+        return entry["data"]
+
+    def __cache_store(self, key, obj, repos, files, data):
+        if self.settings.kickstart_cache_size <= 0:
+            return
+        # remote kickstarts and snippets can change without us knowing
+        for path in files:
+            if not path.startswith("/"):
+                self.cache.pop(key)
+                return
+        if type(repos) != list:
+            repos = []
+        self.cache.set(key, {
+            "tree"   : self.__tree_stamp(obj),
+            "repos"  : self.__repos_stamp([ (name, None) for name in repos ]),
+            "files"  : self.__files_stamp([ (path, None) for path in files ]),
+            "data"   : data,
+            "errors" : self.templar.last_errors,
+        })
+
+    def __tree_stamp(self, obj):
+        return [ (id(node), getattr(node, "mtime", None)) for node in utils.grab_tree(self.api, obj) ]
+
+    def __repos_stamp(self, repos):
+        """
+        (name, mtime) for each of the (name, old mtime) repos, None
+        for repos that do not exist.
+        """
+        results = []
+        for (name, old) in repos:
+            repo = self.api.find_repo(name)
+            if repo is None:
+                results.append((name, None))
+            else:
+                results.append((name, repo.mtime))
+        return results
+
+    def __files_stamp(self, files):
+        """
+        (path, (mtime, size)) for each of the (path, old stamp) files,
+        None for files that do not exist.
+        """
+        results = []
+        for (path, old) in files:
+            try:
+                st = os.stat(path)
+                results.append((path, (st.st_mtime, st.st_size)))
+            except OSError:
+                results.append((path, None))
+        return results
+
     def get_last_errors(self):
         """
         Returns the list of errors generated by 
@@ -0,0 +1,264 @@
+"""
+Writes the logs anamon uploads during installs to
+/var/log/cobbler/anamon/<system>/.  The files being written are kept
+open (up to a limit, least recently used ones are closed first), and
+are fsync'ed in batches every few seconds rather than per chunk, so a
+mass install streaming logs from hundreds of hosts costs a write per
+chunk.
+
+Copyright 2006-2009, Red Hat, Inc
+Michael DeHaan <mdehaan@redhat.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+02110-1301  USA
+"""
+
+import os
+import stat
+import time
+import errno
+import string
+import threading
+
+import lrucache
+from cexceptions import *
+
+UPLOAD_DIR    = "/var/log/cobbler/anamon"
+MAX_OPEN      = 256  # files kept open
+SYNC_INTERVAL = 5    # seconds between fsyncs of the written files
+
+class UploadFile:
+    """
+    An open log file.  Writes to it are serialized by its lock.
+    """
+
+    def __init__(self, path):
+        self.path   = path
+        self.lock   = threading.Lock()
+        self.fd     = None
+        self.dirty  = False
+        self.closed = False  # for good, a new UploadFile must be used
+
+    def open(self):
+        try:
+            st = os.lstat(self.path)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        else:
+            if not stat.S_ISREG(st.st_mode):
+                raise CX("destination not a file: %s" % self.path)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0644)
+
+    def check(self):
+        """
+        (Re)open the file if needed: on first use, or once it was deleted
+        (logs are cleared when an install starts).  Must be called with
+        the lock held.
+        """
+        if self.fd is not None and os.fstat(self.fd).st_nlink == 0:
+            os.close(self.fd)
+            self.fd = None
+        if self.fd is None:
+            self.open()
+
+    def sync(self):
+        self.lock.acquire()
+        try:
+            if self.dirty and self.fd is not None:
+                os.fsync(self.fd)
+            self.dirty = False
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            if self.fd is not None:
+                if self.dirty:
+                    os.fsync(self.fd)
+                os.close(self.fd)
+            self.fd = None
+            self.dirty = False
+            self.closed = True
+        finally:
+            self.lock.release()
+
+class LogUploads:
+
+    def __init__(self, upload_dir=UPLOAD_DIR, max_open=MAX_OPEN, sync_interval=SYNC_INTERVAL):
+        self.upload_dir    = upload_dir
+        self.sync_interval = sync_interval
+        self.lock          = threading.Lock()
+        self.files         = lrucache.LRUCache(max_open, on_evict=self.__closed)
+        self.syncer        = None   # ( pid, thread )
+        self.bytes         = 0
+        self.chunks        = 0
+        self.syncs         = 0
+
+    def path(self, sys_name, name):
+        """
+        Where the file name uploaded for a system is written.  Slashes
+        in the name are replaced, so it stays in the system directory.
+        """
+        tt = string.maketrans("/","+")
+        fn = string.translate(name, tt)
+        if fn.startswith('..') or sys_name.startswith('..') or sys_name.find("/") != -1:
+            raise CX("invalid filename used: %s" % fn)
+        return os.path.join(self.upload_dir, sys_name, fn)
+
+    def write(self, sys_name, name, offset, contents, size=None):
+        """
+        Write one chunk, as sent by the upload_log_data XMLRPC call.
+        The chunk goes at offset, or at the end of the file if offset is
+        -1, which marks the last chunk: the file is then cut to size.
+        A chunk at offset 0 (or a whole file sent as the last chunk)
+        replaces the file.
+        """
+        f = self.__acquire(sys_name, name)
+        try:
+            if offset == 0 or (offset == -1 and size == len(contents)):
+                os.ftruncate(f.fd, 0)
+            if offset == -1:
+                os.lseek(f.fd, 0, 2)
+            else:
+                os.lseek(f.fd, offset, 0)
+            self.__write(f, contents)
+            if offset == -1 and size is not None:
+                os.ftruncate(f.fd, size)
+        finally:
+            f.lock.release()
+        return True
+
+    def write_stream(self, sys_name, name, offset, pieces):
+        """
+        Write the data read from an iterator of strings (the body of an
+        HTTP PUT) at offset.  Offset 0 replaces the file, anything else
+        only adds to or overwrites the end of it, so a client can send
+        just what was appended since the last upload.  Returns the
+        number of bytes written.
+        """
+        written = 0
+        if offset == 0:
+            f = self.__acquire(sys_name, name)
+            try:
+                os.ftruncate(f.fd, 0)
+            finally:
+                f.lock.release()
+        # the lock is only held while writing, not while the client is
+        # slow to send the next piece
+        for piece in pieces:
+            f = self.__acquire(sys_name, name)
+            try:
+                os.lseek(f.fd, offset + written, 0)
+                self.__write(f, piece)
+            finally:
+                f.lock.release()
+            written = written + len(piece)
+        return written
+
+    def sync(self):
+        """
+        fsync the files written to since the last call.
+        """
+        for f in self.files.values():
+            if f.dirty:
+                f.sync()
+                self.syncs = self.syncs + 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+    def stats(self):
+        return {
+            "open"   : len(self.files),
+            "bytes"  : self.bytes,
+            "chunks" : self.chunks,
+            "syncs"  : self.syncs,
+        }
+
+    def __write(self, f, data):
+        self.bytes = self.bytes + len(data)
+        self.chunks = self.chunks + 1
+        while len(data) > 0:
+            count = os.write(f.fd, data)
+            data = data[count:]
+        f.dirty = True
+
+    def __acquire(self, sys_name, name):
+        """
+        Returns the open file for a system log, with its lock held.
+        """
+        while True:
+            f = self.__get(sys_name, name)
+            f.lock.acquire()
+            if not f.closed:
+                break
+            # closed to make room since we got it, get a new one
+            f.lock.release()
+        try:
+            f.check()
+        except:
+            f.lock.release()
+            raise
+        return f
+
+    def __get(self, sys_name, name):
+        key = (sys_name, name)
+        f = self.files.get(key)
+        if f is not None:
+            return f
+        path = self.path(sys_name, name)
+        self.lock.acquire()
+        try:
+            f = self.files.get(key)
+            if f is None:
+                udir = os.path.dirname(path)
+                if not os.path.isdir(udir):
+                    os.mkdir(udir, 0755)
+                f = UploadFile(path)
+                self.files.set(key, f)
+            self.__start_syncer()
+        finally:
+            self.lock.release()
+        return f
+
+    def __closed(self, key, f):
+        f.close()
+
+    def __start_syncer(self):
+        """
+        Start the thread doing the periodic fsyncs, once per process
+        (cobblerd may fork after this module was loaded).
+        """
+        if self.syncer is not None and self.syncer[0] == os.getpid():
+            return
+        thread = threading.Thread(target=self.__sync_loop)
+        thread.setDaemon(True)
+        thread.start()
+        self.syncer = (os.getpid(), thread)
+
+    def __sync_loop(self):
+        try:
+            while True:
+                time.sleep(self.sync_interval)
+                self.sync()
+        except:
+            # modules vanish under daemon threads at interpreter exit
+            return
+
+LOG_UPLOADS = LogUploads()
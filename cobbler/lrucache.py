@@ -0,0 +1,164 @@
+"""
+A small size bounded, least recently used cache with hit/miss counters.
+
+Copyright 2006-2009, Red Hat, Inc
+Michael DeHaan <mdehaan@redhat.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+02110-1301  USA
+"""
+
+import threading
+import weakref
+
+# every live cache, see after_fork()
+CACHES = weakref.WeakKeyDictionary()
+
+def after_fork():
+    """
+    Called in a forked child: the lock of a cache may have been held by
+    another thread of the parent, which does not exist in the child.
+    """
+    for cache in CACHES.keys():
+        cache.lock = threading.RLock()
+
+class LRUCache:
+
+    def __init__(self, capacity, evict_check=None, on_evict=None):
+        """
+        Constructor.  capacity is the number of entries kept, a capacity
+        of 0 or less means unbounded.  evict_check, if given, is called
+        with (key, value) before an entry is dropped and may return False
+        to keep it (ex: objects with unsaved changes).  on_evict, if
+        given, is called with (key, value) once an entry was dropped to
+        make room (ex: to close a file).
+        """
+        self.capacity    = capacity
+        self.evict_check = evict_check
+        self.on_evict    = on_evict
+        self.lock        = threading.RLock()
+        self.hits        = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self.clear()
+        CACHES[self] = True
+
+    def clear(self):
+        """
+        Forget all entries, but not the counters.
+        """
+        self.lock.acquire()
+        try:
+            self.data = {}
+            self.tick = 0
+        finally:
+            self.lock.release()
+
+    def get(self, key, default=None):
+        """
+        Return the entry for key (marking it as recently used) or default.
+        """
+        self.lock.acquire()
+        try:
+            entry = self.data.get(key, None)
+            if entry is None:
+                self.misses = self.misses + 1
+                return default
+            self.hits = self.hits + 1
+            self.tick = self.tick + 1
+            entry[0] = self.tick
+            return entry[1]
+        finally:
+            self.lock.release()
+
+    def peek(self, key, default=None):
+        """
+        Return the entry for key without touching its age or the counters.
+        """
+        entry = self.data.get(key, None)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        self.lock.acquire()
+        try:
+            self.tick = self.tick + 1
+            self.data[key] = [self.tick, value]
+            if self.capacity > 0 and len(self.data) > self.capacity:
+                self.__shrink()
+        finally:
+            self.lock.release()
+
+    __setitem__ = set
+
+    def pop(self, key, default=None):
+        self.lock.acquire()
+        try:
+            entry = self.data.pop(key, None)
+            if entry is None:
+                return default
+            return entry[1]
+        finally:
+            self.lock.release()
+
+    def has_key(self, key):
+        return self.data.has_key(key)
+
+    __contains__ = has_key
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        self.lock.acquire()
+        try:
+            return [ entry[1] for entry in self.data.values() ]
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        """
+        Counters suitable for reporting (ex: over XMLRPC).
+        """
+        return {
+            "size"      : len(self.data),
+            "capacity"  : self.capacity,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "evictions" : self.evictions,
+        }
+
+    def __shrink(self):
+        """
+        Drop the oldest entries, down to 90% of capacity so that the cost
+        of sorting by age is paid once per batch rather than per insert.
+        """
+        target = int(self.capacity * 0.9)
+        ages = [(entry[0], key) for (key, entry) in self.data.iteritems()]
+        ages.sort()
+        # never drop the entry that was just added
+        for (age, key) in ages[:-1]:
+            if len(self.data) <= target:
+                break
+            if self.evict_check is not None and not self.evict_check(key, self.data[key][1]):
+                continue
+            entry = self.data.pop(key)
+            self.evictions = self.evictions + 1
+            if self.on_evict is not None:
+                self.on_evict(key, entry[1])
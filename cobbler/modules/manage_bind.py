@@ -36,6 +36,7 @@ from shlex import shlex
 import utils
 from cexceptions import *
 import templar 
+import workerpool
 
 import item_distro
 import item_profile
@@ -274,29 +275,15 @@ zone "%(arpa)s." {
         default_template_data = f2.read()
         f2.close()
 
+        # each zone file is rendered on its own, so they are spread over
+        # the sync workers
+        zones = []
         for (zone, hosts) in forward.iteritems():
-            metadata = {
-                'cobbler_server': cobbler_server,
-                'serial': serial,
-                'host_record': ''
-            }
-
-            # grab zone-specific template if it exists
-            try:
-               fd = open('/etc/cobbler/zone_templates/%s' % zone)
-               template_data = fd.read()
-               fd.close()
-            except:
-               template_data = default_template_data
-
-            metadata['host_record'] = self.__pretty_print_host_records(hosts)
-
-            zonefilename='/var/named/' + zone
-            if self.logger is not None:
-               self.logger.info("generating (forward) %s" % zonefilename)
-            self.templar.render(template_data, metadata, zonefilename, None)
-
+            zones.append((zone, hosts, 'A', 'forward'))
         for (zone, hosts) in reverse.iteritems():
+            zones.append((zone, hosts, 'PTR', 'reverse'))
+
+        def write_zone_file((zone, hosts, rectype, direction)):
             metadata = {
                 'cobbler_server': cobbler_server,
                 'serial': serial,
@@ -311,13 +298,16 @@ zone "%(arpa)s." {
             except:
                template_data = default_template_data
 
-            metadata['host_record'] = self.__pretty_print_host_records(hosts, rectype='PTR')
+            metadata['host_record'] = self.__pretty_print_host_records(hosts, rectype=rectype)
 
             zonefilename='/var/named/' + zone
             if self.logger is not None:
-               self.logger.info("generating (reverse) %s" % zonefilename)
+               self.logger.info("generating (%s) %s" % (direction, zonefilename))
             self.templar.render(template_data, metadata, zonefilename, None)
 
+        pool = workerpool.WorkerPool(self.settings.sync_workers, self.logger, self.settings.sync_workers_timeout)
+        pool.map(write_zone_file, zones)
+
 
     def write_dns_files(self):
         """
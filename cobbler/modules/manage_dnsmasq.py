@@ -29,6 +29,7 @@ import sys
 import glob
 import traceback
 import errno
+import threading
 from shlex import shlex
 import utils
 from cexceptions import *
@@ -39,9 +40,143 @@ import item_repo
 import item_system
 from utils import _
 
+ETHERS_FILE = "/etc/ethers"
+HOSTS_FILE  = "/var/lib/cobbler/cobbler_hosts"
+
 def register():
     return "manage"
 
+def ethers_lines(system):
+    """
+    The /etc/ethers lines (MAC to IP, read 'man ethers') of a system.
+    """
+    lines = []
+    if not system.is_management_supported(cidr_ok=False):
+        return lines
+    for (name, interface) in system.interfaces.iteritems():
+        mac = interface["mac_address"]
+        ip  = interface["ip_address"]
+        if mac is None or mac == "":
+            # can't write this w/o a MAC address
+            continue
+        if ip is not None and ip != "":
+            lines.append(mac.upper() + "\t" + ip + "\n")
+    return lines
+
+def hosts_lines(system):
+    """
+    The cobbler_hosts lines (IP to DNS name) of a system.
+    """
+    lines = []
+    if not system.is_management_supported(cidr_ok=False):
+        return lines
+    for (name, interface) in system.interfaces.iteritems():
+        mac  = interface["mac_address"]
+        host = interface["dns_name"]
+        ip   = interface["ip_address"]
+        if mac is None or mac == "":
+            continue
+        if host is not None and host != "" and ip is not None and ip != "":
+            lines.append(ip + "\t" + host + "\n")
+    return lines
+
+class HostsFile:
+    """
+    A file dnsmasq reads host data from, held in memory as the lines of
+    each system so that adding or removing a few systems recomputes only
+    theirs instead of walking every system.  The file is replaced through
+    a rename, so dnsmasq never reads it half written.
+    """
+
+    def __init__(self, path, lines_for):
+        self.path      = path
+        self.lines_for = lines_for
+        self.lock      = threading.Lock()
+        self.lines     = None   # system name -> lines, None until loaded
+        self.systems   = None   # the collection the lines come from
+        self.stamp     = None   # stat of the file as last written
+
+    def regen(self, systems):
+        """
+        Rebuild the file from every system.
+        """
+        self.lock.acquire()
+        try:
+            self.__load(systems)
+            self.__write()
+        finally:
+            self.lock.release()
+
+    def update(self, systems, names, removed=False):
+        """
+        Rewrite the lines of the named systems, or drop them if removed
+        (they may not have left the collection yet).  Falls back to a
+        full rebuild when the file was not written by us, or was changed
+        since.
+        """
+        self.lock.acquire()
+        try:
+            if self.lines is None or self.systems is not systems or self.stamp != self.__stat():
+                self.__load(systems)
+            for name in names:
+                name = name.lower()
+                system = None
+                if not removed:
+                    system = systems.find(name=name)
+                if system is None:
+                    self.lines.pop(name, None)
+                    continue
+                lines = self.lines_for(system)
+                if len(lines) > 0:
+                    self.lines[name] = lines
+                else:
+                    self.lines.pop(name, None)
+            self.__write()
+        finally:
+            self.lock.release()
+
+    def __load(self, systems):
+        self.lines = {}
+        self.systems = systems
+        for system in systems:
+            lines = self.lines_for(system)
+            if len(lines) > 0:
+                self.lines[system.name.lower()] = lines
+
+    def __write(self):
+        names = self.lines.keys()
+        names.sort()
+        tmp = self.path + ".tmp"
+        fh = open(tmp, "w")
+        for name in names:
+            fh.write("".join(self.lines[name]))
+        fh.close()
+        if os.path.exists(self.path):
+            shutil.copymode(self.path, tmp)
+        os.rename(tmp, self.path)
+        self.stamp = self.__stat()
+
+    def __stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime)
+
+# shared by every manager, so the lines are kept from one lite sync to
+# the next
+HOSTS_FILES = {}
+HOSTS_FILES_LOCK = threading.Lock()
+
+def hosts_file(path, lines_for):
+    HOSTS_FILES_LOCK.acquire()
+    try:
+        if not HOSTS_FILES.has_key(path):
+            HOSTS_FILES[path] = HostsFile(path, lines_for)
+        return HOSTS_FILES[path]
+    finally:
+        HOSTS_FILES_LOCK.release()
+
 class DnsmasqManager:
     """
     Handles conversion of internal state to the tftpboot tree layout
@@ -165,37 +300,24 @@ class DnsmasqManager:
     def regen_ethers(self):
         # dnsmasq knows how to read this database of MACs -> IPs, so we'll keep it up to date
         # every time we add a system.
-        # read 'man ethers' for format info
-        fh = open("/etc/ethers","w+")
-        for system in self.systems:
-            if not system.is_management_supported(cidr_ok=False):
-                continue
-            for (name, interface) in system.interfaces.iteritems():
-                mac = interface["mac_address"]
-                ip  = interface["ip_address"]
-                if mac is None or mac == "":
-                    # can't write this w/o a MAC address
-                    continue
-                if ip is not None and ip != "":
-                    fh.write(mac.upper() + "\t" + ip + "\n")
-        fh.close()
+        hosts_file(ETHERS_FILE, ethers_lines).regen(self.systems)
+
+    def update_ethers(self, names, removed=False):
+        """
+        Same as regen_ethers, for when only the named systems changed.
+        """
+        hosts_file(ETHERS_FILE, ethers_lines).update(self.systems, names, removed)
 
     def regen_hosts(self):
         # dnsmasq knows how to read this database for host info
         # (other things may also make use of this later)
-        fh = open("/var/lib/cobbler/cobbler_hosts","w+")
-        for system in self.systems:
-            if not system.is_management_supported(cidr_ok=False):
-                continue
-            for (name, interface) in system.interfaces.iteritems():
-                mac  = interface["mac_address"]
-                host = interface["dns_name"]
-                ip   = interface["ip_address"]
-                if mac is None or mac == "":
-                    continue
-                if host is not None and host != "" and ip is not None and ip != "":
-                    fh.write(ip + "\t" + host + "\n")
-        fh.close()
+        hosts_file(HOSTS_FILE, hosts_lines).regen(self.systems)
+
+    def update_hosts(self, names, removed=False):
+        """
+        Same as regen_hosts, for when only the named systems changed.
+        """
+        hosts_file(HOSTS_FILE, hosts_lines).update(self.systems, names, removed)
 
     def write_dns_files(self):
         # already taken care of by the regen_hosts()
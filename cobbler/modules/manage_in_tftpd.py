@@ -18,6 +18,7 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 """
 
 import os.path, traceback, errno
+import time
 import re
 import clogger
 import pxegen
@@ -54,6 +55,7 @@ class InTftpdManager:
         self.settings_file = "/etc/xinetd.d/tftp"
         self.pxegen        = pxegen.PXEGen(config, self.logger)
         self.systems       = config.systems()
+        self.settings      = config.settings()
         self.bootloc       = utils.tftpboot_location()
 
     def regen_hosts(self):
@@ -84,6 +86,8 @@ class InTftpdManager:
             file_dst = templater.render(file,metadata,None)
             try:
                 shutil.copyfile(target["boot_files"][file], file_dst)
+                # so an incremental sync removes it with the distro
+                self.pxegen.keep_file(file_dst)
                 self.config.api.log("copied file %s to %s for %s" % (
                         target["boot_files"][file],
                         file_dst,
@@ -179,8 +183,9 @@ class InTftpdManager:
 
         # the actual pxelinux.cfg files, for each interface
         self.logger.info("generating PXE configuration files")
-        for x in self.systems:
-            self.pxegen.write_all_system_files(x)
+        start = time.time()
+        count = self.pxegen.write_systems_files(self.systems)
+        self.logger.info("generated PXE files for %s systems in %.2f seconds (%s workers)" % (count, time.time() - start, self.settings.sync_workers))
 
         self.logger.info("generating PXE menu structure")
         self.pxegen.make_pxe_menu()
@@ -36,6 +36,7 @@ from shlex import shlex
 import utils
 from cexceptions import *
 import templar
+import workerpool
 
 import item_distro
 import item_profile
@@ -44,6 +45,9 @@ import item_system
 
 from utils import _
 
+ELILO  = "/elilo-3.6-ia64.efi"
+YABOOT = "/yaboot-1.3.14"
+
 
 def register():
    """
@@ -79,7 +83,6 @@ class IscManager:
         """
 
         template_file = "/etc/cobbler/dhcp.template"
-        blender_cache = {}
 
         try:
             f2 = open(template_file,"r")
@@ -96,45 +99,15 @@ class IscManager:
         # we used to just loop through each system, but now we must loop
         # through each network interface of each system.
         dhcp_tags = { "default": {} }
-        elilo = "/elilo-3.6-ia64.efi"
-        yaboot = "/yaboot-1.3.14"
-
-        for system in self.systems:
-            if not system.is_management_supported(cidr_ok=False):
-                continue
-
-            profile = system.get_conceptual_parent()
-            distro  = profile.get_conceptual_parent()
 
-            # if distro is None then the profile is really an image
-            # record!
-
-            for (name, interface) in system.interfaces.iteritems():
-
-                # this is really not a per-interface setting
-                # but we do this to make the templates work
-                # without upgrade
-                interface["gateway"] = system.gateway
-
-                mac  = interface["mac_address"]
-                if interface["interface_type"] in ("slave","bond_slave","bridge_slave"):
-                    if interface["interface_master"] not in system.interfaces:
-                        # Can't write DHCP entry; master interface does not
-                        # exist
-                        continue
-                    ip = system.interfaces[interface["interface_master"]]["ip_address"]
-                    interface["ip_address"] = ip
-                    host = system.interfaces[interface["interface_master"]]["dns_name"]
-                else:
-                    ip   = interface["ip_address"]
-                    host = interface["dns_name"]
+        # the per system work (mostly blending) is spread over the sync
+        # workers, naming and grouping is done here, in system order, so
+        # the output does not depend on the number of workers.
+        pool = workerpool.WorkerPool(self.settings.sync_workers, self.logger, self.settings.sync_workers_timeout)
+        (results, done) = pool.map(self.__system_interfaces, self.systems)
 
-                if distro is not None:
-                    interface["distro"]  = distro.to_datastruct()
-
-                if mac is None or mac == "":
-                    # can't write a DHCP entry for this system
-                    continue
+        for entries in results:
+            for (name, host, mac, interface) in entries:
 
                 counter = counter + 1
 
@@ -147,26 +120,6 @@ class IscManager:
                 else:
                     interface["name"] = "generic%d" % counter
 
-                # add references to the system, profile, and distro
-                # for use in the template
-                if blender_cache.has_key(system.name):
-                    blended_system = blender_cache[system.name]
-                else:
-                    blended_system  = utils.blender( self.api, False, system )
-                    blender_cache[system.name] = blended_system
-
-                interface["next_server"] = blended_system["server"]
-                interface["netboot_enabled"] = blended_system["netboot_enabled"]
-                interface["hostname"] = blended_system["hostname"]
-
-                interface["filename"] = "/pxelinux.0"
-                # can't use pxelinux.0 anymore
-                if distro is not None:
-                    if distro.arch == "ia64":
-                        interface["filename"] = elilo
-                    elif distro.arch.startswith("ppc"):
-                        interface["filename"] = yaboot
-
                 dhcp_tag = interface["dhcp_tag"]
                 if dhcp_tag == "":
                    dhcp_tag = "default"
@@ -184,8 +137,8 @@ class IscManager:
            "date"           : time.asctime(time.gmtime()),
            "cobbler_server" : self.settings.server,
            "next_server"    : self.settings.next_server,
-           "elilo"          : elilo,
-           "yaboot"         : yaboot,
+           "elilo"          : ELILO,
+           "yaboot"         : YABOOT,
            "dhcp_tags"      : dhcp_tags
         }
 
@@ -193,6 +146,71 @@ class IscManager:
             self.logger.info("generating %s" % self.settings_file)
         self.templar.render(template_data, metadata, self.settings_file, None)
 
+    def __system_interfaces(self, system):
+        """
+        Returns a list of (name, host, mac, interface) for the interfaces
+        of system that get a DHCP entry.
+        """
+        entries = []
+        if not system.is_management_supported(cidr_ok=False):
+            return entries
+
+        profile = system.get_conceptual_parent()
+        distro  = profile.get_conceptual_parent()
+
+        # if distro is None then the profile is really an image
+        # record!
+
+        blended_system = None
+
+        for (name, interface) in system.interfaces.iteritems():
+
+            # this is really not a per-interface setting
+            # but we do this to make the templates work
+            # without upgrade
+            interface["gateway"] = system.gateway
+
+            mac  = interface["mac_address"]
+            if interface["interface_type"] in ("slave","bond_slave","bridge_slave"):
+                if interface["interface_master"] not in system.interfaces:
+                    # Can't write DHCP entry; master interface does not
+                    # exist
+                    continue
+                ip = system.interfaces[interface["interface_master"]]["ip_address"]
+                interface["ip_address"] = ip
+                host = system.interfaces[interface["interface_master"]]["dns_name"]
+            else:
+                ip   = interface["ip_address"]
+                host = interface["dns_name"]
+
+            if distro is not None:
+                interface["distro"]  = distro.to_datastruct()
+
+            if mac is None or mac == "":
+                # can't write a DHCP entry for this system
+                continue
+
+            # add references to the system, profile, and distro
+            # for use in the template
+            if blended_system is None:
+                blended_system  = utils.blender( self.api, False, system )
+
+            interface["next_server"] = blended_system["server"]
+            interface["netboot_enabled"] = blended_system["netboot_enabled"]
+            interface["hostname"] = blended_system["hostname"]
+
+            interface["filename"] = "/pxelinux.0"
+            # can't use pxelinux.0 anymore
+            if distro is not None:
+                if distro.arch == "ia64":
+                    interface["filename"] = ELILO
+                elif distro.arch.startswith("ppc"):
+                    interface["filename"] = YABOOT
+
+            entries.append((name, host, mac, interface))
+
+        return entries
+
     def regen_ethers(self):
         pass # ISC/BIND do not use this
 
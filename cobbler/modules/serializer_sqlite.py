@@ -0,0 +1,280 @@
+"""
+Serializer code for cobbler.
+Stores every object as a row in a single SQLite database file
+(/var/lib/cobbler/cobbler.db) instead of one file per object, so that
+loading a large installation is one query rather than thousands of
+open/parse calls.  Rows hold the JSON datastruct along with the indexed
+collection, name and mtime columns, and a small JSON header with the
+fields the collection indexes, so that lazy loading reads only those.  The database is kept in WAL mode
+and every write is its own transaction.
+
+On first use for a collection the contents of the serializer_catalog
+directories (/var/lib/cobbler/config/*.d) are imported, the files
+themselves are left in place.
+
+To use it, list the collections in the [serializers] section of
+/etc/cobbler/modules.conf, ex: "system = serializer_sqlite".
+
+Copyright 2006-2009, Red Hat, Inc
+Michael DeHaan <mdehaan@redhat.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+02110-1301  USA
+"""
+
+import distutils.sysconfig
+import os
+import sys
+import yaml # PyYAML
+import simplejson
+import exceptions
+
+plib = distutils.sysconfig.get_python_lib()
+mod_path="%s/cobbler" % plib
+sys.path.insert(0, mod_path)
+
+from utils import _
+import utils
+from cexceptions import *
+
+sqlite_loaded = False
+
+try:
+    import sqlite3 as sqlite
+    sqlite_loaded = True
+except ImportError:
+    try:
+        from pysqlite2 import dbapi2 as sqlite
+        sqlite_loaded = True
+    except ImportError:
+        # FIXME: log message
+        pass
+
+DB_FILE = "/var/lib/cobbler/cobbler.db"
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS objects (
+           collection TEXT NOT NULL,
+           name       TEXT NOT NULL,
+           mtime      REAL NOT NULL DEFAULT 0,
+           data       TEXT NOT NULL,
+           header     TEXT,
+           PRIMARY KEY (collection, name)
+       )""",
+    "CREATE INDEX IF NOT EXISTS objects_mtime ON objects (collection, mtime)",
+    "CREATE TABLE IF NOT EXISTS migrations (collection TEXT PRIMARY KEY)",
+]
+
+# one connection per process, reopened after a fork
+__connection = None
+__connection_key = None
+
+def register():
+    """
+    The mandatory cobbler module registration hook.
+    """
+    if not sqlite_loaded:
+        return ""
+    return "serializer"
+
+def what():
+    """
+    Module identification function
+    """
+    return "serializer/sqlite"
+
+def __connect():
+    global __connection, __connection_key
+    if __connection is not None and __connection_key == (os.getpid(), DB_FILE):
+        return __connection
+    conn = sqlite.connect(DB_FILE, timeout=30)
+    conn.text_factory = str
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    # databases created before the header column, their headers are
+    # filled in by deserialize_headers
+    columns = [ row[1] for row in conn.execute("PRAGMA table_info(objects)") ]
+    if "header" not in columns:
+        conn.execute("ALTER TABLE objects ADD COLUMN header TEXT")
+    conn.commit()
+    __connection = conn
+    __connection_key = (os.getpid(), DB_FILE)
+    return conn
+
+def __row(collection_type, datastruct, fields=None):
+    header = None
+    if fields is not None:
+        header = __header(datastruct, fields)
+    return (collection_type, datastruct["name"], datastruct.get("mtime", 0) or 0,
+            simplejson.dumps(datastruct, encoding="utf-8"), header)
+
+def __header(datastruct, fields):
+    """
+    The header column: the fields it was made for, and their values.
+    """
+    return simplejson.dumps({ "fields" : fields, "header" : utils.datastruct_header(datastruct, fields) }, encoding="utf-8")
+
+def __fields(obj):
+    return list(getattr(obj, "INDEXED_FIELDS", []))
+
+def __load(data):
+    return simplejson.loads(data, encoding="utf-8")
+
+def __write(statement, rows):
+    """
+    Run a write statement over a list of rows in a single transaction.
+    """
+    conn = __connect()
+    try:
+        conn.executemany(statement, rows)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    return True
+
+def migrate_from_catalog(collection_type):
+    """
+    One shot import of the serializer_catalog files for a collection.
+    Runs once per collection; after that the database is authoritative,
+    even if the collection is emptied later.
+    """
+    conn = __connect()
+    cur = conn.execute("SELECT 1 FROM migrations WHERE collection = ?", (collection_type,))
+    if cur.fetchone() is not None:
+        return False
+    try:
+        # claimed first: this takes the database write lock, so another
+        # process migrating at the same time waits for this one and then
+        # finds the collection already done
+        cur = conn.execute("INSERT OR IGNORE INTO migrations (collection) VALUES (?)", (collection_type,))
+        if cur.rowcount == 0:
+            conn.rollback()
+            return False
+        import serializer_catalog
+        datastructs = serializer_catalog.deserialize_raw(collection_type) or []
+        rows = [__row(collection_type, ds) for ds in datastructs]
+        conn.executemany("INSERT OR IGNORE INTO objects (collection, name, mtime, data, header) VALUES (?,?,?,?,?)", rows)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    if len(rows) > 0:
+        sys.stderr.write("imported %s %s objects from the catalog into %s\n" % (len(rows), collection_type, DB_FILE))
+    return True
+
+def serialize_item(obj, item):
+    if item.name is None or item.name == "":
+       raise exceptions.RuntimeError("name unset for object!")
+    return __write("INSERT OR REPLACE INTO objects (collection, name, mtime, data, header) VALUES (?,?,?,?,?)",
+                   [__row(obj.collection_type(), item.to_datastruct(), __fields(obj))])
+
+def serialize_delete(obj, item):
+    return __write("DELETE FROM objects WHERE collection = ? AND name = ?",
+                   [(obj.collection_type(), item.name)])
+
+def serialize_items(obj, items):
+    for item in items:
+        if item.name is None or item.name == "":
+           raise exceptions.RuntimeError("name unset for object!")
+    return __write("INSERT OR REPLACE INTO objects (collection, name, mtime, data, header) VALUES (?,?,?,?,?)",
+                   [__row(obj.collection_type(), x.to_datastruct(), __fields(obj)) for x in items])
+
+def serialize_deletes(obj, items):
+    return __write("DELETE FROM objects WHERE collection = ? AND name = ?",
+                   [(obj.collection_type(), x.name) for x in items])
+
+def serialize(obj):
+    """
+    Save a whole collection in one transaction.
+    This should NOT be used by API if serialize_item is available.
+    """
+    ctype = obj.collection_type()
+    if ctype == "settings":
+        return True
+    return __write("INSERT OR REPLACE INTO objects (collection, name, mtime, data, header) VALUES (?,?,?,?,?)",
+                   [__row(ctype, x.to_datastruct(), __fields(obj)) for x in obj])
+
+def deserialize_item_raw(collection_type, item_name):
+    migrate_from_catalog(collection_type)
+    cur = __connect().execute("SELECT data FROM objects WHERE collection = ? AND name = ?",
+                              (collection_type, item_name))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return __load(row[0])
+
+def deserialize_raw(collection_type):
+    if collection_type == "settings":
+         fd = open("/etc/cobbler/settings")
+         datastruct = yaml.load(fd.read())
+         fd.close()
+         return datastruct
+    migrate_from_catalog(collection_type)
+    cur = __connect().execute("SELECT data FROM objects WHERE collection = ?", (collection_type,))
+    return [__load(row[0]) for row in cur]
+
+def deserialize_headers(collection_type, fields):
+    """
+    Name, mtime and the given fields of every object, from the header
+    column.  Rows without a header for these fields (written before the
+    column existed, or for other fields) are parsed once and their
+    header is stored for the next time.
+    """
+    migrate_from_catalog(collection_type)
+    conn = __connect()
+    fields = list(fields)
+    headers = []
+    missing = []
+    for (name, header) in conn.execute("SELECT name, header FROM objects WHERE collection = ?", (collection_type,)):
+        if header is not None:
+            header = __load(header)
+            if header["fields"] == fields:
+                headers.append(header["header"])
+                continue
+        missing.append(name)
+    updates = []
+    for name in missing:
+        row = conn.execute("SELECT data FROM objects WHERE collection = ? AND name = ?",
+                           (collection_type, name)).fetchone()
+        if row is None:
+            continue
+        datastruct = __load(row[0])
+        headers.append(utils.datastruct_header(datastruct, fields))
+        updates.append((__header(datastruct, fields), collection_type, name))
+    if len(updates) > 0:
+        __write("UPDATE objects SET header = ? WHERE collection = ? AND name = ?", updates)
+    return headers
+
+def deserialize(obj,topological=True):
+    """
+    Populate an existing object with the contents of datastruct.
+    Object must "implement" Serializable.
+    """
+    datastruct = deserialize_raw(obj.collection_type())
+    if topological and type(datastruct) == list:
+       datastruct.sort(__depth_cmp)
+    obj.from_datastruct(datastruct)
+    return True
+
+def __depth_cmp(item1, item2):
+    d1 = item1.get("depth",1)
+    d2 = item2.get("depth",1)
+    return cmp(d1,d2)
+
+if __name__ == "__main__":
+    print deserialize_item_raw("distro","D1")
@@ -40,6 +40,7 @@ import socket
 import utils
 from cexceptions import *
 import templar 
+import workerpool
 
 import item_distro
 import item_profile
@@ -72,6 +73,29 @@ class PXEGen:
         self.bootloc     = utils.tftpboot_location()
         # FIXME: not used anymore, can remove?
         self.verbose     = False
+        # set during a sync, see sync_manifest.py
+        self.manifest    = None
+
+    def set_manifest(self, manifest):
+        """
+        Route the files written by this object (and its templar) through
+        a sync manifest, or back to plain writes if manifest is None.
+        """
+        self.manifest = manifest
+        self.templar.manifest = manifest
+
+    def write_file(self, filename, data):
+        if self.manifest is not None:
+            return self.manifest.write_file(filename, data)
+        self.logger.info("generating: %s" % filename)
+        fd = open(filename, "w")
+        fd.write(data)
+        fd.close()
+        return True
+
+    def keep_file(self, filename):
+        if self.manifest is not None:
+            self.manifest.keep(filename)
 
     def copy_bootloaders(self):
         """
@@ -162,12 +186,14 @@ class PXEGen:
             dst1 = os.path.join(distro_dir, b_kernel)
             utils.linkfile(kernel, dst1, symlink_ok=symlink_ok, 
                     api=self.api, logger=self.logger)
+            self.keep_file(dst1)
 
         if not utils.file_is_remote(initrd):
             b_initrd = os.path.basename(initrd)
             dst2 = os.path.join(distro_dir, b_initrd)
             utils.linkfile(initrd, dst2, symlink_ok=symlink_ok, 
                     api=self.api, logger=self.logger)
+            self.keep_file(dst2)
 
     def copy_single_image_files(self, img):
         images_dir = os.path.join(self.bootloc, "images2")
@@ -182,6 +208,23 @@ class PXEGen:
         utils.linkfile(filename, newfile, api=self.api, logger=self.logger)
         return True
 
+    def write_systems_files(self, systems):
+        """
+        write_all_system_files() for each of the systems, spread over
+        the number of processes given by the sync_workers setting.
+        """
+        pool = workerpool.WorkerPool(self.settings.sync_workers, self.logger, self.settings.sync_workers_timeout)
+        child_init = None
+        child_done = None
+        if self.manifest is not None:
+            child_init = self.manifest.start_worker
+            child_done = self.manifest.changes
+        (results, done) = pool.map(self.write_all_system_files, systems, child_init, child_done)
+        if self.manifest is not None:
+            for changes in done:
+                self.manifest.merge(changes)
+        return len(results)
+
     def write_all_system_files(self, system):
 
         profile = system.get_conceptual_parent()
@@ -274,6 +317,7 @@ class PXEGen:
                 if os.path.lexists(f3):
                     utils.rmfile(f3)
                 os.symlink("../yaboot", f3)
+                self.keep_file(f3)
             else:
                 continue 
 
@@ -305,13 +349,13 @@ class PXEGen:
            return cmp(a.name,b.name)
         profile_list.sort(sort_name)
         image_list.sort(sort_name)
-        listfile = open(os.path.join(s390path, "profile_list"),"w+")
+        listfile = ""
         for profile in profile_list:
             distro = profile.get_conceptual_parent()
             if distro is None:
                 raise CX("profile is missing distribution: %s, %s" % (profile.name, profile.distro))
             if distro.arch.startswith("s390"):
-                listfile.write("%s\n" % profile.name)
+                listfile = listfile + "%s\n" % profile.name
                 f2 = os.path.join(self.bootloc, "s390x", "p_%s" % profile.name)
                 self.write_pxe_file(f2,None,profile,distro,distro.arch)
                 cf = "%s_conf" % f2
@@ -331,7 +375,7 @@ class PXEGen:
                 blended["kernel_options"] = hkopts
                 self.templar.render(template_pf, blended, pf)
 
-        listfile.close()
+        self.write_file(os.path.join(s390path, "profile_list"), listfile)
 
     def make_actual_pxe_menu(self):
         """
@@ -630,10 +674,7 @@ class PXEGen:
         # save file and/or return results, depending on how called.
         buffer = self.templar.render(template_data, metadata, None)
         if filename is not None:
-            self.logger.info("generating: %s" % filename)
-            fd = open(filename, "w")
-            fd.write(buffer)
-            fd.close()
+            self.write_file(filename, buffer)
         return buffer
 
     def build_kernel_options(self, system, profile, distro, image, arch,
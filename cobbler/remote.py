@@ -21,6 +21,14 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 """
 
 import sys, socket, time, os, errno, re, random, stat, string
+import select
+import Queue
+import zlib
+import struct
+import urlparse
+import urllib
+import cgi
+import simplejson
 import base64
 import SimpleXMLRPCServer
 from SocketServer import ThreadingMixIn
@@ -34,6 +42,7 @@ try:
 except:
     import sub_process as subprocess
 from threading import Thread
+import threading
 
 import api as cobbler_api
 import utils
@@ -52,12 +61,29 @@ import utils
 #from utils import * # BAD!
 from utils import _
 import configgen
+import expirycache
+import lrucache
+import logupload
+
+msgpack_loaded = False
+try:
+    import msgpack
+    msgpack_loaded = True
+except ImportError:
+    pass
 
 # FIXME: make configurable?
 TOKEN_TIMEOUT = 60*60 # 60 minutes
 EVENT_TIMEOUT = 7*24*60*60 # 1 week
 CACHE_TIMEOUT = 10*60 # 10 minutes
 
+# most entries kept in each of the above caches, the ones closest to
+# expiring are dropped first
+TOKEN_CACHE_SIZE  = 10000
+EVENT_CACHE_SIZE  = 10000
+OBJECT_CACHE_SIZE = 10000
+REAPER_INTERVAL   = 60
+
 # task codes
 EVENT_RUNNING   = "running"
 EVENT_COMPLETE  = "complete"
@@ -117,10 +143,13 @@ class CobblerXMLRPCInterface:
         """
         self.api = api
         self.logger = self.api.logger
-        self.token_cache = {}
-        self.object_cache = {}
+        self.token_cache = expirycache.ExpiryCache(TOKEN_TIMEOUT, TOKEN_CACHE_SIZE)
+        self.object_cache = expirycache.ExpiryCache(CACHE_TIMEOUT, OBJECT_CACHE_SIZE)
         self.timestamp = self.api.last_modified_time()
-        self.events = {}
+        self.events = expirycache.ExpiryCache(EVENT_TIMEOUT, EVENT_CACHE_SIZE)
+        self.reaper = expirycache.Reaper([ self.token_cache, self.object_cache, self.events ], REAPER_INTERVAL)
+        self.reaper.start()
+        self.anamon_systems = lrucache.LRUCache(1000)
         self.shared_secret = utils.get_shared_secret()
         random.seed(time.time())
         self.translator = utils.Translator(keep=string.printable)
@@ -184,7 +213,7 @@ class CobblerXMLRPCInterface:
 
     def background_sync(self, options, token):
         def runner(self):
-            return self.remote.api.sync(self.options.get("verbose",False),logger=self.logger)
+            return self.remote.api.sync(self.options.get("verbose",False),logger=self.logger,incremental=self.options.get("incremental",None))
         return self.__start_task(runner, token, "sync", "Sync", options) 
 
     def background_hardlink(self, options, token):
@@ -240,22 +269,35 @@ class CobblerXMLRPCInterface:
             if only is not None:
                 repos = [ only ] 
             nofail = options.get("nofail", len(repos) > 0)
+            force = options.get("force", False)
 
             if len(repos) > 0:
                 for name in repos:
                     self.remote.api.reposync(tries=self.options.get("tries",
-                        3), name=name, nofail=nofail, logger=self.logger)
+                        3), name=name, nofail=nofail, logger=self.logger, force=force)
             else:
                 self.remote.api.reposync(tries=self.options.get("tries",3),
-                        name=None, nofail=nofail, logger=self.logger)
+                        name=None, nofail=nofail, logger=self.logger, force=force)
             return True
         return self.__start_task(runner, token, "reposync", "Reposync", options)
 
     def background_power_system(self, options, token):
         def runner(self):
+            power = self.options.get("power","")
+            if power not in [ "on", "off", "status", "reboot" ]:
+                utils.die(self.logger, "invalid power mode '%s', expected on/off/status/reboot" % power)
+            systems = []
             for x in self.options.get("systems",[]):
-                object_id = self.remote.get_system_handle(x,token)
-                self.remote.power_system(object_id,self.options.get("power",""),token,logger=self.logger)
+                obj = self.remote.api.find_system(x)
+                if obj is None:
+                    utils.die(self.logger, "unknown system name %s" % x)
+                self.remote.check_access(token, "power_system", obj)
+                systems.append(obj)
+            # all systems are tried, the task fails if any of them did
+            results = self.remote.api.power_systems(systems, power, logger=self.logger)
+            failed = [ r["name"] for r in results if not r["ok"] ]
+            if len(failed) > 0:
+                utils.die(self.logger, "power %s failed for: %s" % (power, ", ".join(failed)))
             return True
         self.check_access(token, "power")
         return self.__start_task(runner, token, "power", "Power management (%s)" % options.get("power",""), options)
@@ -282,7 +324,8 @@ class CobblerXMLRPCInterface:
                if for_user in x[3]:
                   pass
                else:
-                  self.events[k][3].append(for_user)
+                  # the event itself, it may be reaped meanwhile
+                  x[3].append(for_user)
 
         return self.events_filtered
 
@@ -343,9 +386,11 @@ class CobblerXMLRPCInterface:
 
     def _set_task_state(self,thread_obj,event_id,new_state):
         event_id = str(event_id)
-        if self.events.has_key(event_id):
-            self.events[event_id][2] = new_state
-            self.events[event_id][3] = [] # clear the list of who has read it
+        # looked up once, the reaper may drop it meanwhile
+        event = self.events.get(event_id)
+        if event is not None:
+            event[2] = new_state
+            event[3] = [] # clear the list of who has read it
         if thread_obj is not None:
             if new_state == EVENT_COMPLETE: 
                 thread_obj.logger.info("### TASK COMPLETE ###")
@@ -354,8 +399,9 @@ class CobblerXMLRPCInterface:
 
     def get_task_status(self, event_id):
         event_id = str(event_id)
-        if self.events.has_key(event_id):
-            return self.events[event_id]
+        event = self.events.get(event_id)
+        if event is not None:
+            return event
         else:
             raise CX("no event with that id")
 
@@ -391,10 +437,11 @@ class CobblerXMLRPCInterface:
         Given a token returned from login, return the username
         that logged in with it.
         """
-        if not self.token_cache.has_key(token):
+        entry = self.token_cache.get(token)
+        if entry is None:
             raise CX("invalid token: %s" % token)
         else:
-            return self.token_cache[token][1]
+            return entry[1]
 
     def _log(self,msg,user=None,token=None,name=None,object_id=None,attribute=None,debug=False,error=False):
         """
@@ -452,11 +499,13 @@ class CobblerXMLRPCInterface:
             sortdata.sort()
         return [x for (key, x) in sortdata]
             
-    def __paginate(self,data,page=None,items_per_page=None,token=None):
+    def __page_bounds(self,num_items,page=None,items_per_page=None):
         """
         Helper function to support returning parts of a selection, for
         example, for use in a web app where only a part of the results
-        are to be presented on each screen.
+        are to be presented on each screen.  Returns the (start, end)
+        positions of the page in a selection of num_items items, and
+        the page information for the caller.
         """
         default_page = 1
         default_items_per_page = 25
@@ -474,7 +523,6 @@ class CobblerXMLRPCInterface:
         except:
             items_per_page = default_items_per_page
 
-        num_items = len(data)
         num_pages = ((num_items-1)/items_per_page)+1
         if num_pages==0:
             num_pages=1
@@ -486,7 +534,6 @@ class CobblerXMLRPCInterface:
             start_item = num_items - 1
         if end_item > num_items:
             end_item = num_items
-        data = data[start_item:end_item]
 
         if page > 1:
             prev_page = page - 1
@@ -497,7 +544,7 @@ class CobblerXMLRPCInterface:
         else:
             next_page = None
                         
-        return (data,{
+        return (start_item,end_item,{
                 'page'        : page,
                 'prev_page'   : prev_page,
                 'next_page'   : next_page,
@@ -551,15 +598,27 @@ class CobblerXMLRPCInterface:
     def get_file(self,name,flatten=False,token=None,**rest):
         return self.get_file("file",name,flatten=flatten)
 
-    def get_items(self, what):
+    def get_items(self, what, fields=None):
         """
         Returns a list of hashes.  
         what is the name of a cobbler object type, as described for get_item.
         Individual list elements are the same for get_item.
+        If fields is a list of keys, only those are returned for each item.
         """
-        # FIXME: is the xmlrpc_hacks method still required ?
-        item = [x.to_datastruct() for x in self.api.get_items(what)]
-        return self.xmlrpc_hacks(item)
+        return [x for x in self._iter_items(what, fields)]
+
+    def _iter_items(self, what, fields=None):
+        """
+        Yields the hashes of get_items one at a time, so that a listing
+        can be sent while it is built (see do_read_api).  Objects removed
+        while this runs are skipped.
+        """
+        collection = self.api.get_items(what)
+        for name in collection.listing.keys():
+            obj = collection.get(name)
+            if obj is not None:
+                # FIXME: is the xmlrpc_hacks method still required ?
+                yield self.xmlrpc_hacks(utils.to_datastruct_from_fields(obj, obj.get_fields(), keys=fields))
 
     def get_item_names(self, what):
         """
@@ -568,22 +627,22 @@ class CobblerXMLRPCInterface:
         """
         return [x.name for x in self.api.get_items(what)]
 
-    def get_distros(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("distro")
-    def get_profiles(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("profile")
-    def get_systems(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("system")
-    def get_repos(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("repo")
-    def get_images(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("image")
-    def get_mgmtclasses(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("mgmtclass")
-    def get_packages(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("package")
-    def get_files(self,page=None,results_per_page=None,token=None,**rest):
-        return self.get_items("file")
+    def get_distros(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("distro",fields)
+    def get_profiles(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("profile",fields)
+    def get_systems(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("system",fields)
+    def get_repos(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("repo",fields)
+    def get_images(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("image",fields)
+    def get_mgmtclasses(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("mgmtclass",fields)
+    def get_packages(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("package",fields)
+    def get_files(self,page=None,results_per_page=None,token=None,fields=None,**rest):
+        return self.get_items("file",fields)
 
     def find_items(self, what, criteria=None,sort_field=None,expand=True):
         """
@@ -618,18 +677,42 @@ class CobblerXMLRPCInterface:
     def find_file(self,criteria={},expand=False,token=None,**rest):
         return self.find_items("file",criteria,expand=expand)
 
-    def find_items_paged(self, what, criteria=None, sort_field=None, page=None, items_per_page=None, token=None):
+    def find_items_paged(self, what, criteria=None, sort_field=None, page=None, items_per_page=None, token=None, fields=None):
         """
         Returns a list of hashes as with find_items but additionally supports
         returning just a portion of the total list, for instance in supporting
         a web app that wants to show a limited amount of items per page.
+        If fields is a list of keys, only those are returned for each item.
+
+        The order comes from a sorted view kept by the collection, so only
+        the items on the page are turned into hashes.  With criteria, the
+        matches are found as find_items does: through the indexes for
+        exact matches on indexed fields (ex: mac_address), else by walking
+        every object; only the matches are then sorted.
         """
         # FIXME: make token required for all logging calls
         self._log("find_items_paged(%s); criteria(%s); sort(%s)" % (what,criteria,sort_field), token=token)
-        items = self.api.find_items(what,criteria=criteria)
-        items = self.__sort(items,sort_field)
-        (items,pageinfo) = self.__paginate(items,page,items_per_page)
-        items = [x.to_datastruct() for x in items]
+        collection = self.api.get_items(what)
+        sort_rev = False
+        if sort_field is None or sort_field == "":
+            sort_field = "name"
+        elif sort_field.startswith("!"):
+            sort_field = sort_field[1:]
+            sort_rev = True
+        if criteria:
+            matches = [ x.name for x in self.api.find_items(what,criteria=criteria) ]
+            (count,names) = collection.sorted_names(sort_field,reverse=sort_rev,names=matches)
+            (start_item,end_item,pageinfo) = self.__page_bounds(count,page,items_per_page)
+            names = names[start_item:end_item]
+        else:
+            (start_item,end_item,pageinfo) = self.__page_bounds(len(collection),page,items_per_page)
+            (count,names) = collection.sorted_names(sort_field,start_item,end_item,reverse=sort_rev)
+
+        items = []
+        for name in names:
+            obj = collection.get(name)
+            if obj is not None:
+                items.append(utils.to_datastruct_from_fields(obj, obj.get_fields(), keys=fields))
         return self.xmlrpc_hacks({
             'items'    : items,
             'pageinfo' : pageinfo
@@ -954,6 +1037,149 @@ class CobblerXMLRPCInterface:
     def save_file(self,object_id,token,editmode="bypass"):
         return self.save_item("file",object_id,token,editmode=editmode)
 
+    def __set_system_attributes(self,obj,attributes):
+        """
+        Applies a hash of fields to a system, as xapi_object_edit does.
+        Interface fields apply to attributes["interface"] (default eth0),
+        or can be given per interface as {"interfaces":{"eth0":{...}}}.
+        """
+        imods = {}
+        for (k,v) in attributes.iteritems():
+            if k in [ "interface", "interfaces", "clobber" ]:
+                continue
+            if self.__is_interface_field(k):
+                imods["%s-%s" % (k, attributes.get("interface","eth0"))] = v
+                continue
+            method = obj.remote_methods().get(REMAP_COMPAT.get(k,k), None)
+            if method is not None:
+                method(v)
+        for (iname,fields) in attributes.get("interfaces",{}).iteritems():
+            for (k,v) in fields.iteritems():
+                imods["%s-%s" % (k, iname)] = v
+        if len(imods) > 0:
+            obj.modify_interface(imods)
+
+    def __batch_results(self,names,errors):
+        results = []
+        for (name,error) in zip(names,errors):
+            if error is None:
+                results.append({ "name" : name, "ok" : True, "error" : "" })
+            else:
+                results.append({ "name" : name, "ok" : False, "error" : error })
+        return results
+
+    def __save_systems(self,what,objs,errors,token,check_for_duplicate_names):
+        """
+        Common end of new_systems and modify_systems: authorize each
+        system for the user behind token, then save those without
+        errors in one batch.
+        """
+        user = self.get_user_from_token(token)
+        for k in range(0, len(objs)):
+            if errors[k] is None and user != "<DIRECT>" and not self.api.authorize(user,what,objs[k]):
+                errors[k] = "authorization failure for user %s" % user
+        pending = [ k for k in range(0, len(objs)) if errors[k] is None ]
+        # the setters only check the MACs, IPs and DNS names against the
+        # saved systems, the batch checks them against each other too
+        saved = self.api.add_items("system", [ objs[k] for k in pending ], check_for_duplicate_names=check_for_duplicate_names, check_for_duplicate_netinfo=True)
+        for (k,error) in zip(pending,saved):
+            errors[k] = error
+        return errors
+
+    def new_systems(self,systems,token):
+        """
+        Creates and saves many systems in one call, each given as the
+        hash of fields xapi_object_edit takes for "add".  The token is
+        checked once, the systems are saved together and the lite sync
+        (PXE files, DHCP/DNS host lists) runs once for the whole batch.
+        Returns, in order, {"name","ok","error"} for each system.
+        """
+        self._log("new_systems (%s systems)" % len(systems),token=token)
+        self.check_access(token,"new_system")
+        names = []
+        objs = []
+        errors = []
+        seen = {}
+        for attributes in systems:
+            name = attributes.get("name","")
+            names.append(name)
+            obj = item_system.System(self.api._config)
+            objs.append(obj)
+            try:
+                if seen.has_key(name.lower()):
+                    raise CX("system %s is given more than once" % name)
+                seen[name.lower()] = True
+                if not attributes.has_key("clobber") and self.api.find_system(name) is not None:
+                    raise CX("it seems unwise to overwrite this object, try 'edit'")
+                self.__set_system_attributes(obj,attributes)
+                errors.append(None)
+            except CX, e:
+                errors.append(str(e))
+        errors = self.__save_systems("save_system",objs,errors,token,check_for_duplicate_names=False)
+        return self.__batch_results(names,errors)
+
+    def modify_systems(self,edits,token):
+        """
+        Edits and saves many existing systems in one call.  Each edit is
+        a hash with the "name" of the system and the fields to change;
+        "delete_interface" removes the interface named by "interface".
+        Nothing is changed on a system whose edit fails.  Returns, in
+        order, {"name","ok","error"} for each edit.
+        """
+        self._log("modify_systems (%s systems)" % len(edits),token=token)
+        self.check_access(token,"modify_system")
+        names = []
+        objs = []
+        errors = []
+        seen = {}
+        for attributes in edits:
+            name = attributes.get("name","")
+            names.append(name)
+            found = self.api.find_system(name)
+            if found is None or seen.has_key(name.lower()):
+                objs.append(None)
+                if found is None:
+                    errors.append("internal error, unknown system name %s" % name)
+                else:
+                    errors.append("system %s is given more than once" % name)
+                continue
+            seen[name.lower()] = True
+            # edit a copy, so a failed edit leaves the system untouched
+            obj = found.make_clone()
+            objs.append(obj)
+            try:
+                attributes = attributes.copy()
+                del attributes["name"]
+                if attributes.has_key("delete_interface"):
+                    obj.delete_interface(attributes.get("interface","eth0"))
+                    del attributes["delete_interface"]
+                self.__set_system_attributes(obj,attributes)
+                errors.append(None)
+            except CX, e:
+                errors.append(str(e))
+        errors = self.__save_systems("save_system",objs,errors,token,check_for_duplicate_names=False)
+        return self.__batch_results(names,errors)
+
+    def remove_systems(self,names,token):
+        """
+        Deletes many systems in one call.  Returns, in order,
+        {"name","ok","error"} for each name.
+        """
+        self._log("remove_systems (%s systems)" % len(names),token=token)
+        self.check_access(token,"remove_system")
+        user = self.get_user_from_token(token)
+        errors = []
+        for name in names:
+            if user != "<DIRECT>" and not self.api.authorize(user,"remove_item",name):
+                errors.append("authorization failure for user %s" % user)
+            else:
+                errors.append(None)
+        pending = [ k for k in range(0, len(names)) if errors[k] is None ]
+        removed = self.api.remove_systems([ names[k] for k in pending ])
+        for (k,error) in zip(pending,removed):
+            errors[k] = error
+        return self.__batch_results(names,errors)
+
     def get_kickstart_templates(self,token=None,**rest):
         """
         Returns all of the kickstarts that are in use by the system.
@@ -1168,27 +1394,11 @@ class CobblerXMLRPCInterface:
         upload all sorts of auxilliary data from Anaconda.
         As it's a bit of a potential log-flooder, it's off by default
         and needs to be enabled in /etc/cobbler/settings.
-        """
-
-        self._log("upload_log_data (file: '%s', size: %s, offset: %s)" % (file, size, offset), token=token, name=sys_name)
-
-        # Check if enabled in self.api.settings()
-        if not self.api.settings().anamon_enabled:
-            # feature disabled!
-            return False
-
-        # Find matching system record
-        systems = self.api.systems()
-        obj = systems.find(name=sys_name)
-        if obj == None:
-            # system not found!
-            self._log("upload_log_data - system '%s' not found" % sys_name, token=token, name=sys_name)
-            return False
 
-        return self.__upload_file(sys_name, file, size, offset, data)
+        Kept for older anamon clients, the data has to be base64 encoded
+        here.  Newer ones send it raw with an HTTP PUT to
+        /anamon/<system>/<file>, see CobblerXMLRPCRequestHandler.do_PUT.
 
-    def __upload_file(self, sys_name, file, size, offset, data):
-        '''
         system: the name of the system
         name: the name of the file
         size: size of contents (bytes)
@@ -1197,7 +1407,14 @@ class CobblerXMLRPCInterface:
          files can be uploaded in chunks, if so the size describes
          the chunk rather than the whole file. the offset indicates where
          the chunk belongs
-         the special offset -1 is used to indicate the final chunk'''
+         the special offset -1 is used to indicate the final chunk
+        """
+
+        self._log("upload_log_data (file: '%s', size: %s, offset: %s)" % (file, size, offset), token=token, name=sys_name, debug=True)
+
+        if not self.__anamon_target(sys_name):
+            return False
+
         contents = base64.decodestring(data)
         del data
         if offset != -1:
@@ -1205,63 +1422,40 @@ class CobblerXMLRPCInterface:
                 if size != len(contents): 
                     return False
 
-        #XXX - have an incoming dir and move after upload complete
-        # SECURITY - ensure path remains under uploadpath
-        tt = string.maketrans("/","+")
-        fn = string.translate(file, tt)
-        if fn.startswith('..'):
-            raise CX("invalid filename used: %s" % fn)
+        return logupload.LOG_UPLOADS.write(sys_name, file, offset, contents, size)
 
-        # FIXME ... get the base dir from cobbler settings()
-        udir = "/var/log/cobbler/anamon/%s" % sys_name
-        if not os.path.isdir(udir):
-            os.mkdir(udir, 0755)
-
-        fn = "%s/%s" % (udir, fn)
-        try:
-            st = os.lstat(fn)
-        except OSError, e:
-            if e.errno == errno.ENOENT:
-                pass
-            else:
-                raise
-        else:
-            if not stat.S_ISREG(st.st_mode):
-                raise CX("destination not a file: %s" % fn)
+    def _upload_log_stream(self, sys_name, file, offset, pieces):
+        """
+        Not a remote call: writes the body of an anamon HTTP PUT, an
+        iterator of strings, at offset.  Returns the number of bytes
+        written, or None if uploads are disabled or the system unknown.
+        """
+        if not self.__anamon_target(sys_name):
+            return None
+        return logupload.LOG_UPLOADS.write_stream(sys_name, file, offset, pieces)
 
-        fd = os.open(fn, os.O_RDWR | os.O_CREAT, 0644)
-        # log_error("fd=%r" %fd)
-        try:
-            if offset == 0 or (offset == -1 and size == len(contents)):
-                #truncate file
-                fcntl.lockf(fd, fcntl.LOCK_EX|fcntl.LOCK_NB)
-                try:
-                    os.ftruncate(fd, 0)
-                    # log_error("truncating fd %r to 0" %fd)
-                finally:
-                    fcntl.lockf(fd, fcntl.LOCK_UN)
-            if offset == -1:
-                os.lseek(fd,0,2)
-            else:
-                os.lseek(fd,offset,0)
-            #write contents
-            fcntl.lockf(fd, fcntl.LOCK_EX|fcntl.LOCK_NB, len(contents), 0, 2)
-            try:
-                os.write(fd, contents)
-                # log_error("wrote contents")
-            finally:
-                fcntl.lockf(fd, fcntl.LOCK_UN, len(contents), 0, 2)
-            if offset == -1:
-                if size is not None:
-                    #truncate file
-                    fcntl.lockf(fd, fcntl.LOCK_EX|fcntl.LOCK_NB)
-                    try:
-                        os.ftruncate(fd, size)
-                        # log_error("truncating fd %r to size %r" % (fd,size))
-                    finally:
-                        fcntl.lockf(fd, fcntl.LOCK_UN)
-        finally:
-            os.close(fd)
+    def __anamon_target(self, sys_name):
+        """
+        Whether anamon may upload logs for this system.  Systems found
+        are remembered along with the time of the last modification, so
+        a stream of chunks does not look the system up for each of them,
+        while a system that was removed since is looked up again.
+        """
+        # Check if enabled in self.api.settings()
+        if not self.api.settings().anamon_enabled:
+            # feature disabled!
+            return False
+        stamp = self.api.last_modified_time()
+        if self.anamon_systems.get(sys_name) == stamp:
+            return True
+        # Find matching system record
+        obj = self.api.systems().find(name=sys_name)
+        if obj == None:
+            # system not found!
+            self._log("upload_log_data - system '%s' not found" % sys_name, name=sys_name)
+            self.anamon_systems.pop(sys_name)
+            return False
+        self.anamon_systems.set(sys_name, stamp)
         return True
 
     def run_install_triggers(self,mode,objtype,name,ip,token=None,**rest):
@@ -1303,6 +1497,39 @@ class CobblerXMLRPCInterface:
         self._log("version",token=token)
         return self.api.version(extended=True)
 
+    def get_cache_stats(self,token=None,**rest):
+        """
+        Returns the size and hit/miss counters of the server side caches.
+        See api.py for documentation.  Also has the size and expiry
+        counters of the login tokens, unsaved objects and events kept
+        by this server ("tokens", "objects" and "events"), and the
+        counters of the anamon log uploads ("anamon").
+        """
+        self._log("get_cache_stats",token=token)
+        stats = self.api.get_cache_stats()
+        stats["tokens"]  = self.token_cache.stats()
+        stats["objects"] = self.object_cache.stats()
+        stats["events"]  = self.events.stats()
+        stats["anamon"]  = logupload.LOG_UPLOADS.stats()
+        return self.xmlrpc_hacks(stats)
+
+    def get_xmlrpc_stats(self,token=None,**rest):
+        """
+        Returns the XMLRPC server counters of this process: threads, busy
+        threads, queued and rejected connections, and the number of calls
+        and time spent (total, average, max) per method.
+        """
+        self._log("get_xmlrpc_stats",token=token)
+        return self.xmlrpc_hacks(XMLRPC_STATS.report())
+
+    def get_changes_since(self,revision,token=None,**rest):
+        """
+        Return what was saved or deleted since a revision, a cheaper
+        alternative to the get_*_since calls.  See api.py for documentation.
+        """
+        self._log("get_changes_since",token=token)
+        return self.xmlrpc_hacks(self.api.get_changes_since(revision))
+
     def get_distros_since(self,mtime):
         """
         Return all of the distro objects that have been modified
@@ -1619,24 +1846,14 @@ class CobblerXMLRPCInterface:
     def __invalidate_expired_tokens(self):
         """
         Deletes any login tokens that might have expired.
-        Also removes expired events
-        """
-        timenow = time.time()
-        for token in self.token_cache.keys():
-            (tokentime, user) = self.token_cache[token]
-            if (timenow > tokentime + TOKEN_TIMEOUT):
-                self._log("expiring token",token=token,debug=True)
-                del self.token_cache[token]
-        # and also expired objects
-        for oid in self.object_cache.keys():
-            (tokentime, entry) = self.object_cache[oid]
-            if (timenow > tokentime + CACHE_TIMEOUT):
-                del self.object_cache[oid]
-        for tid in self.events.keys():
-            (eventtime, name, status, who) = self.events[tid]
-            if (timenow > eventtime + EVENT_TIMEOUT):
-                del self.events[tid]
-            # logfile cleanup should be dealt w/ by logrotate
+        Also removes expired events and unsaved objects.  Only the
+        expired entries are looked at, the reaper thread does the same
+        in the background.
+        """
+        self.token_cache.expire()
+        self.object_cache.expire()
+        self.events.expire()
+        # logfile cleanup should be dealt w/ by logrotate
 
     def __validate_user(self,input_user,input_password):
         """
@@ -1662,8 +1879,10 @@ class CobblerXMLRPCInterface:
         """
         self.__invalidate_expired_tokens()
 
-        if self.token_cache.has_key(token):
-            user = self.get_user_from_token(token)
+        # looked up once, the reaper may drop it meanwhile
+        entry = self.token_cache.get(token)
+        if entry is not None:
+            user = entry[1]
             if user == "<system>":
                # system token is only valid over Unix socket
                return False
@@ -1756,8 +1975,7 @@ class CobblerXMLRPCInterface:
         Retires a token ahead of the timeout.
         """
         self._log("logout", token=token)
-        if self.token_cache.has_key(token):
-            del self.token_cache[token]
+        if self.token_cache.pop(token) is not None:
             return True
         return False    
 
@@ -1920,15 +2138,534 @@ class CobblerXMLRPCInterface:
 # *********************************************************************************
 # *********************************************************************************
 
+# content types of the read API, see CobblerXMLRPCRequestHandler.do_read_api
+READ_API_FORMATS = {
+    "json"    : "application/json",
+    "msgpack" : "application/x-msgpack",
+}
+
+def project(data, fields):
+    """
+    Keep only the given keys of a dict, or of each dict in a list.
+    """
+    if type(data) == list:
+        return [ project(x, fields) for x in data ]
+    if type(data) == dict:
+        return dict([ (k, data[k]) for k in fields if data.has_key(k) ])
+    return data
+
+def read_api_encode(format, data, count=None):
+    """
+    Yields data encoded as JSON or msgpack, lists one item at a time so
+    that large results can be sent while being encoded.  data may also be
+    an iterator over the items of a list, of at most count items (msgpack
+    writes the length first, missing items are sent as nil).
+    """
+    if count is None and type(data) != list:
+        if format == "msgpack":
+            yield msgpack.packb(data)
+        else:
+            yield simplejson.dumps(data)
+        return
+
+    if format == "msgpack":
+        n = count
+        if n is None:
+            n = len(data)
+        if n < 16:
+            yield chr(0x90 | n)
+        elif n < 0x10000:
+            yield struct.pack(">BH", 0xdc, n)
+        else:
+            yield struct.pack(">BI", 0xdd, n)
+        for x in data:
+            yield msgpack.packb(x)
+            n = n - 1
+        while n > 0:
+            yield msgpack.packb(None)
+            n = n - 1
+        return
+
+    yield "["
+    first = True
+    for x in data:
+        if first:
+            first = False
+            yield simplejson.dumps(x)
+        else:
+            yield "," + simplejson.dumps(x)
+    yield "]"
+
+class CobblerXMLRPCRequestHandler(SimpleXMLRPCServer.SimpleXMLRPCRequestHandler):
+    # HTTP/1.1 lets clients (ex: the /cblr/svc WSGI app) keep one
+    # connection open across calls instead of connecting for each one.
+    # Idle connections are dropped after timeout seconds, clients
+    # reconnect transparently.
+    protocol_version = "HTTP/1.1"
+    timeout = 60
+
+    def do_POST(self):
+        if self.is_read_api_path():
+            return self.do_read_api()
+        return SimpleXMLRPCServer.SimpleXMLRPCRequestHandler.do_POST(self)
+
+    def do_GET(self):
+        if self.is_read_api_path():
+            return self.do_read_api()
+        self.report_404()
+
+    def do_PUT(self):
+        """
+        Serves anamon log uploads: the body is written, as is, to the log
+        file of the system at the offset given in the query string
+        (default 0, which replaces the file):
+            PUT /anamon/<system>/<file>?offset=N
+        The body may be sent with chunked transfer encoding.
+        """
+        (scheme, netloc, path, query, fragment) = urlparse.urlsplit(self.path)
+        options = cgi.parse_qs(query)
+        parts = path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "anamon":
+            return self.report_404()
+        (ignored, sys_name, name) = [ urllib.unquote(x) for x in parts ]
+        try:
+            offset = int(options.get("offset", [ "0" ])[0])
+        except ValueError:
+            return self.send_upload_response(400, "invalid offset")
+        if offset < 0:
+            return self.send_upload_response(400, "invalid offset")
+
+        interface = getattr(self.server.instance, "proxied", self.server.instance)
+        start = time.time()
+        try:
+            try:
+                written = interface._upload_log_stream(sys_name, name, offset, self.read_body())
+            except CX, e:
+                return self.send_upload_response(400, str(e))
+        finally:
+            XMLRPC_STATS.record("PUT anamon", time.time() - start)
+        if written is None:
+            return self.send_upload_response(403, "uploads disabled or unknown system: %s" % sys_name)
+        self.send_upload_response(200, "%s" % written)
+
+    def read_body(self, blocksize=65536):
+        """
+        Yields the body of the request in pieces, be it sent with a
+        Content-length or with chunked transfer encoding.
+        """
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(";", 1)[0].strip(), 16)
+                if size == 0:
+                    # trailers, up to an empty line
+                    while self.rfile.readline().strip() != "":
+                        pass
+                    return
+                while size > 0:
+                    data = self.rfile.read(min(size, blocksize))
+                    if data == "":
+                        raise CX("connection closed in the middle of a chunk")
+                    size = size - len(data)
+                    yield data
+                self.rfile.readline()
+        else:
+            length = int(self.headers.get("content-length", 0))
+            while length > 0:
+                data = self.rfile.read(min(length, blocksize))
+                if data == "":
+                    raise CX("connection closed before the end of the body")
+                length = length - len(data)
+                yield data
+
+    def send_upload_response(self, code, message):
+        if code != 200:
+            # the rest of the body may not have been read
+            self.close_connection = 1
+        self.send_response(code)
+        self.send_header("Content-type", "text/plain")
+        self.send_header("Content-length", str(len(message) + 1))
+        self.end_headers()
+        self.wfile.write(message + "\n")
+
+    def is_read_api_path(self):
+        format = self.path.lstrip("/").split("/", 1)[0]
+        return READ_API_FORMATS.has_key(format)
+
+    def do_read_api(self):
+        """
+        Serves /json/<method> and /msgpack/<method>, where method is one
+        of the READ_METHODS.  This is a lighter alternative to XMLRPC
+        for large listings (ex: get_systems).  Arguments are a JSON list,
+        sent as the body of a POST or in the args parameter of a GET.
+
+        Options, in the query string:
+          fields=a,b,c  only return these keys of the objects
+        Lists are sent one object at a time (chunked encoding) and the
+        response is gzipped if the client accepts it.
+        """
+        (scheme, netloc, path, query, fragment) = urlparse.urlsplit(self.path)
+        options = cgi.parse_qs(query)
+        try:
+            (format, method) = path.strip("/").split("/")
+        except ValueError:
+            return self.report_404()
+
+        args = "[]"
+        if self.command == "POST":
+            args = self.rfile.read(int(self.headers.get("content-length", 0))) or "[]"
+        elif options.has_key("args"):
+            args = options["args"][0]
+
+        if method not in READ_METHODS:
+            return self.send_read_api_error(format, 403, "not a read method: %s" % method)
+        if format == "msgpack" and not msgpack_loaded:
+            return self.send_read_api_error("json", 406, "msgpack is not installed on the server")
+        try:
+            params = simplejson.loads(args)
+        except ValueError:
+            return self.send_read_api_error(format, 400, "arguments are not valid JSON")
+        if type(params) != list:
+            params = [ params ]
+
+        fields = None
+        if options.has_key("fields"):
+            fields = ",".join(options["fields"]).split(",")
+        compress = self.headers.get("accept-encoding", "").find("gzip") != -1
+
+        if READ_API_LISTINGS.has_key(method):
+            return self.send_read_api_listing(format, method, params, fields, compress)
+
+        try:
+            result = self.server._dispatch(method, params)
+        except Exception, e:
+            return self.send_read_api_error(format, 500, str(e))
+
+        if fields:
+            result = project(result, fields)
+        self.send_read_api_response(200, format, read_api_encode(format, result), compress)
+
+    def send_read_api_listing(self, format, method, params, fields, compress):
+        """
+        Serves get_items and get_<plural>: objects are turned into hashes,
+        of just the requested fields, one at a time as they are sent
+        instead of building the whole list first.
+        """
+        what = READ_API_LISTINGS[method]
+        if what is None:
+            if len(params) == 0:
+                return self.send_read_api_error(format, 400, "missing object type")
+            what = params[0]
+
+        instance = self.server.instance
+        interface = instance.proxied
+        start = time.time()
+        # the configuration must not be reloaded while it is being sent
+        instance._begin_read()
+        try:
+            try:
+                count = len(interface.api.get_items(what))
+            except Exception, e:
+                return self.send_read_api_error(format, 500, str(e))
+            items = interface._iter_items(what, fields)
+            self.send_read_api_response(200, format, read_api_encode(format, items, count), compress)
+        finally:
+            instance._end_read()
+            XMLRPC_STATS.record(method, time.time() - start)
+
+    def send_read_api_error(self, format, code, message):
+        self.send_read_api_response(code, format, read_api_encode(format, { "error" : message }), False)
+
+    def send_read_api_response(self, code, format, pieces, compress):
+        self.send_response(code)
+        self.send_header("Content-type", READ_API_FORMATS[format])
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        chunked = self.request_version == "HTTP/1.1"
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            # the end of the response is the end of the connection
+            self.send_header("Connection", "close")
+            self.close_connection = 1
+        self.end_headers()
+
+        if compress:
+            # wbits 16+15 writes a gzip header and trailer
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        buf = []
+        size = 0
+        for piece in pieces:
+            if compress:
+                piece = compressor.compress(piece)
+            buf.append(piece)
+            size = size + len(piece)
+            if size >= 65536:
+                self.write_chunk("".join(buf), chunked)
+                buf = []
+                size = 0
+        if compress:
+            buf.append(compressor.flush())
+        self.write_chunk("".join(buf), chunked)
+        if chunked:
+            self.wfile.write("0\r\n\r\n")
+
+    def write_chunk(self, data, chunked):
+        if len(data) == 0:
+            return
+        if chunked:
+            self.wfile.write("%x\r\n%s\r\n" % (len(data), data))
+        else:
+            self.wfile.write(data)
+
+class XMLRPCStats:
+    """
+    Counters of the XMLRPC server of this process: calls and time spent
+    per method, connections waiting for a thread and connections turned
+    away because the server was busy.
+    """
+
+    def __init__(self):
+        self.lock     = threading.Lock()
+        self.methods  = {}
+        self.rejected = 0
+        self.busy     = 0
+        self.threads  = 0
+        self.queue    = None
+        self.queue_max = 0
+
+    def record(self, method, elapsed):
+        if not hasattr(CobblerXMLRPCInterface, method):
+            method = "(unknown)"
+        self.lock.acquire()
+        try:
+            entry = self.methods.get(method, None)
+            if entry is None:
+                entry = self.methods[method] = { "calls" : 0, "total" : 0.0, "max" : 0.0 }
+            entry["calls"] = entry["calls"] + 1
+            entry["total"] = entry["total"] + elapsed
+            if elapsed > entry["max"]:
+                entry["max"] = elapsed
+        finally:
+            self.lock.release()
+
+    def count(self, attribute, delta=1):
+        self.lock.acquire()
+        try:
+            setattr(self, attribute, getattr(self, attribute) + delta)
+        finally:
+            self.lock.release()
+
+    def queued(self):
+        depth = self.queue.qsize()
+        if depth > self.queue_max:
+            self.queue_max = depth
+
+    def report(self):
+        self.lock.acquire()
+        try:
+            methods = {}
+            for (method, entry) in self.methods.iteritems():
+                methods[method] = entry.copy()
+                methods[method]["average"] = entry["total"] / entry["calls"]
+            queue_depth = 0
+            if self.queue is not None:
+                queue_depth = self.queue.qsize()
+            return {
+                "pid"         : os.getpid(),
+                "threads"     : self.threads,
+                "busy"        : self.busy,
+                "queue_depth" : queue_depth,
+                "queue_max"   : self.queue_max,
+                "rejected"    : self.rejected,
+                "methods"     : methods,
+            }
+        finally:
+            self.lock.release()
+
+XMLRPC_STATS = XMLRPCStats()
+
 class CobblerXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer.SimpleXMLRPCServer):
     def __init__(self, args):
         self.allow_reuse_address = True
-        SimpleXMLRPCServer.SimpleXMLRPCServer.__init__(self,args)
+        SimpleXMLRPCServer.SimpleXMLRPCServer.__init__(self,args,requestHandler=CobblerXMLRPCRequestHandler)
+
+    def _dispatch(self, method, params):
+        start = time.time()
+        try:
+            return SimpleXMLRPCServer.SimpleXMLRPCServer._dispatch(self, method, params)
+        finally:
+            XMLRPC_STATS.record(method, time.time() - start)
+
+class PooledRequestHandler(CobblerXMLRPCRequestHandler):
+    """
+    Handles a single request, the server decides what to do with the
+    connection afterwards.
+    """
+    def handle(self):
+        self.close_connection = 1
+        self.handle_one_request()
+
+# sent as is when all threads are busy, the request is not even read
+BUSY_RESPONSE = "HTTP/1.1 503 Service Unavailable\r\n" \
+                "Content-Type: text/plain\r\n" \
+                "Content-Length: 29\r\n" \
+                "Connection: close\r\n" \
+                "\r\n" \
+                "server busy, try again later\n"
+
+# keep-alive connections waiting for their next request, select() can't
+# watch more than FD_SETSIZE (1024) descriptors
+MAX_PARKED = 768
+
+class PooledXMLRPCServer(CobblerXMLRPCServer):
+    """
+    XMLRPC server with a fixed number of threads.  Connections with a
+    request wait for a free thread in a queue of at most queue_size,
+    when that is full the connection gets a canned HTTP 503 and is
+    closed right away.  Between requests, up to MAX_PARKED keep-alive
+    connections wait in the accept loop instead of holding a thread,
+    more are closed (clients reconnect).
+    """
+
+    def __init__(self, args, threads=32, queue_size=128):
+        self.threads = threads
+        self.queue_size = max(1, queue_size)
+        # listen() backlog, for connections not accepted yet
+        self.request_queue_size = self.queue_size
+        self.queue = None
+        CobblerXMLRPCServer.__init__(self, args)
+
+    def serve_forever(self):
+        # threads and the wakeup pipe are set up here rather than in the
+        # constructor, so that the server can be created before forking
+        if self.queue is None:
+            self.queue = Queue.Queue(self.queue_size)
+            self.parked = {}
+            self.parked_lock = threading.Lock()
+            (self.wakeup_r, self.wakeup_w) = os.pipe()
+            # workers of a pre-forked cobblerd share the listening socket
+            self.socket.setblocking(0)
+            XMLRPC_STATS.threads = self.threads
+            XMLRPC_STATS.queue = self.queue
+            for i in range(0, self.threads):
+                worker = Thread(target=self.__worker)
+                worker.setDaemon(True)
+                worker.start()
+
+        while True:
+            self.parked_lock.acquire()
+            parked = self.parked.keys()
+            self.parked_lock.release()
+            try:
+                (ready, ignored, ignored2) = select.select([ self.socket, self.wakeup_r ] + parked, [], [], 5)
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            for s in ready:
+                if s is self.socket:
+                    try:
+                        (request, client_address) = self.get_request()
+                    except socket.error:
+                        # taken by another process, or gone already
+                        continue
+                    self.__enqueue(request, client_address)
+                elif s == self.wakeup_r:
+                    os.read(self.wakeup_r, 4096)
+                else:
+                    self.parked_lock.acquire()
+                    (client_address, since) = self.parked.pop(s)
+                    self.parked_lock.release()
+                    self.__enqueue(s, client_address)
+            self.__expire_parked()
+
+    def __enqueue(self, request, client_address):
+        try:
+            self.queue.put_nowait((request, client_address))
+        except Queue.Full:
+            XMLRPC_STATS.count("rejected")
+            # never wait on a client here, that would stall the accept loop
+            try:
+                request.setblocking(0)
+                request.send(BUSY_RESPONSE)
+                # what the client already sent, so closing doesn't reset
+                # the connection before it reads the answer
+                request.recv(65536)
+            except socket.error:
+                pass
+            self.__close(request)
+            return
+        XMLRPC_STATS.queued()
+
+    def __worker(self):
+        while True:
+            (request, client_address) = self.queue.get()
+            XMLRPC_STATS.count("busy")
+            keep = False
+            try:
+                try:
+                    handler = PooledRequestHandler(request, client_address, self)
+                    keep = not handler.close_connection
+                except:
+                    self.handle_error(request, client_address)
+            finally:
+                XMLRPC_STATS.count("busy", -1)
+            if keep:
+                self.parked_lock.acquire()
+                keep = len(self.parked) < MAX_PARKED
+                if keep:
+                    self.parked[request] = (client_address, time.time())
+                self.parked_lock.release()
+            if keep:
+                os.write(self.wakeup_w, "x")
+            else:
+                self.__close(request)
+
+    def __expire_parked(self):
+        limit = time.time() - CobblerXMLRPCRequestHandler.timeout
+        self.parked_lock.acquire()
+        try:
+            idle = [ s for (s, (client_address, since)) in self.parked.items() if since < limit ]
+            for s in idle:
+                del self.parked[s]
+        finally:
+            self.parked_lock.release()
+        for s in idle:
+            self.__close(s)
+
+    def __close(self, request):
+        try:
+            request.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.close_request(request)
 
 # *********************************************************************************
 # *********************************************************************************
 
 
+# methods served by the read-only workers of a pre-forked cobblerd (see
+# xmlrpc_workers in the settings).  They only read the configuration and
+# need no state kept by the writer (tokens, object handles, events).
+READ_METHODS = [
+    "version", "extended_version", "ping", "last_modified_time",
+    "get_item", "get_items", "get_item_names", "find_items", "find_items_paged", "has_item",
+    "is_kickstart_in_use", "generate_kickstart", "get_blended_data", "get_settings",
+    "get_repo_config_for_profile", "get_repo_config_for_system",
+    "get_template_file_for_profile", "get_template_file_for_system",
+    "get_repos_compatible_with_profile", "find_system_by_dns_name", "get_config_data",
+    "get_changes_since",
+]
+# listings the read API streams, and the object type they list (None:
+# given as the first argument)
+READ_API_LISTINGS = { "get_items" : None }
+for (what, plural) in [ ("distro", "distros"), ("profile", "profiles"), ("system", "systems"),
+                        ("repo", "repos"), ("image", "images"), ("mgmtclass", "mgmtclasses"),
+                        ("package", "packages"), ("file", "files") ]:
+    READ_METHODS.extend([ "get_%s" % what, "find_%s" % what, "get_%s_as_rendered" % what,
+                          "get_%s_for_koan" % what, "get_%s" % plural, "get_%s_since" % plural ])
+    READ_API_LISTINGS["get_%s" % plural] = what
+
 class ProxiedXMLRPCInterface:
 
     def __init__(self,api,proxy_class):
@@ -1949,6 +2686,136 @@ class ProxiedXMLRPCInterface:
             utils.log_exc(self.logger)
             raise e
 
+    def _begin_read(self):
+        """
+        Called before reading the configuration outside of _dispatch.
+        """
+        pass
+
+    def _end_read(self):
+        pass
+
+class ReadWriteLock:
+    """
+    Held by any number of readers, or by one writer.  A waiting writer
+    keeps new readers out, so it is not starved by a steady flow of them.
+    """
+
+    def __init__(self):
+        self.cond    = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer  = False
+        self.waiting = 0
+
+    def acquire_read(self):
+        self.cond.acquire()
+        try:
+            while self.writer or self.waiting > 0:
+                self.cond.wait()
+            self.readers = self.readers + 1
+        finally:
+            self.cond.release()
+
+    def release_read(self):
+        self.cond.acquire()
+        try:
+            self.readers = self.readers - 1
+            if self.readers == 0:
+                self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def acquire_write(self):
+        self.cond.acquire()
+        try:
+            self.waiting = self.waiting + 1
+            while self.writer or self.readers > 0:
+                self.cond.wait()
+            self.waiting = self.waiting - 1
+            self.writer = True
+        finally:
+            self.cond.release()
+
+    def release_write(self):
+        self.cond.acquire()
+        try:
+            self.writer = False
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+# a read-only worker that finds more changes than this since its last
+# refresh reloads the whole configuration instead of object by object
+RELOAD_CHANGES = 1000
+
+class ReadOnlyXMLRPCInterface(ProxiedXMLRPCInterface):
+    """
+    Interface of a read-only worker process.  READ_METHODS are served
+    from this process's copy of the configuration, everything else is
+    passed on to the writer process.  When last_modified_time changes,
+    the objects saved or removed since loaded_revision (see changelog.py)
+    are reloaded.
+    """
+
+    def __init__(self,api,proxy_class,writer_url,loaded_mtime,loaded_revision=0):
+        ProxiedXMLRPCInterface.__init__(self,api,proxy_class)
+        self.writer_url = writer_url
+        self.loaded_mtime = loaded_mtime
+        self.loaded_revision = loaded_revision
+        # requests come in on several threads and are served together,
+        # but the configuration can't be read while it is being reloaded
+        self.lock = ReadWriteLock()
+        self.writers = threading.local()
+
+    def _dispatch(self, method, params, **rest):
+
+        if method not in READ_METHODS:
+            return getattr(self.__writer(), method)(*params)
+
+        self._begin_read()
+        try:
+            return ProxiedXMLRPCInterface._dispatch(self, method, params)
+        finally:
+            self._end_read()
+
+    def _begin_read(self):
+        if self.proxied.api.last_modified_time() != self.loaded_mtime:
+            self.lock.acquire_write()
+            try:
+                self.__refresh()
+            finally:
+                self.lock.release_write()
+        self.lock.acquire_read()
+
+    def _end_read(self):
+        self.lock.release_read()
+
+    def __writer(self):
+        # one connection to the writer per thread
+        if getattr(self.writers, "remote", None) is None:
+            self.writers.remote = xmlrpclib.Server(self.writer_url, allow_none=True)
+        return self.writers.remote
+
+    def __refresh(self):
+        api = self.proxied.api
+        mtime = api.last_modified_time()
+        if mtime == self.loaded_mtime:
+            return
+        # changes are logged before the mtime is written, so reading them
+        # after it finds at least the changes that moved it
+        changes = api.get_changes_since(self.loaded_revision)
+        count = len(changes["changes"])
+        if changes["complete"] and count > 0 and count <= RELOAD_CHANGES:
+            self.logger.debug("reloading %s changed objects (pid %s)" % (count, os.getpid()))
+            for change in changes["changes"]:
+                api.get_items(change["type"]).reload_item(change["name"])
+        else:
+            self.logger.debug("reloading configuration (pid %s)" % os.getpid())
+            api.clear()
+            api.deserialize()
+        self.loaded_mtime = mtime
+        self.loaded_revision = changes["revision"]
+
 # *********************************************************************
 # *********************************************************************
 
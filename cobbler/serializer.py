@@ -23,6 +23,7 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 
 import errno
 import os
+import utils
 from utils import _
 import fcntl
 import traceback
@@ -32,6 +33,7 @@ import time
 
 from cexceptions import *
 import api as cobbler_api
+import changelog
 
 LOCK_ENABLED = True
 LOCK_HANDLE = None
@@ -92,10 +94,12 @@ def serialize_item(collection, item):
     __grab_lock()
     storage_module = __get_storage_module(collection.collection_type())
     save_fn = getattr(storage_module, "serialize_item", None)
-    if save_fn is None:
-        rc = storage_module.serialize(collection)
-    else:
-        rc = save_fn(collection,item)
+    def save(revision):
+        item.revision = revision
+        if save_fn is None:
+            return storage_module.serialize(collection)
+        return save_fn(collection,item)
+    rc = changelog.CHANGE_LOG.record(collection.collection_type(), item.name, "save", save)
     __release_lock(with_changes=True)
     return rc
 
@@ -106,10 +110,54 @@ def serialize_delete(collection, item):
     __grab_lock()
     storage_module = __get_storage_module(collection.collection_type())
     delete_fn = getattr(storage_module, "serialize_delete", None)
-    if delete_fn is None:
-        rc = storage_module.serialize(collection)
-    else:
-        rc = delete_fn(collection,item)
+    def delete(revision):
+        if delete_fn is None:
+            return storage_module.serialize(collection)
+        return delete_fn(collection,item)
+    rc = changelog.CHANGE_LOG.record(collection.collection_type(), item.name, "delete", delete)
+    __release_lock(with_changes=True)
+    return rc
+
+def serialize_items(collection, items):
+    """
+    Save several items of a collection under one lock, in one storage
+    call when the storage module has serialize_items.
+    """
+    __grab_lock()
+    storage_module = __get_storage_module(collection.collection_type())
+    save_fn = getattr(storage_module, "serialize_items", None)
+    def save(revisions):
+        for k in range(0, len(items)):
+            items[k].revision = revisions[k]
+        if save_fn is not None:
+            return save_fn(collection,items)
+        item_fn = getattr(storage_module, "serialize_item", None)
+        if item_fn is None:
+            return storage_module.serialize(collection)
+        for item in items:
+            item_fn(collection,item)
+        return True
+    rc = changelog.CHANGE_LOG.record_batch(collection.collection_type(), [ x.name for x in items ], "save", save)
+    __release_lock(with_changes=True)
+    return rc
+
+def serialize_deletes(collection, items):
+    """
+    Delete several items of a collection from the saved state.
+    """
+    __grab_lock()
+    storage_module = __get_storage_module(collection.collection_type())
+    delete_fn = getattr(storage_module, "serialize_deletes", None)
+    def delete(revisions):
+        if delete_fn is not None:
+            return delete_fn(collection,items)
+        item_fn = getattr(storage_module, "serialize_delete", None)
+        if item_fn is None:
+            return storage_module.serialize(collection)
+        for item in items:
+            item_fn(collection,item)
+        return True
+    rc = changelog.CHANGE_LOG.record_batch(collection.collection_type(), [ x.name for x in items ], "delete", delete)
     __release_lock(with_changes=True)
     return rc
 
@@ -135,6 +183,25 @@ def deserialize_raw(collection_type):
     __release_lock()
     return rc
 
+def deserialize_headers(collection_type, fields):
+    """
+    Return, for every stored object, just its name, mtime and the given
+    fields (see utils.datastruct_header).  Storage modules that can't
+    do better than reading everything get their full data reduced.
+    """
+    __grab_lock()
+    storage_module = __get_storage_module(collection_type)
+    headers_fn = getattr(storage_module, "deserialize_headers", None)
+    if headers_fn is not None:
+        rc = headers_fn(collection_type, fields)
+    else:
+        datastruct = storage_module.deserialize_raw(collection_type)
+        rc = None
+        if datastruct is not None:
+            rc = [ utils.datastruct_header(x, fields) for x in datastruct ]
+    __release_lock()
+    return rc
+
 def deserialize_item(collection_type, item_name):
     """
     Get a specific record.
@@ -50,9 +50,13 @@ class CobblerSvc(object):
     mode, which defaults to index.  All options are passed
     as parameters into the function.
     """
-    def __init__(self, server=None, req=None):
+    def __init__(self, server=None, req=None, remote=None):
+        """
+        server is the XMLRPC URL to connect to, unless a connected
+        remote (xmlrpclib.Server) is passed in.
+        """
         self.server = server
-        self.remote = None
+        self.remote = remote
         self.req    = req
 
     def __xmlrpc_setup(self):
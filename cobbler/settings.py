@@ -35,6 +35,7 @@ DEFAULTS = {
     "allow_duplicate_hostnames"   : 0,
     "allow_duplicate_macs"        : 0,
     "allow_duplicate_ips"         : 0,
+    "blender_cache_size"          : 5000,
     "build_reporting_enabled"     : 0,
     "build_reporting_to_address"  : "",
     "build_reporting_sender"      : "",
@@ -56,7 +57,10 @@ DEFAULTS = {
     "func_master"                 : "overlord.example.org",
     "func_auto_setup"             : 0,
     "http_port"                   : "80",
+    "incremental_sync"            : 0,
     "isc_set_host_name"           : 0,
+    "lazy_load_systems"           : 0,
+    "lazy_load_cache_size"        : 1000,
     "ldap_server"                 : "grimlock.devel.redhat.com",
     "ldap_base_dn"                : "DC=devel,DC=redhat,DC=com",
     "ldap_port"                   : 389,
@@ -72,6 +76,7 @@ DEFAULTS = {
         "ksdevice"                : "eth0"
     },
     "kernel_options_s390x"        : {},
+    "kickstart_cache_size"        : 1000,
     "manage_dhcp"                 : 0,
     "manage_dns"                  : 0,
     "manage_tftp"                 : 1,
@@ -84,6 +89,8 @@ DEFAULTS = {
     "next_server"                 : "127.0.0.1",
     "power_management_default_type" : "ipmitool",
     "power_template_dir"          : "/etc/cobbler/power",
+    "power_workers"               : 16,
+    "power_workers_per_address"   : 1,
     "puppet_auto_setup"           : 0,
     "pxe_just_once"               : 0,
     "iso_template_dir"            : "/etc/cobbler/iso",
@@ -101,16 +108,24 @@ DEFAULTS = {
     "scm_track_mode"              : "git",
     "server"                      : "127.0.0.1",
     "snippetsdir"                 : "/var/lib/cobbler/snippets",
+    "sync_workers"                : 1,
+    "sync_workers_timeout"        : 3600,
     "template_remote_kickstarts"  : 0,
     "virt_auto_boot"              : 0,
     "webdir"                      : "/var/www/cobbler",
     "buildisodir"                 : "/var/cache/cobbler/buildiso",
     "xmlrpc_port"                 : 25151,
+    "xmlrpc_queue_size"           : 128,
+    "xmlrpc_threads"              : 32,
+    "xmlrpc_workers"              : 0,
+    "xmlrpc_writer_port"          : 25153,
     "yum_post_install_mirror"     : 1,
     "createrepo_flags"            : "-c cache -s sha",
     "yum_distro_priority"         : 1,
     "yumdownloader_flags"         : "--resolve",
     "reposync_flags"              : "-l -m -d",
+    "reposync_workers"            : 1,
+    "reposync_workers_per_host"   : 1,
     "ldap_management_default_type": "authconfig",
     "consoles"                     : "/var/consoles"
 }
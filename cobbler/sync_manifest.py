@@ -0,0 +1,194 @@
+"""
+Keeps track of the files a sync generates, so that an incremental
+'cobbler sync' only rewrites the files whose contents changed and only
+deletes the files that are no longer generated.
+
+The manifest maps each generated path to the md5 of its contents (along
+with the size and mtime it had when written, so files changed behind our
+back are rewritten) and is stored in /var/lib/cobbler/sync_manifest.json.
+
+Copyright 2006-2009, Red Hat, Inc
+Michael DeHaan <mdehaan@redhat.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+02110-1301  USA
+"""
+
+import os
+import os.path
+import errno
+import simplejson
+
+import utils
+from cexceptions import *
+from utils import _
+
+MANIFEST_FILE = "/var/lib/cobbler/sync_manifest.json"
+
+class SyncManifest:
+
+    def __init__(self, roots, manifest_file=MANIFEST_FILE, logger=None):
+        """
+        Constructor.  Only files below one of the roots directories are
+        tracked, anything else is written as usual and never removed.
+        """
+        self.roots         = [ os.path.join(os.path.normpath(r), "") for r in roots ]
+        self.manifest_file = manifest_file
+        self.logger        = logger
+        self.previous      = self.load()
+        self.current       = {}
+        self.written       = 0
+        self.unchanged     = 0
+        self.removed       = 0
+
+    def exists(self):
+        return os.path.exists(self.manifest_file)
+
+    def load(self):
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            fd = open(self.manifest_file)
+            data = simplejson.loads(fd.read())
+            fd.close()
+        except (IOError, ValueError):
+            if self.logger is not None:
+                self.logger.warning("ignoring unreadable sync manifest %s" % self.manifest_file)
+            return {}
+        return data
+
+    def forget(self):
+        """
+        Treat every file as new, used when the trees have been cleaned.
+        """
+        self.previous = {}
+
+    def tracks(self, path):
+        path = os.path.normpath(path)
+        for root in self.roots:
+            if path.startswith(root):
+                return True
+        return False
+
+    def write_file(self, path, data):
+        """
+        Write data to path unless the last sync already wrote the same
+        contents there.  Returns True if the file was written.
+        """
+        if not self.tracks(path):
+            fd = open(path, "w")
+            fd.write(data)
+            fd.close()
+            return True
+
+        path = os.path.normpath(path)
+        digest = utils.md5(data).hexdigest()
+        old = self.previous.get(path, None)
+        if old is not None and old[0] == digest and self.__stat(path) == (old[1], old[2]):
+            self.current[path] = old
+            self.unchanged = self.unchanged + 1
+            return False
+
+        if self.logger is not None:
+            self.logger.info("generating: %s" % path)
+        tmp = "%s.tmp" % path
+        fd = open(tmp, "w")
+        fd.write(data)
+        fd.close()
+        os.rename(tmp, path)
+        (size, mtime) = self.__stat(path)
+        self.current[path] = [ digest, size, mtime ]
+        self.written = self.written + 1
+        return True
+
+    def keep(self, path):
+        """
+        Record a file that was produced some other way (ex: linked kernels)
+        so it is not removed as an orphan, and is removed once it no longer
+        gets produced.
+        """
+        if self.tracks(path):
+            self.current[os.path.normpath(path)] = [ None, None, None ]
+
+    def start_worker(self):
+        """
+        Called in a forked sync worker: record only what this worker
+        writes, to be handed back with changes().
+        """
+        self.current   = {}
+        self.written   = 0
+        self.unchanged = 0
+
+    def changes(self):
+        return (self.current, self.written, self.unchanged)
+
+    def merge(self, changes):
+        """
+        Fold the changes() of a sync worker into this manifest.
+        """
+        (current, written, unchanged) = changes
+        self.current.update(current)
+        self.written   = self.written + written
+        self.unchanged = self.unchanged + unchanged
+
+    def remove_orphans(self):
+        """
+        Delete the files the previous sync generated and this one did not.
+        """
+        orphans = [ path for path in self.previous.keys() if not self.current.has_key(path) ]
+        orphans.sort()
+        for path in orphans:
+            if not os.path.lexists(path):
+                continue
+            utils.rmfile(path, logger=self.logger)
+            self.removed = self.removed + 1
+            self.__prune(os.path.dirname(path))
+        return self.removed
+
+    def save(self):
+        tmp = "%s.tmp" % self.manifest_file
+        try:
+            fd = open(tmp, "w")
+            fd.write(simplejson.dumps(self.current))
+            fd.close()
+            os.rename(tmp, self.manifest_file)
+        except (IOError, OSError):
+            if self.logger is not None:
+                utils.log_exc(self.logger)
+            raise CX(_("unable to write sync manifest %s") % self.manifest_file)
+        return True
+
+    def report(self):
+        return "%s files written, %s unchanged, %s removed" % (self.written, self.unchanged, self.removed)
+
+    def __stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return (None, None)
+        return (st.st_size, st.st_mtime)
+
+    def __prune(self, dirname):
+        """
+        Remove directories left empty by orphan removal, up to a root.
+        """
+        while self.tracks(dirname) and os.path.join(dirname, "") not in self.roots:
+            try:
+                os.rmdir(dirname)
+            except OSError, e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                    raise
+                return
+            dirname = os.path.dirname(dirname)
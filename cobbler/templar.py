@@ -31,15 +31,6 @@ from utils import *
 import utils
 import clogger
 
-import Cheetah
-major, minor, release = Cheetah.Version.split('.')[0:3]
-fix_cheetah_class = int(major) >= 2 and int(minor) >=4 and int(release) >= 2
-
-try:
-    import functools
-except:
-    functools = None
-
 class Templar:
 
     def __init__(self,config=None,logger=None):
@@ -56,6 +47,8 @@ class Templar:
             self.api         = config.api
             self.settings    = config.settings()
         self.last_errors = []
+        # set during a sync, see sync_manifest.py
+        self.manifest    = None
 
     def check_for_invalid_imports(self,data):
         """
@@ -124,12 +117,11 @@ class Templar:
            "template_universe" : table_copy
         })
 
-        # now do full templating scan, where we will also templatify the snippet insertions
-        t = Template(source=raw_data, errorCatcher="Echo", searchList=[search_table], compilerSettings={'useStackFrame':False})
-
-        if fix_cheetah_class and functools is not None:
-            t.SNIPPET = functools.partial(t.SNIPPET, t)
-            t.read_snippet = functools.partial(t.read_snippet, t)
+        # now do full templating scan, where we will also templatify the snippet insertions.
+        # The compiled class is cached on the preprocessed source, so a render only pays
+        # for the compile the first time a given template is seen.
+        template_class = Template.compile(source=raw_data, compilerSettings={'useStackFrame':False})
+        t = template_class(errorCatcher="Echo", searchList=[search_table])
 
         try:
             data_out = t.respond()
@@ -164,8 +156,11 @@ class Templar:
 
         if out_path is not None:
             utils.mkdir(os.path.dirname(out_path))
-            fd = open(out_path, "w+")
-            fd.write(data_out)
-            fd.close()
+            if self.manifest is not None:
+                self.manifest.write_file(out_path, data_out)
+            else:
+                fd = open(out_path, "w+")
+                fd.write(data_out)
+                fd.close()
 
         return data_out
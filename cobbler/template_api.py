@@ -25,11 +25,37 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 import Cheetah.Template
 import os.path
 import re
+import threading
 import utils
+import lrucache
 from cexceptions import *
 
 CHEETAH_MACROS_FILE = '/etc/cobbler/cheetah_macros'
 
+# compiled template classes, keyed by a hash of their source.  Shared by
+# Templar.render and by the #include compiles done for snippets.
+COMPILE_CACHE_SIZE = 200
+COMPILE_CACHE = lrucache.LRUCache(COMPILE_CACHE_SIZE)
+
+# snippet paths looked up by read_snippet in this thread, between calls
+# to record_snippets and recorded_snippets.  Used to know which files a
+# rendered kickstart depends on.
+SNIPPET_LOG = threading.local()
+
+def record_snippets():
+    SNIPPET_LOG.paths = {}
+
+def recorded_snippets():
+    """
+    Returns the list of snippet paths looked up (found or not) since
+    record_snippets was called, and stops recording.
+    """
+    paths = getattr(SNIPPET_LOG, "paths", None) or {}
+    SNIPPET_LOG.paths = None
+    paths = paths.keys()
+    paths.sort()
+    return paths
+
 # This class is defined using the Cheetah language. Using the 'compile' function
 # we can compile the source directly into a python class. This class will allow
 # us to define the cheetah builtins.
@@ -122,10 +148,46 @@ class Template(BuiltinTemplate, MacrosTemplate):
         # Instruct Cheetah to use this class as the base for all cheetah templates
         if not kwargs.has_key('baseclass'):
             kwargs['baseclass'] = Template
-        
-        # Now let Cheetah do the actual compilation
-        return Cheetah.Template.Template.compile(*args, **kwargs)
+
+        # Compiles from a source string with nothing but compiler settings
+        # (Templar.render and #include of snippets) are cached.  Cheetah's
+        # own cache is unbounded, so it is turned off for those.
+        key = klass.compile_cache_key(*args, **kwargs)
+        if key is None:
+            return Cheetah.Template.Template.compile(*args, **kwargs)
+        compiled = COMPILE_CACHE.get(key)
+        if compiled is None:
+            kwargs['cacheCompilationResults'] = False
+            kwargs['useCache'] = False
+            compiled = Cheetah.Template.Template.compile(*args, **kwargs)
+            COMPILE_CACHE.set(key, compiled)
+        return compiled
     compile = classmethod(compile)
+
+    def compile_cache_key(klass, *args, **kwargs):
+        """
+        Return the COMPILE_CACHE key for a compile call, or None if the
+        call can not be cached.
+        """
+        if len(args) > 0 or kwargs.get('file', None) is not None:
+            return None
+        for k in kwargs.keys():
+            if k not in ('source', 'file', 'compilerSettings', 'preprocessors', 'baseclass'):
+                return None
+        if len(kwargs['preprocessors']) != 1 or kwargs['baseclass'] is not Template:
+            return None
+        source = kwargs.get('source', None)
+        if not isinstance(source, basestring):
+            return None
+        if isinstance(source, unicode):
+            source = source.encode('utf-8')
+        settings = kwargs.get('compilerSettings', None) or {}
+        if not isinstance(settings, dict):
+            return None
+        settings = settings.items()
+        settings.sort()
+        return utils.md5(repr(settings) + "\n" + source).hexdigest()
+    compile_cache_key = classmethod(compile_cache_key)
     
     def read_snippet(self, file):
         """
@@ -142,17 +204,25 @@ class Template(BuiltinTemplate, MacrosTemplate):
             if self.varExists('%s_name' % snipclass):
                 fullpath = '%s/per_%s/%s/%s' % (self.getVar('snippetsdir'),
                     snipclass, file, self.getVar('%s_name' % snipclass))
+                self.__log_snippet(fullpath)
                 try:
                     contents = utils.read_file_contents(fullpath, fetch_if_remote=True)
                     return contents
                 except FileNotFoundException:
                     pass
 
+        fullpath = '%s/%s' % (self.getVar('snippetsdir'), file)
+        self.__log_snippet(fullpath)
         try: 
-            return "#errorCatcher ListErrors\n" + utils.read_file_contents('%s/%s' % (self.getVar('snippetsdir'), file), fetch_if_remote=True)
+            return "#errorCatcher ListErrors\n" + utils.read_file_contents(fullpath, fetch_if_remote=True)
         except FileNotFoundException:
             return None
 
+    def __log_snippet(self, path):
+        paths = getattr(SNIPPET_LOG, "paths", None)
+        if paths is not None:
+            paths[path] = 1
+
     def SNIPPET(self, file):
         """
         Include the contents of the named snippet here. This is equivalent to
@@ -8,6 +8,7 @@ import os
 import tempfile
 import shutil
 import traceback
+import time
 
 from cexceptions import *  
 
@@ -257,6 +258,36 @@ class DuplicateNamesAndIpPrevention(BootTest):
         # FIXME: note -- how netinfo is handled when doing renames/copies/edits
         # is more involved and we probably should add tests for that also.
 
+    def test_duplicate_netinfo_index(self):
+        # the MAC, IP and DNS name checks are answered by the system indexes
+        system1 = self.api.new_system()
+        self.assertTrue(system1.set_name("netinfo0"))
+        self.assertTrue(system1.set_profile("testprofile0"))
+        self.assertTrue(system1.set_mac_address("AA:BB:CC:00:00:01","eth0"))
+        self.assertTrue(system1.set_ip_address("192.51.52.1","eth0"))
+        self.assertTrue(system1.set_dns_name("netinfo0.example.org","eth0"))
+        self.assertTrue(self.api.add_system(system1,check_for_duplicate_netinfo=True))
+
+        def add_second(mac, ip, dns):
+            # the setters may already refuse the duplicate
+            system2 = self.api.new_system()
+            system2.set_name("netinfo1")
+            system2.set_profile("testprofile0")
+            system2.set_mac_address(mac,"eth0")
+            system2.set_ip_address(ip,"eth0")
+            system2.set_dns_name(dns,"eth0")
+            return self.api.add_system(system2,check_for_duplicate_netinfo=True)
+
+        for (mac, ip, dns) in [ ("aa:bb:cc:00:00:01", "192.51.52.2", "netinfo1.example.org"),
+                                ("AA:BB:CC:00:00:02", "192.51.52.1", "netinfo1.example.org"),
+                                ("AA:BB:CC:00:00:02", "192.51.52.2", "NETINFO0.example.org") ]:
+            self.failUnlessRaises(CX, add_second, mac, ip, dns)
+            self.assertTrue(self.api.find_system("netinfo1") is None)
+
+        # a system does not collide with itself
+        system1 = self.api.find_system("netinfo0")
+        self.assertTrue(self.api.add_system(system1,check_for_duplicate_netinfo=True))
+
 class Ownership(BootTest):
 
     def test_ownership_params(self):
@@ -492,6 +523,362 @@ class Utilities(BootTest):
         self.assertTrue(len(self.api.systems().find("00:16:41:14:B7:71",return_list=True))==1)
         self.assertTrue(self.api.systems().find("00:16:41:14:B7:71"))
 
+    def test_indexed_find_follows_edits(self):
+        # exact lookups are answered from the collection indexes, which
+        # must track in place edits, renames and removals
+        self.assertTrue(self.api.find_system(mac_address="bb:ee:ee:ee:ee:ff").name == "testsystem0")
+        self.assertTrue(self.api.find_system(ip_address="192.51.51.50").name == "testsystem0")
+        self.assertTrue(len(self.api.find_system(profile="testprofile0",return_list=True)) == 1)
+        system = self.api.find_system(name="testsystem0")
+        self.assertTrue(system.set_mac_address("BB:EE:EE:EE:EE:00","eth0"))
+        self.assertTrue(self.api.find_system(mac_address="BB:EE:EE:EE:EE:FF") is None)
+        self.assertTrue(self.api.find_system(mac_address="BB:EE:EE:EE:EE:00") is not None)
+        self.assertTrue(self.api.rename_system(system,"testsystem1"))
+        self.assertTrue(self.api.find_system(mac_address="BB:EE:EE:EE:EE:00").name == "testsystem1")
+        self.assertTrue(self.api.remove_system("testsystem1"))
+        self.assertTrue(self.api.find_system(mac_address="BB:EE:EE:EE:EE:00") is None)
+        self.assertTrue(self.api.find_system(profile="testprofile0",return_list=True) == [])
+
+    def test_sync_manifest(self):
+        import sync_manifest
+        topdir = tempfile.mkdtemp(prefix="_cobbler-")
+        cleanup_dirs.append(topdir)
+        root = os.path.join(topdir, "pxelinux.cfg")
+        os.makedirs(os.path.join(root, "sub"))
+        mfile = os.path.join(topdir, "manifest.json")
+        a = os.path.join(root, "a")
+        b = os.path.join(root, "sub", "b")
+
+        m = sync_manifest.SyncManifest([root], manifest_file=mfile)
+        self.assertFalse(m.exists())
+        self.assertTrue(m.write_file(a, "one"))
+        self.assertTrue(m.write_file(b, "two"))
+        m.save()
+
+        # same contents are not rewritten, stale files are removed
+        m = sync_manifest.SyncManifest([root], manifest_file=mfile)
+        self.assertTrue(m.exists())
+        self.assertFalse(m.write_file(a, "one"))
+        m.remove_orphans()
+        m.save()
+        self.assertTrue((m.written, m.unchanged, m.removed) == (0, 1, 1))
+        self.assertFalse(os.path.exists(b))
+        self.assertFalse(os.path.exists(os.path.dirname(b)))
+
+        # changed contents are
+        m = sync_manifest.SyncManifest([root], manifest_file=mfile)
+        self.assertTrue(m.write_file(a, "three"))
+        self.assertTrue(open(a).read() == "three")
+
+    def test_worker_pool(self):
+        import workerpool
+        def square(x):
+            return x * x
+        # child_done only runs in forked workers
+        for (workers, expected) in [ (1, []), (3, [ "done" ] * 3) ]:
+            (results, done) = workerpool.WorkerPool(workers).map(square, range(10), child_done=lambda: "done")
+            self.assertTrue(results == [ x * x for x in range(10) ])
+            self.assertTrue(done == expected)
+        def fail(x):
+            if x == 2:
+                raise ValueError("worker failure")
+            return x
+        self.failUnlessRaises(CX, workerpool.WorkerPool(3).map, fail, range(6))
+        # a lock held by another thread when forking is not held in the
+        # workers, and stuck workers are killed
+        import lrucache
+        import threading
+        cache = lrucache.LRUCache(10)
+        held = threading.Event()
+        release = threading.Event()
+        def holder():
+            cache.lock.acquire()
+            held.set()
+            release.wait()
+            cache.lock.release()
+        thread = threading.Thread(target=holder)
+        thread.start()
+        held.wait()
+        try:
+            def uses_cache(x):
+                cache.set(x, x)
+                return x
+            (results, done) = workerpool.WorkerPool(2, timeout=30).map(uses_cache, range(4))
+            self.assertTrue(results == range(4))
+        finally:
+            release.set()
+            thread.join()
+        start = time.time()
+        self.failUnlessRaises(CX, workerpool.WorkerPool(2, timeout=0.5).map, time.sleep, [ 60, 60 ])
+        self.assertTrue(time.time() - start < 30)
+
+    def test_thread_pool(self):
+        import workerpool
+        import threading
+        lock = threading.Lock()
+        running = {}
+        most = {}
+        def work(x):
+            lock.acquire()
+            running[x % 2] = running.get(x % 2, 0) + 1
+            most[x % 2] = max(most.get(x % 2, 0), running[x % 2])
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            running[x % 2] = running[x % 2] - 1
+            lock.release()
+            return x * x
+        # 4 threads, but only 1 at a time per key
+        results = workerpool.ThreadPool(4, 1).map(work, range(10), key=lambda x: x % 2)
+        self.assertTrue(results == [ x * x for x in range(10) ])
+        self.assertTrue(most == { 0 : 1, 1 : 1 })
+        def fail(x):
+            if x == 2:
+                raise ValueError("thread failure")
+            return x
+        self.failUnlessRaises(CX, workerpool.ThreadPool(3).map, fail, range(6))
+
+    def test_xmlrpc_read_methods(self):
+        import remote
+        for method in remote.READ_METHODS:
+            self.assertTrue(hasattr(remote.CobblerXMLRPCInterface, method))
+        # writes must never be served from a worker's copy
+        self.assertFalse("login" in remote.READ_METHODS)
+        self.assertFalse("save_system" in remote.READ_METHODS)
+
+    def test_xmlrpc_stats(self):
+        import remote
+        stats = remote.XMLRPCStats()
+        stats.record("get_system", 0.5)
+        stats.record("get_system", 1.5)
+        stats.record("no_such_method", 1.0)
+        report = stats.report()
+        self.assertTrue(report["methods"]["get_system"]["calls"] == 2)
+        self.assertTrue(report["methods"]["get_system"]["average"] == 1.0)
+        self.assertTrue(report["methods"]["get_system"]["max"] == 1.5)
+        self.assertTrue(report["methods"].has_key("(unknown)"))
+
+    def test_read_write_lock(self):
+        import remote
+        import threading
+        lock = remote.ReadWriteLock()
+        # readers share the lock
+        lock.acquire_read()
+        lock.acquire_read()
+        wrote = []
+        def writer():
+            lock.acquire_write()
+            wrote.append(lock.readers)
+            lock.release_write()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(wrote == [])
+        lock.release_read()
+        lock.release_read()
+        thread.join()
+        self.assertTrue(wrote == [ 0 ])
+
+    def test_read_api_encoding(self):
+        import remote
+        import simplejson
+        systems = [ { "name" : "s%s" % i, "profile" : "p", "mac" : "m" } for i in range(3) ]
+        data = remote.project(systems, [ "name", "mac" ])
+        self.assertTrue(data[2] == { "name" : "s2", "mac" : "m" })
+        self.assertTrue(remote.project({ "name" : "s0", "profile" : "p" }, [ "name" ]) == { "name" : "s0" })
+        encoded = "".join(remote.read_api_encode("json", data))
+        self.assertTrue(simplejson.loads(encoded) == data)
+        self.assertTrue(simplejson.loads("".join(remote.read_api_encode("json", []))) == [])
+
+    def test_sorted_view(self):
+        systems = self.api.systems()
+        view = systems.sorted_view("name")
+        self.assertTrue(view.names() == [ "testsystem0" ])
+        system = self.api.new_system()
+        self.assertTrue(system.set_name("anothersystem"))
+        self.assertTrue(system.set_profile("testprofile0"))
+        self.assertTrue(self.api.add_system(system))
+        # kept up to date as systems are added and removed
+        self.assertTrue(view.names() == [ "anothersystem", "testsystem0" ])
+        self.assertTrue(view.names(0, 1, reverse=True) == [ "testsystem0" ])
+        self.assertTrue(self.api.remove_system("anothersystem"))
+        self.assertTrue(view.names() == [ "testsystem0" ])
+        self.assertTrue(systems.sorted_names("name", names=[ "testsystem0", "nosuchsystem" ]) == (1, [ "testsystem0" ]))
+        # other fields sort by name
+        self.assertTrue(systems.sorted_view("no_such_field") is view)
+
+    def test_reload_item(self):
+        systems = self.api.systems()
+        old = systems.find(name="testsystem0")
+        new = systems.reload_item("testsystem0")
+        self.assertTrue(new is not old and new.to_datastruct() == old.to_datastruct())
+        self.assertTrue(systems.find(name="testsystem0") is new)
+        self.assertTrue(systems.find_by_index("mac_address", "BB:EE:EE:EE:EE:FF") == [ new ])
+        # the children of a reloaded profile are kept
+        profile = self.api.profiles().reload_item("testprofile0")
+        self.assertTrue([ x.name for x in profile.get_children() ] == [ "testsystem0" ])
+        self.assertTrue(systems.reload_item("nosuchsystem") is None)
+
+    def test_change_log(self):
+        import changelog
+        log = changelog.ChangeLog(os.path.join(self.topdir, "changes.log"),
+                                  os.path.join(self.topdir, "changes.lock"), compact_size=4)
+        revisions = []
+        for (name, op) in [ ("a", "save"), ("b", "save"), ("a", "save"), ("b", "delete") ]:
+            log.record("system", name, op, revisions.append)
+        self.assertTrue(revisions == [ 1, 2, 3, 4 ])
+        changes = log.changes_since(1)
+        self.assertTrue(changes["revision"] == 4 and changes["complete"])
+        self.assertTrue([ (c["name"], c["op"]) for c in changes["changes"] ] == [ ("a", "save"), ("b", "delete") ])
+        # compaction keeps the last save of each object and drops deletes
+        log.record("system", "c", "save", revisions.append)
+        self.assertTrue(len(log.entries) == 2)
+        self.assertFalse(log.changes_since(1)["complete"])
+        self.assertTrue(log.changes_since(4)["complete"])
+        # a new reader of the same file sees the same thing
+        other = changelog.ChangeLog(log.log_file, log.lock_file)
+        self.assertTrue(other.changes_since(0) == log.changes_since(0))
+
+    def test_expiry_cache(self):
+        import expirycache
+        cache = expirycache.ExpiryCache(10, capacity=3)
+        cache.set("a", 1, now=0)
+        cache.set("b", 2, now=1)
+        cache.set("c", 3, now=2)
+        cache.set("a", 1, now=5)  # set again, expires later
+        self.assertTrue(cache.expire(now=11) == 1)
+        self.assertTrue(cache.keys() == [ "c", "a" ] or cache.keys() == [ "a", "c" ])
+        # over capacity, the entry closest to expiring goes
+        cache.set("d", 4, now=6)
+        cache.set("e", 5, now=7)
+        self.assertFalse(cache.has_key("c"))
+        self.assertTrue(len(cache) == 3 and cache["e"] == 5)
+        stats = cache.stats()
+        self.assertTrue(stats["expirations"] == 1 and stats["evictions"] == 1)
+
+    def test_log_uploads(self):
+        import logupload
+        uploads = logupload.LogUploads(upload_dir=self.topdir, max_open=2)
+        path = os.path.join(self.topdir, "testsystem0", "anaconda.log")
+        # the XMLRPC chunks, base64 decoded
+        self.assertTrue(uploads.write("testsystem0", "anaconda.log", 0, "hello ", 6))
+        self.assertTrue(uploads.write("testsystem0", "anaconda.log", -1, "", 6))
+        self.assertTrue(open(path).read() == "hello ")
+        # streamed, only what was appended
+        self.assertTrue(uploads.write_stream("testsystem0", "anaconda.log", 6, [ "wor", "ld" ]) == 5)
+        self.assertTrue(open(path).read() == "hello world")
+        # files closed to make room are opened again
+        uploads.write_stream("testsystem0", "a", 0, [ "a" ])
+        uploads.write_stream("testsystem0", "b", 0, [ "b" ])
+        uploads.write_stream("testsystem0", "anaconda.log", 11, [ "!" ])
+        self.assertTrue(open(path).read() == "hello world!")
+        self.failUnlessRaises(CobblerException, uploads.write_stream, "..", "x", 0, [ "x" ])
+        uploads.close()
+
+    def test_power_systems(self):
+        # without power management configured each system fails on its
+        # own, and is reported as such
+        systems = [ self.api.find_system("testsystem0") ] * 3
+        results = self.api.power_systems(systems, "on")
+        self.assertTrue(len(results) == 3)
+        for r in results:
+            self.assertFalse(r["ok"])
+            self.assertTrue(r["name"] == "testsystem0" and r["error"] != "")
+
+    def test_reposync_upstream_unchanged(self):
+        import action_reposync
+        repo = self.api.find_repo("testrepo0")
+        dest_path = tempfile.mkdtemp(prefix="_cobbler_reposync")
+        os.makedirs(os.path.join(dest_path, ".origin"))
+        repomd = os.path.join(dest_path, ".origin", "repomd.xml")
+        open(repomd, "w").write("<repomd>1</repomd>")
+        try:
+            sync = action_reposync.RepoSync(self.api._config)
+            signature = sync.upstream_signature(repo, repomd)
+            self.assertFalse(sync.upstream_unchanged(dest_path, signature))
+            sync.record_upstream(dest_path, signature)
+            self.assertTrue(sync.upstream_unchanged(dest_path, signature))
+            # new upstream metadata, or forced, means syncing again
+            open(repomd, "w").write("<repomd>2</repomd>")
+            self.assertFalse(sync.upstream_unchanged(dest_path, sync.upstream_signature(repo, repomd)))
+            forced = action_reposync.RepoSync(self.api._config, force=True)
+            self.assertFalse(forced.upstream_unchanged(dest_path, signature))
+        finally:
+            shutil.rmtree(dest_path)
+
+    def test_dnsmasq_hosts_file(self):
+        import modules.manage_dnsmasq as manage_dnsmasq
+        path = tempfile.mktemp(prefix="_cobbler_ethers")
+        try:
+            ethers = manage_dnsmasq.HostsFile(path, manage_dnsmasq.ethers_lines)
+            ethers.update(self.api.systems(), [ "testsystem0" ])
+            self.assertTrue(open(path).read() == "BB:EE:EE:EE:EE:FF\t192.51.51.50\n")
+            # the system is still in the collection while being removed
+            ethers.update(self.api.systems(), [ "testsystem0" ], removed=True)
+            self.assertTrue(open(path).read() == "")
+            # written by someone else, rebuilt from every system
+            open(path, "w").write("garbage\n")
+            ethers.update(self.api.systems(), [])
+            self.assertTrue(open(path).read() == "BB:EE:EE:EE:EE:FF\t192.51.51.50\n")
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def test_deferred_lite_sync(self):
+        import action_litesync
+        import clogger
+        # one for every save, whatever they log to
+        lite_sync = action_litesync.get_lite_sync(self.api._config, clogger.Logger())
+        self.assertTrue(action_litesync.get_lite_sync(self.api._config) is lite_sync)
+        pxe_file = os.path.join(utils.tftpboot_location(), "pxelinux.cfg", "01-bb-ee-ee-ee-ee-0d")
+        self.api.defer_lite_sync()
+        try:
+            system = self.api.new_system()
+            self.assertTrue(system.set_name("deferred0"))
+            self.assertTrue(system.set_mac_address("BB:EE:EE:EE:EE:0D","eth0"))
+            self.assertTrue(system.set_profile("testprofile0"))
+            self.assertTrue(self.api.add_system(system))
+            # only noted, written out when the deferral ends
+            self.assertTrue(action_litesync.deferred()["system"].has_key("deferred0"))
+            self.assertFalse(os.path.exists(pxe_file))
+        finally:
+            self.api.end_lite_sync()
+        self.assertTrue(action_litesync.deferred() is None)
+        self.assertTrue(self.api.find_system("deferred0") is not None)
+        self.assertTrue(os.path.exists(pxe_file))
+
+    def test_system_batch(self):
+        systems = []
+        for name in [ "batch0", "batch1", "testsystem0", "batch2" ]:
+            system = self.api.new_system()
+            self.assertTrue(system.set_name(name))
+            self.assertTrue(system.set_profile("testprofile0"))
+            systems.append(system)
+        # the duplicate name fails alone, the others are saved
+        errors = self.api.add_items("system", systems, check_for_duplicate_names=True)
+        self.assertTrue(errors[0] is None and errors[1] is None and errors[3] is None)
+        self.assertTrue(errors[2] is not None)
+        self.assertTrue(self.api.find_system("batch2").revision > self.api.find_system("batch0").revision)
+        errors = self.api.remove_systems([ "batch0", "nosuchsystem", "batch2" ])
+        self.assertTrue(errors[0] is None and errors[1] is not None and errors[2] is None)
+        self.assertTrue(self.api.find_system("batch0") is None)
+        self.assertTrue(self.api.find_system("batch1") is not None)
+
+    def test_system_batch_collisions(self):
+        import remote
+        remote_api = remote.CobblerXMLRPCInterface(self.api)
+        token = remote_api.login("", remote_api.shared_secret)
+        results = remote_api.new_systems([
+            { "name" : "collide0", "profile" : "testprofile0", "mac_address" : "AA:BB:CC:DD:EE:01" },
+            { "name" : "collide1", "profile" : "testprofile0", "mac_address" : "AA:BB:CC:DD:EE:01" },
+            { "name" : "collide2", "profile" : "testprofile0", "mac_address" : "AA:BB:CC:DD:EE:02" },
+            { "name" : "collide2", "profile" : "testprofile0", "mac_address" : "AA:BB:CC:DD:EE:03" },
+        ], token)
+        # the first of each collision is saved, the second is refused
+        self.assertTrue([ r["ok"] for r in results ] == [ True, False, True, False ])
+        self.assertTrue(self.api.find_system("collide1") is None)
+        self.assertTrue(self.api.find_system("collide2").interfaces["eth0"]["mac_address"] == "AA:BB:CC:DD:EE:02")
+
     def test_invalid_distro_non_referenced_kernel(self):
         distro = self.api.new_distro()
         self.assertTrue(distro.set_name("testdistro2"))
@@ -801,6 +1188,69 @@ class SyncContents(BootTest):
         fh.close()
 
 
+    def test_blender_cache_invalidation(self):
+        system = self.api.find_system("testsystem0")
+        data = utils.blender(self.api, False, system)
+        self.assertFalse(data["ks_meta"].has_key("cachetest"))
+        # callers get their own copy of cached results
+        data["ks_meta"]["scribble"] = "1"
+        profile = self.api.find_profile("testprofile0")
+        self.assertTrue(profile.set_ks_meta({"cachetest" : "1"}))
+        self.assertTrue(self.api.add_profile(profile))
+        data = utils.blender(self.api, False, system)
+        self.assertTrue(data["ks_meta"].has_key("cachetest"))
+        self.assertFalse(data["ks_meta"].has_key("scribble"))
+        # a copy being edited keeps its mtime until saved, it is not cached
+        copied = system.make_clone()
+        data = utils.blender(self.api, False, copied)
+        self.assertTrue(copied.set_ks_meta({"unsaved" : "1"}))
+        data = utils.blender(self.api, False, copied)
+        self.assertTrue(data["ks_meta"].has_key("unsaved"))
+
+    def test_template_compile_cache(self):
+        import templar
+        import template_api
+        t = templar.Templar(self.api._config)
+        source = "hello $who # compile cache test"
+        self.assertTrue(t.render(source, { "who" : "one" }, None) == "hello one # compile cache test")
+        size = len(template_api.COMPILE_CACHE)
+        # same source, new search list: the compiled class is reused
+        self.assertTrue(t.render(source, { "who" : "two" }, None) == "hello two # compile cache test")
+        self.assertTrue(len(template_api.COMPILE_CACHE) == size)
+
+    def test_kickstart_cache(self):
+        first = self.api.generate_kickstart(None, "testsystem0")
+        stats = self.api.kickgen.cache_stats()
+        self.assertTrue(self.api.generate_kickstart(None, "testsystem0") == first)
+        self.assertTrue(self.api.kickgen.cache_stats()["hits"] == stats["hits"] + 1)
+        # changing an object the system inherits from renders it again
+        profile = self.api.find_profile("testprofile0")
+        self.assertTrue(profile.set_ks_meta({"cachetest" : "1"}))
+        self.assertTrue(self.api.add_profile(profile))
+        self.api.generate_kickstart(None, "testsystem0")
+        self.assertTrue(self.api.kickgen.cache_stats()["misses"] == stats["misses"] + 1)
+
+class LazyLoading(BootTest):
+
+    def test_lazy_load(self):
+        systems = self.api.systems()
+        try:
+            self.assertTrue(systems.lazy_load(1))
+            self.assertTrue(len(systems) == 1)
+            self.assertTrue(self.api.find_system(mac_address="BB:EE:EE:EE:EE:FF").name == "testsystem0")
+            self.assertTrue(len(self.api.find_profile("testprofile0").get_children()) == 1)
+            # clean objects are evicted, unsaved edits survive eviction
+            systems.listing.cache.set("evictor", None)
+            self.assertTrue(systems.listing.peek("testsystem0") is None)
+            system = self.api.find_system(name="testsystem0")
+            self.assertFalse(system.dirty)
+            self.assertTrue(system.set_ip_address("192.51.51.51","eth0"))
+            systems.listing.cache.set("evictor", None)
+            self.assertTrue(self.api.find_system(name="testsystem0") is system)
+        finally:
+            systems.clear()
+            self.api.deserialize()
+
 class Deletions(BootTest):
 
     #def test_invalid_delete_profile_doesnt_exist(self):
@@ -46,6 +46,7 @@ import netaddr
 import shlex
 import field_info
 import clogger
+import lrucache
 import yaml
 import urllib2
 import simplejson
@@ -375,6 +376,25 @@ def find_kernel(path):
 
     return None
 
+def datastruct_header(datastruct, fields):
+    """
+    The part of a serialized object needed to list and index it without
+    building it: name, mtime and the given fields, at the top level or
+    in any interface.
+    """
+    header = { "name" : datastruct["name"], "mtime" : datastruct.get("mtime", 0) }
+    for field in fields:
+        if datastruct.has_key(field):
+            header[field] = datastruct[field]
+    if datastruct.has_key("interfaces"):
+        header["interfaces"] = {}
+        for (iname, intf) in datastruct["interfaces"].iteritems():
+            header["interfaces"][iname] = {}
+            for field in fields:
+                if intf.has_key(field):
+                    header["interfaces"][iname][field] = intf[field]
+    return header
+
 def remove_yum_olddata(path,logger=None):
     """
     Delete .olddata files that might be present from a failed run
@@ -600,15 +620,64 @@ def grab_tree(api_handle, obj):
     results.append(settings)  
     return results
 
+# process wide cache of blender() results, created on first use so
+# the size can come from settings.
+BLENDER_CACHE = None
+
+def get_blender_cache(api_handle=None):
+    global BLENDER_CACHE
+    if BLENDER_CACHE is None and api_handle is not None:
+        BLENDER_CACHE = lrucache.LRUCache(api_handle.settings().blender_cache_size)
+    return BLENDER_CACHE
+
+def blender_cache_invalidate(obj):
+    """
+    Forget the blended data of an object and of everything that inherits
+    from it.  Called when the object is saved or removed.
+    """
+    cache = get_blender_cache()
+    if cache is None:
+        return
+    for node in [ obj ] + obj.get_descendants():
+        cache.pop((node.COLLECTION_TYPE, node.name.lower(), True))
+        cache.pop((node.COLLECTION_TYPE, node.name.lower(), False))
+
+def blender_cache_clear():
+    cache = get_blender_cache()
+    if cache is not None:
+        cache.clear()
+
 def blender(api_handle,remove_hashes, root_obj):
     """
     Combine all of the data in an object tree from the perspective
     of that point on the tree, and produce a merged hash containing
     consolidated data.
+
+    Results are cached per object.  A cached result is only used if
+    every node of the tree is still the same object with the same mtime,
+    callers get a copy they are free to modify.  Trees with objects not
+    held by their collection (ex: copies being edited, which keep their
+    mtime until saved) are not cached.
     """
  
     settings = api_handle.settings()
     tree = grab_tree(api_handle, root_obj)
+
+    cache = get_blender_cache(api_handle)
+    key   = (root_obj.COLLECTION_TYPE, str(root_obj.name).lower(), remove_hashes)
+    stamp = [ (id(node), getattr(node, "mtime", None)) for node in tree ]
+    # the last node is the settings
+    cacheable = True
+    for node in tree[:-1]:
+        if not node.config.get_items(node.COLLECTION_TYPE).holds(node):
+            cacheable = False
+            break
+    cached = None
+    if cacheable:
+        cached = cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return copy.deepcopy(cached[1])
+
     tree.reverse()  # start with top of tree, override going down
     results = {}
     for node in tree:
@@ -701,6 +770,8 @@ def blender(api_handle,remove_hashes, root_obj):
         results["distro_name"]  = "N/A"
         results["image_name"]   = results["name"]
 
+    if cacheable:
+        cache.set(key, (stamp, copy.deepcopy(results)))
     return results
 
 def flatten(data):
@@ -1652,11 +1723,15 @@ def is_remote_file(file):
     else:
        return False
 
-def subprocess_sp(logger, cmd, shell=True):
+def subprocess_sp(logger, cmd, shell=True, env=None):
+    """
+    Runs cmd, returns its output and return code.  env, if given, is the
+    whole environment of the command instead of the one of this process.
+    """
     if logger is not None:
         logger.info("running: %s" % cmd)
     try:
-        sp = sub_process.Popen(cmd, shell=shell, stdout=sub_process.PIPE, stderr=sub_process.PIPE, close_fds=True)
+        sp = sub_process.Popen(cmd, shell=shell, stdout=sub_process.PIPE, stderr=sub_process.PIPE, close_fds=True, env=env)
     except OSError:
         if logger is not None:
             log_exc(logger)
@@ -1669,12 +1744,12 @@ def subprocess_sp(logger, cmd, shell=True):
         logger.debug("received on stderr: %s" % err)
     return out, rc
 
-def subprocess_call(logger, cmd, shell=True):
-    data, rc = subprocess_sp(logger, cmd, shell=shell)
+def subprocess_call(logger, cmd, shell=True, env=None):
+    data, rc = subprocess_sp(logger, cmd, shell=shell, env=env)
     return rc
 
-def subprocess_get(logger, cmd, shell=True):
-    data, rc = subprocess_sp(logger, cmd, shell=shell)
+def subprocess_get(logger, cmd, shell=True, env=None):
+    data, rc = subprocess_sp(logger, cmd, shell=shell, env=env)
     return data
 
 def popen2(args, **kwargs):
@@ -1799,17 +1874,24 @@ def get_methods_from_fields(obj, fields):
         ds[k] = setfn
     return ds
 
-def to_datastruct_from_fields(obj, fields):
+def to_datastruct_from_fields(obj, fields, keys=None):
+    """
+    If keys is a list of names, only these are read from obj.
+    """
+    if keys:
+        wanted = dict([ (k, True) for k in keys ])
     ds = {}
     for elem in fields:
         k = elem[0]
         if k.startswith("*") or k.find("widget") != -1:
             continue
+        if keys and not wanted.has_key(k):
+            continue
         data = getattr(obj, k)
         ds[k] = data
     # interfaces on systems require somewhat special handling
     # they are the only exception in Cobbler.
-    if obj.COLLECTION_TYPE == "system":
+    if obj.COLLECTION_TYPE == "system" and (not keys or wanted.has_key("interfaces")):
         ds["interfaces"] = copy.deepcopy(obj.interfaces)
         #for interface in ds["interfaces"].keys():
         #    for k in ds["interfaces"][interface].keys():
@@ -0,0 +1,297 @@
+"""
+Runs a function over a list of items in forked worker processes, for
+the CPU bound parts of a sync (template rendering, blending) that
+threads would not speed up.  Workers inherit the loaded configuration
+from the parent, results are sent back pickled and returned in the
+order of the items, so the output does not depend on the number of
+workers.  cobblerd forks them while other threads run: locks these
+threads may hold are replaced in the workers (see after_fork), and
+workers that still get stuck are killed after a timeout.
+
+ThreadPool does the same in threads, for work that mostly waits on
+other programs or on the network (power commands, repository mirroring),
+and can limit how many items sharing a key (ex: a host) run at once.
+
+Copyright 2006-2009, Red Hat, Inc
+Michael DeHaan <mdehaan@redhat.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+02110-1301  USA
+"""
+
+import os
+import sys
+import time
+import errno
+import signal
+import select
+import threading
+import traceback
+import cPickle
+
+import lrucache
+from cexceptions import *
+from utils import _
+
+# called first thing in every worker process
+AFTER_FORK = [ lrucache.after_fork ]
+
+def after_fork(func):
+    """
+    Registers func to be called in worker processes right after the
+    fork, to reset state (ex: locks) another thread of the parent may
+    have been using at the time.
+    """
+    AFTER_FORK.append(func)
+
+class WorkerPool:
+
+    def __init__(self, workers, logger=None, timeout=0):
+        """
+        Constructor.  workers is the number of processes to use, 1 or
+        less means everything runs in the calling process.  Workers not
+        done after timeout seconds (0: no limit) are killed.
+        """
+        try:
+            self.workers = int(workers)
+        except (TypeError, ValueError):
+            self.workers = 1
+        try:
+            self.timeout = float(timeout)
+        except (TypeError, ValueError):
+            self.timeout = 0
+        self.logger = logger
+
+    def map(self, func, items, child_init=None, child_done=None):
+        """
+        Returns a tuple ([ func(x) for x in items ], done).
+
+        Items are dealt round robin to the workers.  child_init and
+        child_done are only called when running in forked workers, first
+        thing and after the last item respectively, and done is the list
+        of what child_done returned in each worker (empty when everything
+        ran in process).  They are meant for state, like counters, that a
+        worker has to hand back to the parent.
+        """
+        items = list(items)
+        workers = min(self.workers, len(items))
+        if workers <= 1:
+            return ([ func(x) for x in items ], [])
+
+        children = []
+        for k in range(0, workers):
+            (rfd, wfd) = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(rfd)
+                self.__child(wfd, func, items[k::workers], child_init, child_done)
+            os.close(wfd)
+            children.append((pid, rfd))
+
+        (outputs, pending) = self.__collect([ rfd for (pid, rfd) in children ])
+
+        errors = []
+        replies = []
+        for (pid, rfd) in children:
+            if rfd in pending:
+                os.kill(pid, signal.SIGKILL)
+                os.close(rfd)
+            os.waitpid(pid, 0)
+            if rfd in pending:
+                reply = ("error", "worker %s killed after %s seconds" % (pid, self.timeout))
+                errors.append(reply[1])
+                replies.append(reply)
+                continue
+            try:
+                reply = cPickle.loads(outputs[rfd])
+            except (EOFError, cPickle.UnpicklingError):
+                reply = ("error", "worker %s exited without results" % pid)
+            if reply[0] == "error":
+                errors.append(reply[1])
+            replies.append(reply)
+
+        if len(errors) > 0:
+            if self.logger is not None:
+                for error in errors:
+                    self.logger.error(error)
+            raise CX(_("%s of %s workers failed") % (len(errors), workers))
+
+        results = [ None ] * len(items)
+        done = []
+        for k in range(0, workers):
+            (status, worker_results, worker_done) = replies[k]
+            results[k::workers] = worker_results
+            done.append(worker_done)
+        return (results, done)
+
+    def __child(self, wfd, func, items, child_init, child_done):
+        """
+        Body of a worker process, never returns.
+        """
+        try:
+            try:
+                for func_after_fork in AFTER_FORK:
+                    func_after_fork()
+                if child_init is not None:
+                    child_init()
+                results = [ func(x) for x in items ]
+                worker_done = None
+                if child_done is not None:
+                    worker_done = child_done()
+                data = cPickle.dumps(("ok", results, worker_done), cPickle.HIGHEST_PROTOCOL)
+            except:
+                (t, v, tb) = sys.exc_info()
+                message = "".join(traceback.format_exception(t, v, tb))
+                data = cPickle.dumps(("error", message), cPickle.HIGHEST_PROTOCOL)
+            while len(data) > 0:
+                written = os.write(wfd, data)
+                data = data[written:]
+            os.close(wfd)
+        finally:
+            # skip atexit handlers and buffers inherited from the parent
+            os._exit(0)
+
+    def __collect(self, fds):
+        """
+        Read every pipe to its end.  They are read together so that a
+        worker blocked on a full pipe does not stall the others.  Returns
+        what was read and the pipes still open when the timeout expired.
+        """
+        outputs = {}
+        for fd in fds:
+            outputs[fd] = []
+        pending = list(fds)
+        deadline = None
+        if self.timeout > 0:
+            deadline = time.time() + self.timeout
+        while len(pending) > 0:
+            try:
+                if deadline is None:
+                    (ready, ignored, ignored2) = select.select(pending, [], [])
+                else:
+                    left = deadline - time.time()
+                    if left <= 0:
+                        break
+                    (ready, ignored, ignored2) = select.select(pending, [], [], left)
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in ready:
+                chunk = os.read(fd, 65536)
+                if chunk == "":
+                    os.close(fd)
+                    pending.remove(fd)
+                else:
+                    outputs[fd].append(chunk)
+        for fd in fds:
+            outputs[fd] = "".join(outputs[fd])
+        return (outputs, pending)
+
+class ThreadPool:
+
+    def __init__(self, workers, per_key=0, logger=None):
+        """
+        Constructor.  workers is the number of threads to use, 1 or less
+        means everything runs in the calling thread.  per_key, if more
+        than 0, is the most items with the same key run at once.
+        """
+        try:
+            self.workers = int(workers)
+        except (TypeError, ValueError):
+            self.workers = 1
+        try:
+            self.per_key = int(per_key)
+        except (TypeError, ValueError):
+            self.per_key = 0
+        self.logger = logger
+
+    def map(self, func, items, key=None):
+        """
+        Returns [ func(x) for x in items ].  key(x), if given, is the key
+        of an item: items are started in order, except that one whose key
+        already has per_key items running waits and the next items are
+        started first.  If func raises for any item, the other items are
+        still run and a CX is raised at the end.
+        """
+        items = list(items)
+        self.pending = range(0, len(items))
+        self.results = [ None ] * len(items)
+        self.errors  = []
+        self.active  = {}
+        self.cond    = threading.Condition()
+
+        workers = min(self.workers, len(items))
+        if workers <= 1:
+            self.__work(func, items, key)
+        else:
+            threads = []
+            for k in range(0, workers):
+                thr = threading.Thread(target=self.__work, args=(func, items, key))
+                thr.start()
+                threads.append(thr)
+            for thr in threads:
+                thr.join()
+
+        if len(self.errors) > 0:
+            if self.logger is not None:
+                for error in self.errors:
+                    self.logger.error(error)
+            raise CX(_("%s of %s items failed") % (len(self.errors), len(items)))
+        return self.results
+
+    def __next(self, items, key):
+        """
+        Takes the first pending item whose key is not busy, waiting if
+        all of them are.  Returns None once none is left.
+        """
+        self.cond.acquire()
+        try:
+            while len(self.pending) > 0:
+                for x in range(0, len(self.pending)):
+                    k = self.pending[x]
+                    item_key = None
+                    if key is not None and self.per_key > 0:
+                        item_key = key(items[k])
+                        if self.active.get(item_key, 0) >= self.per_key:
+                            continue
+                        self.active[item_key] = self.active.get(item_key, 0) + 1
+                    del self.pending[x]
+                    return (k, item_key)
+                self.cond.wait()
+            return None
+        finally:
+            self.cond.release()
+
+    def __work(self, func, items, key):
+        while True:
+            job = self.__next(items, key)
+            if job is None:
+                return
+            (k, item_key) = job
+            try:
+                try:
+                    self.results[k] = func(items[k])
+                except:
+                    (t, v, tb) = sys.exc_info()
+                    self.errors.append("".join(traceback.format_exception(t, v, tb)))
+            finally:
+                self.cond.acquire()
+                try:
+                    if item_key is not None:
+                        self.active[item_key] = self.active[item_key] - 1
+                    self.cond.notifyAll()
+                finally:
+                    self.cond.release()
@@ -22,9 +22,45 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 import yaml
 import os
 import urllib
+import xmlrpclib
+import threading
 
 from cobbler.services import CobblerSvc
 
+SETTINGS_FILE = "/etc/cobbler/settings"
+
+# settings as of the last time the file changed, see get_settings
+SETTINGS = { "mtime" : None, "data" : {} }
+
+# one XMLRPC connection per worker thread, kept open between requests
+# (cobblerd speaks HTTP/1.1)
+CONNECTIONS = threading.local()
+
+def get_settings():
+    """
+    Returns the parsed settings file, only read again when its mtime
+    changes.
+    """
+    mtime = os.stat(SETTINGS_FILE).st_mtime
+    if mtime != SETTINGS["mtime"]:
+        fd = open(SETTINGS_FILE)
+        data = fd.read()
+        fd.close()
+        SETTINGS["data"] = yaml.load(data) or {}
+        SETTINGS["mtime"] = mtime
+    return SETTINGS["data"]
+
+def get_remote(remote_port):
+    """
+    Returns this thread's connection to cobblerd, replaced if the port
+    changes in the settings.
+    """
+    url = "http://127.0.0.1:%s" % remote_port
+    if getattr(CONNECTIONS, "url", None) != url:
+        CONNECTIONS.remote = xmlrpclib.Server(url, allow_none=True)
+        CONNECTIONS.url = url
+    return CONNECTIONS.remote
+
 def application(environ, start_response):
 
     my_uri = urllib.unquote(environ['REQUEST_URI'])
@@ -58,14 +94,12 @@ def application(environ, start_response):
     form["REMOTE_MAC"]  = form.get("HTTP_X_RHN_PROVISIONING_MAC_0", None)
 
     # Read config for the XMLRPC port to connect to:
-    fd = open("/etc/cobbler/settings")
-    data = fd.read()
-    fd.close()
-    ydata = yaml.load(data)
+    ydata = get_settings()
     remote_port = ydata.get("xmlrpc_port",25151)
 
     # instantiate a CobblerWeb object
-    cw = CobblerSvc(server = "http://127.0.0.1:%s" % remote_port)
+    cw = CobblerSvc(server = "http://127.0.0.1:%s" % remote_port,
+                    remote = get_remote(remote_port))
 
     # check for a valid path/mode
     # handle invalid paths gracefully
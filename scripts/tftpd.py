@@ -3,7 +3,9 @@
 """
 SYNOPSIS
     tftpd.py [-h,--help] [-v,--verbose] [-d,--debug] [--version]
-             [--port=<port>(69)]
+             [--port=<port>(69)] [--workers=<n>(1)]
+             [--stats_file=<path>] [--stats_interval=<seconds>(300)]
+             [--file_cache_size=<MB>(256)] [--render_cache_size=<n>(1000)]
 
 DESCRIPTION
 A python, cobbler integrated TFTP server.  It is suitable to call via
@@ -11,6 +13,24 @@ xinetd, or as a stand-alone daemon.  If called via xinetd, it will run,
 handling requests, until it has been idle for at least 30 seconds, and
 will then exit.
 
+As a stand-alone daemon, --workers=<n> forks n worker processes.  Each
+gets its own SO_REUSEPORT socket on the well known port, so the kernel
+spreads new requests over them; where SO_REUSEPORT is not available the
+workers share one socket.  Workers that die are restarted.
+
+Every worker keeps transfer and latency counters.  They are logged every
+--stats_interval seconds and on SIGUSR1, and if --stats_file is given
+written to that file (with the worker number appended when there are
+several workers).
+
+Files served from the tftpboot tree are cached in memory, up to
+--file_cache_size megabytes per worker.  Large ones (kernels, initrds)
+are mmap'd read-only rather than copied, so workers share the pages.
+Cached files are rechecked (mtime, size, inode) on every request;
+files should be replaced (as 'cobbler sync' does) rather than rewritten
+in place.  Rendered templates are cached per system and template, and
+dropped as soon as cobbler's last_modified_time advances.
+
 This server queries cobbler for information about hosts that make requests,
 and will instantiate template files from the materialized hosts' 
 'fetchable_files' attribute.
@@ -40,6 +60,7 @@ TODO
 VERSION=0.5
 
 import sys, os, stat, errno, time, optparse, re, socket, pwd, traceback
+import signal, mmap
 import logging, logging.handlers
 import xmlrpclib
 from collections import deque
@@ -47,13 +68,13 @@ from collections import deque
 from fnmatch import fnmatch
 
 from cobbler.utils import local_get_cobbler_api_url, tftpboot_location
+from cobbler.lrucache import LRUCache
 
 import tornado.ioloop as ioloop
 import cobbler.templar
 import Cheetah # need exception types
 
 from struct import *;
-from subprocess import *;
 #import functools
 
 # Data/Defines
@@ -94,9 +115,18 @@ OPTIONS = {
 
     "logger"     : "stream",
 
-    "file_cmd"   : "/usr/bin/file",
+    "file_cmd"   : "/usr/bin/file", # no longer used, see is_text_file
     "user"       : "nobody",
 
+    "workers"        : 1,
+    "stats_file"     : None,
+    "stats_interval" : 300,
+
+    "file_cache_size"   : 256,   # MB
+    "mmap_threshold"    : 65536, # files this big or bigger are mmap'd
+    "render_cache_size" : 1000,  # rendered templates
+    "mtime_check"       : 2,     # seconds between last_modified_time calls
+
     # the well known socket.  needs to be global for timeout
     # Using the options hash as a hackaround for python's
     # "create a new object at local scope by default" design.
@@ -117,6 +147,194 @@ ERRORS = [
 
 REQUESTS = None
 
+# Per worker counters, see log_stats
+STATS = {
+    "worker"         : 0,
+    "requests"       : 0,   # RRQs received
+    "completed"      : 0,   # transfers that sent the whole file
+    "errors"         : 0,   # requests answered with an ERROR packet
+    "timeouts"       : 0,   # requests that ended in a timeout
+    "active"         : 0,
+    "bytes"          : 0,   # DATA payload sent
+    "setup_time"     : 0.0, # RRQ to first reply: lookup, remap, render
+    "setup_max"      : 0.0,
+    "transfer_time"  : 0.0, # RRQ to end of the request
+    "transfer_max"   : 0.0,
+    "file_hits"      : 0,
+    "file_misses"    : 0,
+    "render_hits"    : 0,
+    "render_misses"  : 0,
+}
+
+# path -> ((mtime, size), is_text), see is_text_file
+TEXT_CACHE = {}
+TEXT_CACHE_SIZE = 1024
+
+# bytes that show up in text files.  Like file(1), anything with NULs or
+# with too many other control characters is binary.
+TEXT_CHARS = "".join(map(chr, [7,8,9,10,12,13,27] + range(0x20, 0x100)))
+ALL_CHARS  = "".join(map(chr, range(0, 0x100)))
+
+def is_text_file(filename):
+    """Returns True if filename looks like a text file (and so should
+       be rendered as a template).  Results are cached per path and
+       are rechecked when the file's mtime or size change."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return False
+    key = (st.st_mtime, st.st_size)
+    cached = TEXT_CACHE.get(filename)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        fd = open(filename, "rb")
+        block = fd.read(8192)
+        fd.close()
+    except IOError:
+        return False
+
+    if not block or "\0" in block:
+        text = False
+    else:
+        control = block.translate(ALL_CHARS, TEXT_CHARS)
+        text = float(len(control)) / len(block) < 0.30
+
+    if len(TEXT_CACHE) >= TEXT_CACHE_SIZE:
+        TEXT_CACHE.clear()
+    TEXT_CACHE[filename] = (key, text)
+    return text
+
+class FileCache:
+    """A cache of file contents, bounded by total size and dropping the
+       least recently used files first.  Files of at least mmap_threshold
+       bytes are kept as read-only mmaps, smaller ones as strings; both
+       can be sliced, so either can be handed to RenderedFile.
+       Entries are checked against the file's mtime, size and inode on
+       every lookup."""
+    def __init__(self, max_bytes, mmap_threshold):
+        self.max_bytes      = max_bytes
+        self.mmap_threshold = mmap_threshold
+        self.entries        = {} # path -> [stamp, buffer, last used]
+        self.size           = 0
+        self.tick           = 0
+
+    def get(self, path):
+        """Returns the contents of path.  Raises IOError if it can not
+           be read."""
+        try:
+            st = os.stat(path)
+        except OSError, e:
+            raise IOError(e.errno, e.strerror, path)
+        stamp = (st.st_mtime, st.st_size, st.st_ino)
+        self.tick += 1
+
+        entry = self.entries.get(path)
+        if entry is not None:
+            if entry[0] == stamp:
+                STATS["file_hits"] += 1
+                entry[2] = self.tick
+                return entry[1]
+            self.drop(path)
+
+        STATS["file_misses"] += 1
+        fd = open(path, "rb")
+        try:
+            if st.st_size >= self.mmap_threshold and st.st_size > 0:
+                data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = fd.read()
+        finally:
+            fd.close()
+
+        if len(data) <= self.max_bytes:
+            self.entries[path] = [stamp, data, self.tick]
+            self.size += len(data)
+            self.shrink()
+        return data
+
+    def drop(self, path):
+        # an mmap still in use by a transfer is closed when the
+        # transfer lets go of it, so never close() it here
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def shrink(self):
+        if self.size <= self.max_bytes:
+            return
+        ages = [(entry[2], path) for (path, entry) in self.entries.items()]
+        ages.sort()
+        for (age, path) in ages:
+            if self.size <= self.max_bytes:
+                break
+            self.drop(path)
+
+# created in main(), once the options are known
+FILE_CACHE   = None
+RENDER_CACHE = None
+
+# cobbler's last_modified_time as of the last check
+COBBLER_MTIME = { "value" : None, "checked" : 0 }
+
+def check_cobbler_mtime():
+    """Drop the rendered templates once anything in cobbler changed.
+       Asks cobblerd at most once every mtime_check seconds."""
+    now = time.time()
+    if now - COBBLER_MTIME["checked"] < OPTIONS["mtime_check"]:
+        return
+    try:
+        mtime = COBBLER_HANDLE.last_modified_time()
+    except:
+        (etype,eval,) = sys.exc_info()[:2]
+        logging.warn("Unable to get last_modified_time, dropping rendered "
+                     "templates: %s" % eval)
+        RENDER_CACHE.clear()
+        return
+    COBBLER_MTIME["checked"] = now
+    if mtime != COBBLER_MTIME["value"]:
+        if COBBLER_MTIME["value"] is not None:
+            logging.debug("cobbler changed, dropping rendered templates")
+        RENDER_CACHE.clear()
+        COBBLER_MTIME["value"] = mtime
+
+def log_stats(level=logging.INFO):
+    """Log the counters of this worker, and publish them to the
+       stats file if there is one."""
+    report = ("worker %(worker)d: %(requests)d requests, %(completed)d "
+              "completed, %(errors)d errors, %(timeouts)d timeouts, "
+              "%(active)d active, %(bytes)d bytes sent, file cache "
+              "%(file_hits)d/%(file_misses)d, render cache "
+              "%(render_hits)d/%(render_misses)d hits/misses" % STATS)
+    finished = STATS["requests"] - STATS["active"]
+    if finished > 0:
+        report += (", setup %.3fs avg %.3fs max, transfer %.3fs avg %.3fs max"
+                   % (STATS["setup_time"] / finished, STATS["setup_max"],
+                      STATS["transfer_time"] / finished, STATS["transfer_max"]))
+    logging.log(level, report)
+
+    if OPTIONS["stats_file"]:
+        path = OPTIONS["stats_file"]
+        if OPTIONS["workers"] > 1:
+            path = "%s.%d" % (path, STATS["worker"])
+        try:
+            fd = open(path + ".tmp", "w")
+            keys = STATS.keys()
+            keys.sort()
+            for k in keys:
+                fd.write("%s %s\n" % (k, STATS[k]))
+            fd.close()
+            os.rename(path + ".tmp", path)
+        except (IOError, OSError), e:
+            logging.warn("Unable to write stats to %s: %s" % (path, e))
+
+def stats_timer():
+    log_stats()
+    if OPTIONS["stats_interval"] > 0:
+        ioloop.IOLoop.instance().add_timeout(
+            time.time() + OPTIONS["stats_interval"], stats_timer)
+
 class RenderedFile:
     """A class to manage rendered files, without changing the logic
        of the rest of the TFTP server.  It replaces the file object
@@ -388,6 +606,9 @@ class Request:
         self.state       = TFTP_OPCODE_RRQ
         self.expand      = False
         self.templar     = templar
+        self.start       = time.time()
+        self.completed   = False
+        self.finished    = False
 
         # Sanitize input more
         # Strip out \s
@@ -407,6 +628,8 @@ class Request:
             self.filename = None
 
         OPTIONS["active"] += 1
+        STATS["requests"] += 1
+        STATS["active"] += 1
         self.system = XMLRPCSystem(self.remote_addr[0])
 
     def _remap_strip_ip(self,filename):
@@ -596,9 +819,24 @@ class Request:
         return self._remap_via_profiles(trimmed)
 
     def _render_template(self):
+        check_cobbler_mtime()
         try:
-            return RenderedFile(self.templar.render(open(self.filename,"r"),
-                                self.system.attrs,None))
+            st = os.stat(self.filename)
+            key = (self.system.name, self.filename)
+            stamp = (st.st_mtime, st.st_size)
+            cached = RENDER_CACHE.get(key)
+            if cached is not None and cached[0] == stamp:
+                STATS["render_hits"] += 1
+                return RenderedFile(cached[1])
+            STATS["render_misses"] += 1
+            data = self.templar.render(open(self.filename,"r"),
+                                       self.system.attrs,None)
+            RENDER_CACHE.set(key, (stamp, data))
+            return RenderedFile(data)
+        except OSError, e:
+            logging.warn('Unable to expand template: %s: %s'
+                         % (self.filename,e))
+            return None
         except Cheetah.Parser.ParseError, e:
             logging.warn('Unable to expand template: %s: %s'
                          % (self.filename,e))
@@ -620,11 +858,7 @@ class Request:
         logging.debug('host %s getting %s: %s' %
                         (self.system.name,self.filename,self.type))
         if self.type == "template":
-            # TODO: Add file magic here
-            output = Popen([OPTIONS["file_cmd"],self.filename],
-                           stdout=PIPE,stderr=STDOUT,
-                           close_fds=True).communicate()[0]
-            if output.find(" text") >= 0:
+            if is_text_file(self.filename):
                 self.file = self._render_template()
                 if self.file:
                     self.block_count = 0
@@ -633,8 +867,8 @@ class Request:
                 else:
                     logging.debug('Template failed to render.')
             else:
-                logging.debug('Not rendering binary file %s (%s).'
-                              % (self.filename,output))
+                logging.debug('Not rendering binary file %s.'
+                              % self.filename)
         elif self.type == "hash_value":
             self.file = RenderedFile(self.system.attrs[self.filename])
             self.block_count = 0
@@ -651,14 +885,15 @@ class Request:
                           (self.filename,self.remote_addr));
             # Templates are specified by an absolute path
             if self.type == "template":
-                self.file = open(self.filename,'rb',0)
+                path = self.filename
             else:
                 # TODO! restrict.  Chroot?
                 # We are sanitizing in the input, but a second line of defense
                 # wouldn't be a bad idea
-                self.file = open(OPTIONS["prefix"] + "/" + self.filename,'rb',0)
+                path = OPTIONS["prefix"] + "/" + self.filename
+            self.file = RenderedFile(FILE_CACHE.get(path))
             self.block_count = 0
-            self.file_size = os.fstat(self.file.fileno()).st_size
+            self.file_size = len(self.file.data)
         except IOError:
             logging.debug('%s requested %s: file not found.' %
                           (self.remote_addr, self.filename))
@@ -684,6 +919,17 @@ class Request:
             io_loop.remove_timeout(self.timeout)
             self.timeout = None
 
+        if not self.finished:
+            self.finished = True
+            elapsed = time.time() - self.start
+            STATS["active"] -= 1
+            STATS["transfer_time"] += elapsed
+            STATS["transfer_max"] = max(STATS["transfer_max"], elapsed)
+            if self.completed:
+                STATS["completed"] += 1
+            elif hasattr(self, "error_code"):
+                STATS["errors"] += 1
+
         OPTIONS["active"] -= 1
         if (OPTIONS["idle"] > 0
             and OPTIONS["active"] == 0 and OPTIONS["idle_timer"] is None):
@@ -693,6 +939,7 @@ class Request:
         # We timed out.  We're done... (I hope)
         logging.info('Timeout.  Transfer of %s done' % self.filename)
         self.timeout = None
+        STATS["timeouts"] += 1
         self.finish()
 
     def handle_input(self,packet):
@@ -747,12 +994,14 @@ class Request:
                 # We're done.
                 logging.info('Transfer of %s to %s done'
                              % (self.filename,self.remote_addr))
+                self.completed = True
                 return None
 
             self.file.seek(self.block_count * self.options["blksize"])
             data = self.file.read(self.options["blksize"])
 
             self.state = TFTP_OPCODE_DATA
+            STATS["bytes"] += len(data)
             # Block Count starts at 1, so offset
             logging.log(9,"DATA to %s/%d, block_count %d/%d, size %d(%d/%d)" % (
                 self.remote_addr[0],self.remote_addr[1],
@@ -1011,6 +1260,9 @@ def new_req(sock, templar, fd, events):
 
         # Ask the request what to do now..
         reply = request.reply()
+        setup = time.time() - request.start
+        STATS["setup_time"] += setup
+        STATS["setup_max"] = max(STATS["setup_max"], setup)
         if reply:
             new_address.sendto(reply.marshall(),address)
 
@@ -1022,6 +1274,97 @@ def new_req(sock, templar, fd, events):
         OPTIONS["idle_timer"] = io_loop.add_timeout(time.time()+OPTIONS["idle"],
                                                     lambda : idle_out())
 
+# Linux value, for pythons whose socket module predates the option
+SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", 15)
+
+def bind_sockets(port, workers):
+    """Bind the well known port.  With several workers, try to give each
+       one its own socket using SO_REUSEPORT, so the kernel balances the
+       requests.  Otherwise all workers share a single socket."""
+    socks = []
+    if workers > 1 and sys.platform.startswith("linux"):
+        try:
+            for i in range(0, workers):
+                sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM, 0)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                socks.append(sock)
+                sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+                sock.bind(("",port))
+            return socks
+        except socket.error, e:
+            if e[0] in (errno.EPERM, errno.EACCES):
+                raise
+            logging.info("SO_REUSEPORT not available (%s), sharing one socket"
+                         % e)
+            for sock in socks:
+                sock.close()
+
+    sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM, 0)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("",port))
+    return [ sock ]
+
+def prefork(workers, socks):
+    """Fork the worker processes, returning the worker number in each of
+       them.  The parent stays behind to restart workers that die and to
+       pass SIGTERM/SIGINT/SIGUSR1 on, and exits when told to stop."""
+    children = {}
+    state = { "stopping" : False }
+
+    def spawn(worker):
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+                signal.signal(signum, signal.SIG_DFL)
+            return True
+        children[pid] = worker
+        return False
+
+    def stop(signum, frame):
+        state["stopping"] = True
+        for pid in children.keys():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def forward(signum, frame):
+        for pid in children.keys():
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+    for worker in range(0, workers):
+        if spawn(worker):
+            return worker
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, forward)
+    logging.info("Started %d workers" % workers)
+
+    while len(children) > 0:
+        try:
+            (pid, status) = os.wait()
+        except OSError, e:
+            if e[0] == errno.EINTR:
+                continue
+            raise
+        worker = children.pop(pid, None)
+        if worker is None or state["stopping"]:
+            continue
+        logging.warn("Worker %d (pid %d) exited with status %d, restarting"
+                     % (worker, pid, status))
+        # don't spin if workers die straight away
+        time.sleep(1)
+        if spawn(worker):
+            return worker
+
+    for sock in socks:
+        sock.close()
+    sys.exit(0)
+
 def main():
     # If we're called from xinetd, set idle to non-zero
     mode = os.fstat(sys.stdin.fileno()).st_mode
@@ -1039,8 +1382,17 @@ def main():
                       help="Where files are stored by default ["
                                                        +OPTIONS["prefix"]+"]"),
         logger = dict(type="string",help="How to log"),
-        file_cmd= dict(type="string",help="The location of the 'file' command"),
+        file_cmd= dict(type="string",help="Unused, kept for compatibility"),
         user  = dict(type="string",help="The user to run as [nobody]"),
+        workers = dict(type="int",help="Number of worker processes [1]"),
+        stats_file = dict(type="string",
+                          help="Where to publish per-worker counters"),
+        stats_interval = dict(type="int",
+                          help="How often to log/publish counters, 0: never"),
+        file_cache_size = dict(type="int",
+                          help="MB of file contents to cache per worker"),
+        render_cache_size = dict(type="int",
+                          help="Number of rendered templates to cache"),
     )
 
     parser = optparse.OptionParser(
@@ -1098,15 +1450,15 @@ def main():
         logging.getLogger().setLevel(logging.WARN)
   
     if stat.S_ISSOCK(mode):
-        OPTIONS["sock"] = socket.fromfd(sys.stdin.fileno(),
+        # xinetd hands us one socket, so there is nothing to spread
+        OPTIONS["workers"] = 1
+        socks = [ socket.fromfd(sys.stdin.fileno(),
                              socket.AF_INET,
                              socket.SOCK_DGRAM,
-                             0)
+                             0) ]
     else:
-        OPTIONS["sock"] = socket.socket(socket.AF_INET,socket.SOCK_DGRAM, 0)
-        OPTIONS["sock"].setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
-            OPTIONS["sock"].bind(("",OPTIONS["port"]))
+            socks = bind_sockets(OPTIONS["port"], OPTIONS["workers"])
         except socket.error, e:
             if e[0] in (errno.EPERM, errno.EACCES):
                 print "Unable to bind to port %d" % OPTIONS["port"]
@@ -1114,12 +1466,28 @@ def main():
             else:
                 raise
 
-    OPTIONS["sock"].setblocking(0)
+    for sock in socks:
+        sock.setblocking(0)
 
     if os.getuid() == 0:
         uid = pwd.getpwnam(OPTIONS["user"])[2]
         os.setreuid(uid,uid)
 
+    if OPTIONS["workers"] > 1:
+        # only returns in the workers
+        STATS["worker"] = prefork(OPTIONS["workers"], socks)
+    OPTIONS["sock"] = socks[STATS["worker"] % len(socks)]
+    for sock in socks:
+        if sock is not OPTIONS["sock"]:
+            sock.close()
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: log_stats(logging.WARN))
+
+    global FILE_CACHE, RENDER_CACHE
+    FILE_CACHE = FileCache(OPTIONS["file_cache_size"] * 1024 * 1024,
+                           OPTIONS["mmap_threshold"])
+    RENDER_CACHE = LRUCache(OPTIONS["render_cache_size"])
+
     # This takes a while, so do it after we open the port, so we
     # don't drop the packet that spawned us
     templar = cobbler.templar.Templar(None)
@@ -1131,6 +1499,8 @@ def main():
     if OPTIONS["idle"] > 0:
         OPTIONS["idle_timer"] = io_loop.add_timeout(time.time()+OPTIONS["idle"],
                                                     lambda : idle_out())
+    if OPTIONS["stats_interval"] > 0:
+        io_loop.add_timeout(time.time() + OPTIONS["stats_interval"], stats_timer)
 
     logging.info('Starting Eventloop')
     try:
@@ -1141,6 +1511,7 @@ def main():
             logging.info('Exiting')
     finally:
         OPTIONS["sock"].close()
+        log_stats()
     return 0
     
 if __name__ == "__main__":
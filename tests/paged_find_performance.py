@@ -0,0 +1,71 @@
+#--------------------------------------------------
+# compares the cost of getting one page of a sorted system listing the
+# way find_items_paged used to (sort every object, then slice) with the
+# sorted views the collections now keep, for N systems.  Also times the
+# upkeep of a view as systems are edited.
+#
+# usage: python paged_find_performance.py [N ...]
+
+import sys
+import time
+import random
+
+from cobbler.collection import SortedView
+
+SIZES = [ 1000, 10000, 100000 ]
+PAGE = 25
+
+class FakeSystem:
+    def __init__(self, x):
+        self.name = "benchmark-%s" % x
+        self.profile = "p%s" % random.randint(0, 50)
+        self.mtime = time.time()
+    def to_datastruct(self):
+        # systems have a few dozen fields, building the hash is the cost
+        data = { "name" : self.name, "profile" : self.profile, "mtime" : self.mtime }
+        for k in xrange(0, 40):
+            data["field%s" % k] = ""
+        return data
+    def sort_key(self, sort_fields=[]):
+        data = self.to_datastruct()
+        return [data.get(x,"") for x in sort_fields]
+
+def old_page(systems, sort_field, page):
+    # what find_items_paged did for every call
+    sortdata = [ (x.sort_key([sort_field, "name"]), x) for x in systems ]
+    sortdata.sort()
+    items = [ x for (key, x) in sortdata ][PAGE*(page-1):PAGE*page]
+    return [ x.to_datastruct() for x in items ]
+
+def new_page(listing, view, page):
+    names = view.names(PAGE*(page-1), PAGE*page)
+    return [ listing[n.lower()].to_datastruct() for n in names ]
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return (time.time() - start, result)
+
+def run(n):
+    systems = [ FakeSystem(x) for x in xrange(0, n) ]
+    listing = dict([ (s.name.lower(), s) for s in systems ])
+
+    (t_old, old) = timed(old_page, systems, "profile", 2)
+    view = SortedView("profile")
+    (t_build, ignored) = timed(view.build, systems)
+    (t_new, new) = timed(new_page, listing, view, 2)
+    assert [ x["name"] for x in old ] == [ x["name"] for x in new ]
+
+    edits = [ random.choice(systems) for x in xrange(0, 1000) ]
+    start = time.time()
+    for s in edits:
+        s.profile = "p%s" % random.randint(0, 50)
+        view.update(s)
+    t_edit = (time.time() - start) / len(edits)
+
+    print "%8d systems: sort+slice %8.4fs | view built once in %7.4fs, page %8.6fs, %8.6fs per edit" % (n, t_old, t_build, t_new, t_edit)
+
+if __name__ == "__main__":
+    sizes = [ int(x) for x in sys.argv[1:] ] or SIZES
+    for n in sizes:
+        run(n)
@@ -0,0 +1,101 @@
+#--------------------------------------------------
+# compares how long it takes to load N system records with
+# serializer_catalog (one JSON file per object) and with
+# serializer_sqlite (one database file).  Everything is written
+# to a scratch directory, the real /var/lib/cobbler is not touched.
+#
+# usage: python serializer_performance.py [N ...]
+
+import os
+import sys
+import time
+import glob
+import random
+import shutil
+import tempfile
+import simplejson
+import sqlite3 as sqlite
+
+import cobbler.modules.serializer_catalog as serializer_catalog
+import cobbler.modules.serializer_sqlite as serializer_sqlite
+
+SIZES = [ 1000, 10000, 100000 ]
+
+def random_mac():
+    mac = [ 0x00, 0x16, 0x3e,
+      random.randint(0x00, 0x7f),
+      random.randint(0x00, 0xff),
+      random.randint(0x00, 0xff) ]
+    return ':'.join(map(lambda x: "%02x" % x, mac))
+
+def make_system(x):
+    return {
+        "name"       : "benchmark-%s" % x,
+        "profile"    : "p1",
+        "depth"      : 2,
+        "mtime"      : time.time(),
+        "ks_meta"    : {},
+        "interfaces" : { "eth0" : { "mac_address" : random_mac(), "ip_address" : "", "dns_name" : "" } },
+    }
+
+class FakeItem:
+    def __init__(self, datastruct):
+        self.datastruct = datastruct
+        self.name = datastruct["name"]
+    def to_datastruct(self):
+        return self.datastruct
+
+class FakeCollection:
+    def __init__(self, items):
+        self.items = items
+    def collection_type(self):
+        return "system"
+    def __iter__(self):
+        return iter(self.items)
+
+def load_catalog(path):
+    # the same work serializer_catalog.deserialize_raw does, on a scratch dir
+    results = []
+    all_files = glob.glob("%s/*" % path)
+    all_files = serializer_catalog.filter_upgrade_duplicates(all_files)
+    for f in all_files:
+        fd = open(f)
+        results.append(simplejson.loads(fd.read(), encoding='utf-8'))
+        fd.close()
+    return results
+
+def run(n):
+    topdir = tempfile.mkdtemp(prefix="cobbler_serializer_")
+    try:
+        catalog = os.path.join(topdir, "systems.d")
+        os.makedirs(catalog)
+        serializer_sqlite.DB_FILE = os.path.join(topdir, "cobbler.db")
+
+        items = [FakeItem(make_system(x)) for x in xrange(0,n)]
+        for item in items:
+            fd = open(os.path.join(catalog, "%s.json" % item.name), "w+")
+            fd.write(simplejson.dumps(item.to_datastruct(), encoding="utf-8"))
+            fd.close()
+        serializer_sqlite.serialize(FakeCollection(items))
+
+        # mark the collection as migrated so the real catalog is not imported
+        conn = sqlite.connect(serializer_sqlite.DB_FILE)
+        conn.execute("INSERT OR IGNORE INTO migrations (collection) VALUES ('system')")
+        conn.commit()
+        conn.close()
+
+        time1 = time.time()
+        count1 = len(load_catalog(catalog))
+        time2 = time.time()
+        count2 = len(serializer_sqlite.deserialize_raw("system"))
+        time3 = time.time()
+        assert count1 == count2 == n
+
+        print "%8d objects: catalog %8.3f seconds, sqlite %8.3f seconds" % (n, time2 - time1, time3 - time2)
+    finally:
+        shutil.rmtree(topdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or SIZES
+    for n in sizes:
+        run(n)